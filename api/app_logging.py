@@ -0,0 +1,192 @@
+"""
+Structured, non-blocking logging for the Study-Findr API.
+
+Handlers only put records on an in-memory queue. A background listener
+thread formats them as one JSON object per line and writes them to stdout,
+so request handlers never wait on stdout I/O. The listener starts with the
+first record each process logs, so importing this module starts no thread
+and a forked worker (gunicorn --preload) gets a listener of its own.
+
+    logger = get_logger(__name__)
+    logger.info("Review added", extra={"fields": {"location_id": location_id}})
+    logger.debug("Cache miss", extra={"sample_rate": 0.01})  # keep ~1% of these
+
+The level comes from LOG_LEVEL (default INFO). LOG_FORMAT=text switches to
+plain lines for local development.
+"""
+import os
+import sys
+import json
+import queue
+import random
+import atexit
+import logging
+import threading
+import logging.handlers
+from datetime import datetime, timezone
+
+try:
+    from flask import g, has_request_context
+except ImportError:  # googlemaps.py runs standalone without Flask
+    g = None
+
+    def has_request_context():
+        return False
+
+LOGGER_NAME = "studyfindr"
+
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+class RequestContextFilter(logging.Filter):
+    """Adds the current request's ID to each record (None outside requests)."""
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = g.get("request_id") if has_request_context() else None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a record carrying sample_rate=p with probability p."""
+
+    def filter(self, record):
+        sample_rate = getattr(record, "sample_rate", None)
+        return sample_rate is None or random.random() < sample_rate
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """Queues records for the writer thread, starting it in this process first if needed."""
+
+    def __init__(self, output):
+        super().__init__(queue.SimpleQueue())
+        self.output = output
+        self.pid = os.getpid()
+
+    def enqueue(self, record):
+        if _listener_pid != os.getpid():
+            _start_listener(self)
+        super().enqueue(record)
+
+
+def _start_listener(handler):
+    """Starts the writer thread for handler's queue in the current process."""
+    global _listener, _listener_pid
+    with _listener_lock:
+        pid = os.getpid()
+        if _listener_pid == pid:
+            return
+        if handler.pid != pid:
+            # Forked: the parent's writer thread did not come along, and what
+            # was still queued at the fork is the parent's to write
+            handler.queue = queue.SimpleQueue()
+            handler.pid = pid
+        _listener = logging.handlers.QueueListener(handler.queue, handler.output)
+        _listener.start()
+        _listener_pid = pid
+
+
+def _reset_lock_after_fork():
+    # Another thread may have held the lock at the fork
+    global _listener_lock
+    _listener_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a single-line JSON object."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Plain one-line format with the request ID and extra fields appended."""
+
+    def format(self, record):
+        line = f"{self.formatTime(record)} {record.levelname} {record.name}: {record.getMessage()}"
+        if getattr(record, "request_id", None):
+            line += f" request_id={record.request_id}"
+        for key, value in (getattr(record, "fields", None) or {}).items():
+            line += f" {key}={value}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def configure_logging(level=None, log_format=None, stream=None):
+    """
+    Routes the studyfindr loggers through a queue to a background writer.
+
+    Safe to call more than once; later calls replace the earlier setup. The
+    writer thread starts with the first record logged afterwards.
+
+    Args:
+        level (str, optional): Log level name, defaults to LOG_LEVEL or INFO
+        log_format (str, optional): "json" or "text", defaults to LOG_FORMAT or json
+        stream (file, optional): Where the listener writes, defaults to stdout
+
+    Returns:
+        logging.Logger: The studyfindr root logger
+    """
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    log_format = log_format or os.getenv("LOG_FORMAT", "json")
+
+    stop_logging()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(TextFormatter() if log_format == "text" else JsonFormatter())
+
+    queue_handler = LazyQueueHandler(output)
+    # Sampling and the request ID have to be decided on the request thread
+    queue_handler.addFilter(SamplingFilter())
+    queue_handler.addFilter(RequestContextFilter())
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.handlers = [queue_handler]
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
+
+
+def stop_logging():
+    """Flushes queued records and stops the background writer."""
+    global _listener, _listener_pid
+    with _listener_lock:
+        # A listener inherited through a fork has no thread here to stop
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+        _listener = None
+        _listener_pid = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def get_logger(name):
+    """
+    Returns a logger under the studyfindr hierarchy, configuring logging on first use.
+
+    Args:
+        name (str): Usually the calling module's __name__
+    """
+    if not logging.getLogger(LOGGER_NAME).handlers:
+        configure_logging()
+    if name == LOGGER_NAME or name.startswith(LOGGER_NAME + "."):
+        return logging.getLogger(name)
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+atexit.register(stop_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_lock_after_fork)
@@ -0,0 +1,478 @@
+"""
+Benchmarks for the Study-Findr API.
+
+Runs against the MongoDB configured in MONGO_URI (the same database the test
+suite uses) and prints one line per measurement.
+
+Usage:
+    python benchmarks.py                   # run every benchmark
+    python benchmarks.py review_authors    # run a single benchmark
+"""
+import os
+import sys
+import time
+import subprocess
+from datetime import datetime as dt
+from pymongo import monitoring
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts the MongoDB commands (round trips) sent by every client."""
+
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# The listener has to be registered before studyfindr creates its clients
+command_counter = CommandCounter()
+monitoring.register(command_counter)
+
+from studyfindr import app, mongo, places_db, cafe_cache  # noqa: E402
+from googlemaps import harvest_cafes, add_geo_point, bump_cafes_version  # noqa: E402
+from places_stub import PlacesStubServer  # noqa: E402
+from location_stats import RATING_FIELDS, rebuild_location_stats  # noqa: E402
+
+
+def measure(client, url, repeat=5):
+    """
+    Requests a URL several times through the Flask test client.
+
+    Returns:
+        tuple: (response of the last request, mean latency in ms, commands per request)
+    """
+    command_counter.count = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        response = client.get(url)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+    return response, elapsed_ms, command_counter.count / repeat
+
+
+def bench_review_authors(client):
+    """Round trips of get_location_reviews as the page size grows."""
+    location_id = "bench-review-authors"
+    page_sizes = [10, 50, 200]
+    emails = [f"bench-author-{i}@example.com" for i in range(max(page_sizes))]
+
+    mongo.db.reviews.delete_many({"location_id": location_id})
+    mongo.db.users.delete_many({"email": {"$in": emails}})
+    mongo.db.users.insert_many([
+        {"username": f"bench-author-{i}", "email": email, "profile_picture": f"/uploads/bench-{i}"}
+        for i, email in enumerate(emails)
+    ])
+    mongo.db.reviews.insert_many([
+        {
+            "user_email": email, "location_id": location_id,
+            "quietness": 3, "seating": 3, "vibes": 3, "crowdedness": 3, "internet": 3,
+            "likes": [], "dislikes": [], "created_at": dt.utcnow()
+        }
+        for email in emails
+    ])
+
+    try:
+        for sort_by in ["created_at", "likes"]:
+            for page_size in page_sizes:
+                url = f"/api/get_location_reviews?location_id={location_id}&limit={page_size}&sort_by={sort_by}"
+                response, elapsed_ms, commands = measure(client, url)
+                assert len(response.json["reviews"]) == page_size
+                print(f"review_authors sort_by={sort_by:<10} page_size={page_size:<4} "
+                      f"commands={commands:.0f} latency={elapsed_ms:.1f}ms")
+    finally:
+        mongo.db.reviews.delete_many({"location_id": location_id})
+        mongo.db.users.delete_many({"email": {"$in": emails}})
+
+
+def bench_review_pages(client):
+    """Latency of reaching deep pages of get_location_reviews by page number vs. by cursor."""
+    location_id = "bench-review-pages"
+    limit, review_count = 20, 20000
+    created_at = dt.utcnow()
+
+    mongo.db.reviews.delete_many({"location_id": location_id})
+    mongo.db.reviews.insert_many([
+        {"user_email": f"bench-pages-{i}@example.com", "location_id": location_id,
+         "likes": [], "dislikes": [], "likes_count": i % 7, "created_at": created_at}
+        for i in range(review_count)
+    ])
+
+    try:
+        base = f"/api/get_location_reviews?location_id={location_id}&limit={limit}"
+        for page in [0, 100, 999]:
+            _, elapsed_ms, commands = measure(client, f"{base}&page={page}")
+            print(f"review_pages page={page:<4} skip   commands={commands:.0f} latency={elapsed_ms:.1f}ms")
+
+        # Walk to the same depth by cursor, timing the request for each depth
+        cursor, depth = None, 0
+        while depth <= 999:
+            url = base + (f"&cursor={cursor}" if cursor else "")
+            if depth in (0, 100, 999):
+                _, elapsed_ms, commands = measure(client, url)
+                print(f"review_pages page={depth:<4} cursor commands={commands:.0f} latency={elapsed_ms:.1f}ms")
+            cursor = client.get(url).json["next_cursor"]
+            depth += 1
+    finally:
+        mongo.db.reviews.delete_many({"location_id": location_id})
+
+
+def bench_harvest(client):
+    """Wall-clock time of a five-location harvest against the local Places stub."""
+    locations = ["29.6456,-82.3519", "29.6785,-82.3572", "29.6158,-82.3747", "29.6677,-82.3365", "29.6394,-82.3066"]
+    # Scaled-down delays keep the run short while preserving their ratio to latency
+    options = {"page_token_delay": 0.5, "location_delay": 0.5, "max_requests_per_second": 10}
+
+    with PlacesStubServer(pages=3, latency=0.05) as stub:
+        for max_workers in [1, 5]:
+            start = time.perf_counter()
+            results = harvest_cafes("bench-key", locations, 1500, max_workers=max_workers,
+                                    base_url=stub.url, **options)
+            elapsed = time.perf_counter() - start
+            cafes = sum(len(cafes) for _, cafes, _ in results)
+            print(f"harvest max_workers={max_workers} cafes={cafes} wall_time={elapsed:.2f}s")
+
+
+def bench_user_bookmarks(client):
+    """Round trips and latency of get_user_bookmarks as a user's bookmarks grow."""
+    email = "bench-bookmarks@example.com"
+    mongo.db.users.delete_many({"email": email})
+    mongo.db.bookmarks.delete_many({"user_email": email})
+
+    try:
+        for count in [10, 100, 500]:
+            mongo.db.bookmarks.delete_many({"user_email": email})
+            # Half saved by ObjectId, half by place_id, like the front end does
+            result = mongo.db.bookmarks.insert_many([
+                {"name": f"Bench Spot {i}", "place_id": f"bench-place-{i}", "user_email": email,
+                 "coordinates": {"lat": 29.6 + i * 1e-4, "lng": -82.3}, "created_at": dt.utcnow()}
+                for i in range(count)
+            ])
+            bookmark_ids = [
+                str(bid) if i % 2 else f"bench-place-{i}"
+                for i, bid in enumerate(result.inserted_ids)
+            ]
+            mongo.db.users.update_one(
+                {"email": email},
+                {"$set": {"username": "bench-bookmarks", "bookmarks": bookmark_ids}},
+                upsert=True
+            )
+
+            response, elapsed_ms, commands = measure(client, f"/api/get_user_bookmarks?email={email}")
+            assert len(response.json["bookmarks"]) == count
+            print(f"user_bookmarks bookmarks={count:<4} commands={commands:.0f} latency={elapsed_ms:.1f}ms")
+    finally:
+        mongo.db.users.delete_many({"email": email})
+        mongo.db.bookmarks.delete_many({"user_email": email})
+
+
+def bench_locations_summary(client):
+    """One locations/summary request vs. one get_location_reviews request per marker."""
+    email = "bench-summary@example.com"
+    location_ids = [f"bench-summary-{i}" for i in range(100)]
+    authors = [f"bench-summary-author-{i}@example.com" for i in range(10)]
+
+    mongo.db.reviews.delete_many({"location_id": {"$in": location_ids}})
+    mongo.db.users.delete_many({"email": email})
+    mongo.db.reviews.insert_many([
+        {"user_email": author, "location_id": location_id, "likes": [], "dislikes": [], "likes_count": 0,
+         "created_at": dt.utcnow(), **{field: 3 for field in RATING_FIELDS}}
+        for location_id in location_ids for author in authors
+    ])
+    rebuild_location_stats(mongo.db)
+    mongo.db.users.insert_one({"username": "bench-summary", "email": email, "bookmarks": location_ids[::2]})
+
+    try:
+        command_counter.count = 0
+        start = time.perf_counter()
+        for location_id in location_ids:
+            client.get(f"/api/get_location_reviews?location_id={location_id}")
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"locations_summary per-marker requests={len(location_ids)} "
+              f"commands={command_counter.count} latency={elapsed_ms:.1f}ms")
+
+        command_counter.count = 0
+        start = time.perf_counter()
+        response = client.post("/api/locations/summary", json={"location_ids": location_ids, "user_email": email})
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        assert len(response.json["locations"]) == len(location_ids)
+        print(f"locations_summary batch      requests=1   commands={command_counter.count} latency={elapsed_ms:.1f}ms")
+    finally:
+        mongo.db.reviews.delete_many({"location_id": {"$in": location_ids}})
+        mongo.db.location_stats.delete_many({"_id": {"$in": location_ids}})
+        mongo.db.users.delete_many({"email": email})
+
+
+def bench_recommend(client):
+    """p50/p95 latency of /api/recommend ranking 50k places, and of the ranking alone."""
+    import numpy as np
+    from studyfindr import place_features, cafe_index
+    from spatial import SpatialIndex
+    from recommend import PlaceFeatures, DEFAULT_WEIGHTS, rank
+    from location_stats import RATING_FIELDS
+
+    rng = np.random.default_rng(0)
+    n = 50000
+    features = PlaceFeatures(
+        ids=[f"bench-{i}" for i in range(n)], place_ids=[f"bench-place-{i}" for i in range(n)],
+        names=[f"Bench Spot {i}" for i in range(n)],
+        lat=29.65 + rng.uniform(-0.5, 0.5, n), lng=-82.35 + rng.uniform(-0.5, 0.5, n),
+        rating=rng.uniform(1, 5, n), averages=rng.uniform(1, 5, (n, len(RATING_FIELDS))),
+        review_counts=rng.integers(0, 50, n)
+    )
+    weights = dict(DEFAULT_WEIGHTS, quietness=3, internet=2)
+
+    def percentiles(timings):
+        timings = sorted(timings)
+        return timings[len(timings) // 2], timings[int(len(timings) * 0.95)]
+
+    for radius in [2000, 20000]:
+        timings = []
+        for _ in range(200):
+            start = time.perf_counter()
+            rank(features, 29.65, -82.35, radius, weights, 10)
+            timings.append((time.perf_counter() - start) * 1000)
+        p50, p95 = percentiles(timings)
+        print(f"recommend rank     places={n} radius={radius:<5} p50={p50:.2f}ms p95={p95:.2f}ms")
+
+    # The endpoint with the snapshots already built, as between refreshes
+    original_build, original_index_build = place_features.build, cafe_index.build
+    place_features.build = lambda: features
+    cafe_index.build = lambda: SpatialIndex(features.place_ids, features.lat, features.lng)
+    place_features.invalidate()
+    cafe_index.invalidate()
+    try:
+        for radius in [2000, 20000]:
+            url = f"/api/recommend?lat=29.65&lng=-82.35&radius={radius}&quietness=3&internet=2"
+            client.get(url)
+            timings = []
+            for _ in range(200):
+                start = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - start) * 1000)
+            assert len(response.json["results"]) == 10
+            p50, p95 = percentiles(timings)
+            print(f"recommend endpoint places={n} radius={radius:<5} p50={p50:.2f}ms p95={p95:.2f}ms")
+    finally:
+        place_features.build, cafe_index.build = original_build, original_index_build
+        place_features.invalidate()
+        cafe_index.invalidate()
+
+
+def bench_spatial(client):
+    """SpatialIndex nearest/within vs. MongoDB $near/$geoWithin at 10k, 100k and 1M points."""
+    import numpy as np
+    from spatial import SpatialIndex, radius_bbox
+
+    sizes = [int(size) for size in os.getenv('BENCH_SPATIAL_SIZES', '10000,100000,1000000').split(',')]
+    rng = np.random.default_rng(1)
+    queries = [(29.65 + rng.uniform(-0.3, 0.3), -82.35 + rng.uniform(-0.3, 0.3)) for _ in range(100)]
+    collection = places_db.bench_spatial
+
+    def p50(run):
+        timings = []
+        for lat, lng in queries:
+            start = time.perf_counter()
+            run(lat, lng)
+            timings.append((time.perf_counter() - start) * 1000)
+        return sorted(timings)[len(timings) // 2]
+
+    for size in sizes:
+        lat = 29.65 + rng.uniform(-0.5, 0.5, size)
+        lng = -82.35 + rng.uniform(-0.5, 0.5, size)
+        keys = [f"bench-{i}" for i in range(size)]
+
+        start = time.perf_counter()
+        index = SpatialIndex(keys, lat, lng)
+        build_ms = (time.perf_counter() - start) * 1000
+        nearest_ms = p50(lambda a, b: index.nearest(a, b, k=10))
+        within_ms = p50(lambda a, b: index.within(radius_bbox(a, b, 1000)))
+        print(f"spatial index points={size:<8} build={build_ms:.0f}ms nearest(k=10) p50={nearest_ms:.3f}ms "
+              f"within(2km box) p50={within_ms:.3f}ms")
+
+        collection.drop()
+        try:
+            for i in range(0, size, 10000):
+                collection.insert_many([
+                    {"key": keys[j], "location": {"type": "Point", "coordinates": [float(lng[j]), float(lat[j])]}}
+                    for j in range(i, min(i + 10000, size))
+                ])
+            collection.create_index([("location", "2dsphere")])
+            near_ms = p50(lambda a, b: list(collection.find(
+                {"location": {"$near": {"$geometry": {"type": "Point", "coordinates": [b, a]}}}}, {"key": 1}
+            ).limit(10)))
+            box_ms = p50(lambda a, b: list(collection.find(
+                {"location": {"$geoWithin": {"$box": [list(radius_bbox(a, b, 1000)[:2]), list(radius_bbox(a, b, 1000)[2:])]}}},
+                {"key": 1}
+            )))
+            print(f"spatial mongo points={size:<8} $near(limit 10) p50={near_ms:.3f}ms $geoWithin(2km box) p50={box_ms:.3f}ms")
+        except Exception as e:
+            print(f"spatial mongo points={size:<8} skipped: {e.__class__.__name__}")
+        finally:
+            collection.drop()
+
+
+def bench_vectors(client):
+    """Size and build time of the packed study spot vector formats vs. the list of coordinate objects."""
+    import numpy as np
+    from spatial import PackedPoints
+    from studyfindr import build_vectors_body
+
+    sizes = [int(size) for size in os.getenv('BENCH_VECTOR_SIZES', '10000,100000,1000000').split(',')]
+    rng = np.random.default_rng(2)
+    for size in sizes:
+        lat = 29.65 + rng.uniform(-0.5, 0.5, size)
+        lng = -82.35 + rng.uniform(-0.5, 0.5, size)
+
+        packed = PackedPoints([f"bench-{i}" for i in range(size)], lat, lng)
+        start = time.perf_counter()
+        objects = build_vectors_body(packed, "json")
+        objects_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        binary, columnar = build_vectors_body(packed, "binary"), build_vectors_body(packed, "columnar")
+        export_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        for i in range(1000):
+            packed.upsert(f"bench-new-{i}", 29.65, -82.35)
+            packed.remove(f"bench-{i}")
+        write_us = (time.perf_counter() - start) * 1e6 / 2000
+        print(f"vectors points={size:<8} json={len(objects) / 1e6:.1f}MB in {objects_ms:.0f}ms "
+              f"binary={len(binary) / 1e6:.1f}MB columnar={len(columnar) / 1e6:.1f}MB in {export_ms:.0f}ms "
+              f"write={write_us:.2f}us")
+
+
+def bench_cafes(client):
+    """Round trips and latency of get_cafes on a cold and a warm payload cache."""
+    count = 2000
+    place_ids = [f"bench-cafe-{i}" for i in range(count)]
+    places_db.cafes.delete_many({"place_id": {"$in": place_ids}})
+    places_db.cafes.insert_many([
+        add_geo_point({"place_id": place_id, "name": f"Bench Cafe {i}", "rating": 4.2,
+                       "vicinity": "Bench Street", "business_status": "OPERATIONAL",
+                       "geometry": {"location": {"lat": 29.6 + (i % 50) * 1e-3, "lng": -82.4 + (i // 50) * 1e-3}}})
+        for i, place_id in enumerate(place_ids)
+    ])
+
+    try:
+        bump_cafes_version(places_db)
+        cafe_cache.invalidate()
+        response, elapsed_ms, commands = measure(client, "/api/get_cafes", repeat=1)
+        print(f"cafes cache=cold cafes={len(response.json['cafes'])} commands={commands:.0f} latency={elapsed_ms:.1f}ms")
+        response, elapsed_ms, commands = measure(client, "/api/get_cafes", repeat=20)
+        print(f"cafes cache=warm cafes={len(response.json['cafes'])} commands={commands:.1f} latency={elapsed_ms:.1f}ms")
+    finally:
+        places_db.cafes.delete_many({"place_id": {"$in": place_ids}})
+        bump_cafes_version(places_db)
+
+
+def bench_compression(client):
+    """Bytes on the wire and p95 latency of the large JSON endpoints, uncompressed vs. compressed."""
+    email = "bench-compression@example.com"
+    location_id = "bench-compression"
+    place_ids = [f"bench-compression-{i}" for i in range(2000)]
+    reviewers = [f"bench-compression-{i}@example.com" for i in range(100)]
+
+    places_db.cafes.delete_many({"place_id": {"$in": place_ids}})
+    places_db.cafes.insert_many([
+        add_geo_point({"place_id": place_id, "name": f"Bench Cafe {i}", "rating": 4.2,
+                       "vicinity": "Bench Street", "business_status": "OPERATIONAL",
+                       "geometry": {"location": {"lat": 29.6 + (i % 50) * 1e-3, "lng": -82.4 + (i // 50) * 1e-3}}})
+        for i, place_id in enumerate(place_ids)
+    ])
+    mongo.db.users.delete_many({"email": email})
+    mongo.db.users.insert_one({"username": "bench-compression", "email": email, "bookmarks": []})
+    mongo.db.bookmarks.delete_many({"user_email": email})
+    mongo.db.bookmarks.insert_many([
+        {"name": f"Bench Spot {i}", "place_id": f"bench-compression-spot-{i}", "user_email": email,
+         "coordinates": {"lat": 29.6 + i * 1e-4, "lng": -82.3}, "created_at": dt.utcnow()}
+        for i in range(500)
+    ])
+    mongo.db.reviews.delete_many({"location_id": location_id})
+    mongo.db.reviews.insert_many([
+        {"user_email": reviewer, "location_id": location_id, "quietness": 3, "seating": 3, "vibes": 3,
+         "crowdedness": 3, "internet": 3, "likes": [], "dislikes": [], "likes_count": 0, "dislikes_count": 0,
+         "created_at": dt.utcnow()}
+        for reviewer in reviewers
+    ])
+    bump_cafes_version(places_db)
+    cafe_cache.invalidate()
+
+    urls = {
+        "get_cafes": "/api/get_cafes",
+        "get_bookmarks": f"/api/get_bookmarks?user_email={email}",
+        "get_location_reviews": f"/api/get_location_reviews?location_id={location_id}&limit=100",
+    }
+    try:
+        for name, url in urls.items():
+            for accept_encoding in ["identity", "gzip", "br"]:
+                latencies = []
+                for _ in range(20):
+                    start = time.perf_counter()
+                    response = client.get(url, headers={"Accept-Encoding": accept_encoding})
+                    latencies.append((time.perf_counter() - start) * 1000)
+                latencies.sort()
+                p95 = latencies[int(len(latencies) * 0.95) - 1]
+                encoding = response.headers.get("Content-Encoding", "identity")
+                print(f"compression {name:<20} accept={accept_encoding:<8} sent={encoding:<8} "
+                      f"bytes={len(response.data):<7} p95={p95:.1f}ms")
+    finally:
+        places_db.cafes.delete_many({"place_id": {"$in": place_ids}})
+        bump_cafes_version(places_db)
+        mongo.db.users.delete_many({"email": email})
+        mongo.db.bookmarks.delete_many({"user_email": email})
+        mongo.db.reviews.delete_many({"location_id": location_id})
+
+
+def bench_startup(client):
+    """
+    Import time of studyfindr and time to the first served request, in fresh
+    processes: as the baseline did it, with the startup tasks run inline at
+    import, and now, with them left to the startup-tasks command.
+    """
+    script = (
+        "import time; start = time.perf_counter(); import studyfindr; {tasks}"
+        "imported = time.perf_counter(); "
+        "studyfindr.app.test_client().get('/api/get_cafes?bbox=0,0,1,1'); "
+        "print((imported - start) * 1000, (time.perf_counter() - start) * 1000)"
+    )
+    env = dict(os.environ, LOG_LEVEL="WARNING", MIGRATE_IMAGES_ON_STARTUP="0")
+    for mode, tasks in [("baseline", "studyfindr.run_startup_tasks(); "), ("current", "")]:
+        timings = []
+        for _ in range(3):
+            output = subprocess.run([sys.executable, "-c", script.format(tasks=tasks)], env=env, capture_output=True,
+                                    text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            timings.append([float(value) for value in output.stdout.split()[-2:]])
+        import_ms = sum(t[0] for t in timings) / len(timings)
+        first_request_ms = sum(t[1] for t in timings) / len(timings)
+        print(f"startup {mode:<8} import={import_ms:.0f}ms first_request={first_request_ms:.0f}ms")
+
+
+BENCHMARKS = {
+    "review_authors": bench_review_authors,
+    "review_pages": bench_review_pages,
+    "harvest": bench_harvest,
+    "user_bookmarks": bench_user_bookmarks,
+    "locations_summary": bench_locations_summary,
+    "recommend": bench_recommend,
+    "spatial": bench_spatial,
+    "vectors": bench_vectors,
+    "cafes": bench_cafes,
+    "compression": bench_compression,
+    "startup": bench_startup,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        for name in names:
+            BENCHMARKS[name](client)
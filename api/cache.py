@@ -0,0 +1,317 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe in-process cache that evicts the least recently used entry
+    once max_entries is exceeded.
+
+    Args:
+        max_entries (int): Maximum number of entries kept
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LocalBackend:
+    """
+    In-process backend for PayloadCache: an LRUCache whose entries expire.
+
+    Args:
+        max_entries (int): Maximum number of entries kept
+    """
+
+    def __init__(self, max_entries=1024):
+        self._entries = LRUCache(max_entries)
+
+    def get(self, key):
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        expires_at, entry = item
+        if time.monotonic() >= expires_at:
+            self._entries.delete(key)
+            return None
+        return entry
+
+    def set(self, key, entry, ttl):
+        self._entries.set(key, (time.monotonic() + ttl, entry))
+
+    def delete(self, key):
+        self._entries.delete(key)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class SharedBackend:
+    """
+    Backend for PayloadCache shared between processes through a Redis-style
+    client (anything with get(key) and set(key, value, ex=seconds)), so one
+    worker's cache fill serves every worker.
+
+    Args:
+        client: Redis-style client
+        prefix (str, optional): Prefix for every key written
+    """
+
+    def __init__(self, client, prefix="studyfindr:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        data = self.client.get(self.prefix + key)
+        return decode_entry(data) if data is not None else None
+
+    def set(self, key, entry, ttl):
+        self.client.set(self.prefix + key, encode_entry(entry), ex=max(1, int(ttl)))
+
+
+class InMemoryStore:
+    """Stand-in for a Redis client with the subset SharedBackend uses."""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._values.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._values[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._values[key] = (value, time.monotonic() + ex if ex else None)
+
+
+def encode_entry(entry):
+    """Packs a payload entry into bytes: a JSON header line, then the bodies."""
+    bodies = entry["bodies"]
+    header = {
+        "version": entry["version"],
+        "etag": entry["etag"],
+        "content_type": entry["content_type"],
+        "sizes": {encoding: len(body) for encoding, body in bodies.items()}
+    }
+    return json.dumps(header).encode("utf-8") + b"\n" + b"".join(bodies.values())
+
+
+def decode_entry(data):
+    """Unpacks bytes written by encode_entry."""
+    header_line, _, payload = data.partition(b"\n")
+    header = json.loads(header_line)
+    bodies = {}
+    offset = 0
+    for encoding, size in header["sizes"].items():
+        bodies[encoding] = payload[offset:offset + size]
+        offset += size
+    return {
+        "version": header["version"],
+        "etag": header["etag"],
+        "content_type": header["content_type"],
+        "bodies": bodies
+    }
+
+
+def make_backend(max_entries=1024):
+    """
+    Returns a SharedBackend on CACHE_REDIS_URL when it is set and the redis
+    package is installed, otherwise a LocalBackend.
+    """
+    redis_url = os.getenv('CACHE_REDIS_URL')
+    if redis_url:
+        try:
+            import redis
+        except ImportError:
+            return LocalBackend(max_entries)
+        return SharedBackend(redis.Redis.from_url(redis_url))
+    return LocalBackend(max_entries)
+
+
+class PayloadCache:
+    """
+    Read-through cache of serialized responses that are derived from data
+    carrying a version number.
+
+    Each entry remembers the data version it was built from and is rebuilt
+    once the version moves on or its TTL runs out. The current version is
+    read through version_source at most once per version_check_interval
+    seconds, so a hit normally costs no database work at all.
+
+    Args:
+        backend: LocalBackend or SharedBackend holding the entries
+        version_source (callable): Returns the current data version
+        ttl (float): Seconds an entry is kept
+        version_check_interval (float): Seconds a read version is trusted
+        precompress (callable, optional): Returns extra encodings of a body as
+            {encoding: bytes}, stored alongside it so they are computed once per fill
+    """
+
+    def __init__(self, backend, version_source, ttl=300, version_check_interval=30, precompress=None):
+        self.backend = backend
+        self.version_source = version_source
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        self.precompress = precompress
+        self._version = None
+        self._version_read_at = 0.0
+        self._lock = threading.Lock()
+
+    def current_version(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._version is None or now - self._version_read_at >= self.version_check_interval:
+                self._version = self.version_source()
+                self._version_read_at = now
+            return self._version
+
+    def invalidate(self):
+        """Forces the next lookup to re-read the data version."""
+        with self._lock:
+            self._version = None
+
+    def get_or_build(self, key, build, content_type="application/json"):
+        """
+        Returns the entry for key, building it with build() on a miss.
+
+        Args:
+            key (str): Cache key identifying the response
+            build (callable): Returns the response body as bytes
+            content_type (str, optional): Content type stored with the body
+
+        Returns:
+            dict: Entry with version, etag, content_type and bodies
+            ({"identity": bytes} plus any precompressed encodings)
+        """
+        version = self.current_version()
+        entry = self.backend.get(key)
+        if entry is not None and entry["version"] == version:
+            return entry
+
+        body = build()
+        bodies = {"identity": body}
+        if self.precompress is not None:
+            bodies.update(self.precompress(body))
+        entry = {
+            "version": version,
+            "etag": f"{version}-{hashlib.sha1(body).hexdigest()[:16]}",
+            "content_type": content_type,
+            "bodies": bodies
+        }
+        self.backend.set(key, entry, self.ttl)
+        return entry
+
+
+class SnapshotCache:
+    """
+    Holds one in-process object built from versioned data, such as arrays
+    precomputed from a whole collection, and rebuilds it when the version
+    moves on or it is older than max_age.
+
+    The version is read at most once per version_check_interval seconds.
+    While one thread rebuilds, the others keep using the previous snapshot;
+    only the first build makes callers wait.
+
+    Args:
+        build (callable): Returns a new snapshot
+        version_source (callable): Returns the current data version
+        max_age (float): Seconds a snapshot is used before being rebuilt anyway
+        version_check_interval (float): Seconds a read version is trusted
+    """
+
+    def __init__(self, build, version_source, max_age=60, version_check_interval=30):
+        self.build = build
+        self.version_source = version_source
+        self.max_age = max_age
+        self.version_check_interval = version_check_interval
+        self._snapshot = None
+        self._version = None
+        self._built_at = 0.0
+        self._version_read_at = 0.0
+        self._build_lock = threading.Lock()
+
+    def get(self):
+        """Returns the current snapshot, rebuilding it first if it is stale."""
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now - self._built_at < self.max_age:
+            if now - self._version_read_at < self.version_check_interval:
+                return snapshot
+            version = self.version_source()
+            self._version_read_at = now
+            if version == self._version:
+                return snapshot
+
+        # Someone else is rebuilding: serve the previous snapshot meanwhile
+        if not self._build_lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            if self._snapshot is not snapshot:
+                return self._snapshot  # Rebuilt while we waited
+            # Read the version first, so changes made during the build trigger another
+            version = self.version_source()
+            self._snapshot = self.build()
+            self._version = version
+            self._built_at = self._version_read_at = time.monotonic()
+            return self._snapshot
+        finally:
+            self._build_lock.release()
+
+    def peek(self):
+        """Returns the current snapshot without checking or building it; None before the first get()."""
+        return self._snapshot
+
+    @property
+    def version(self):
+        """The data version the current snapshot reflects; None before the first get()."""
+        return self._version
+
+    def mark_current(self, version):
+        """
+        Records that the snapshot was brought up to version in place (by
+        applying a write to it directly), so that version doesn't trigger a rebuild.
+        """
+        self._version = version
+
+    def invalidate(self):
+        """Forces the next get() to rebuild."""
+        self._built_at = float("-inf")
@@ -0,0 +1,115 @@
+"""
+Process-wide MongoDB client, created on first use.
+
+A single MongoClient, and so a single connection pool, serves both the app
+database named in MONGO_URI and places_db. Nothing connects at import time,
+and a process forked after the client was created (e.g. a pre-fork server
+worker) gets its own client on first use instead of sharing the parent's
+sockets.
+
+    from clients import mongo, get_places_db
+    mongo.db.users.find_one(...)
+    get_places_db().cafes.find(...)
+"""
+import os
+import threading
+from pymongo import MongoClient
+from gridfs import GridFS
+
+PLACES_DB_NAME = "places_db"
+
+_settings = {
+    "uri": None,
+    "max_pool_size": int(os.getenv('MONGO_MAX_POOL_SIZE', 100)),
+    "min_pool_size": int(os.getenv('MONGO_MIN_POOL_SIZE', 0)),
+}
+_event_listeners = []
+_lock = threading.Lock()
+_client = None
+_client_pid = None
+_fs = None
+
+
+def configure(uri=None, max_pool_size=None, min_pool_size=None):
+    """
+    Sets the connection settings used when the client is next created.
+
+    Args:
+        uri (str, optional): MongoDB URI, defaults to MONGO_URI
+        max_pool_size (int, optional): Connections per server, defaults to MONGO_MAX_POOL_SIZE or 100
+        min_pool_size (int, optional): Connections kept open, defaults to MONGO_MIN_POOL_SIZE or 0
+    """
+    if uri is not None:
+        _settings["uri"] = uri
+    if max_pool_size is not None:
+        _settings["max_pool_size"] = max_pool_size
+    if min_pool_size is not None:
+        _settings["min_pool_size"] = min_pool_size
+
+
+def add_event_listener(listener):
+    """Attaches a pymongo event listener to clients created from now on."""
+    if listener not in _event_listeners:
+        _event_listeners.append(listener)
+
+
+def get_client():
+    """Returns this process's MongoClient, creating it on first use."""
+    global _client, _client_pid, _fs
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _lock:
+            if _client is None or _client_pid != pid:
+                # A client inherited across fork isn't closed: its sockets belong to the parent
+                _client = MongoClient(
+                    _settings["uri"] or os.getenv('MONGO_URI'),
+                    maxPoolSize=_settings["max_pool_size"],
+                    minPoolSize=_settings["min_pool_size"],
+                    event_listeners=list(_event_listeners)
+                )
+                _client_pid = pid
+                _fs = None
+    return _client
+
+
+def get_db():
+    """Returns the app database named in the MongoDB URI."""
+    return get_client().get_default_database()
+
+
+def get_places_db():
+    """Returns the database holding the cafes collection."""
+    return get_client()[PLACES_DB_NAME]
+
+
+def get_fs():
+    """Returns GridFS on the app database."""
+    global _fs
+    client = get_client()
+    if _fs is None:
+        _fs = GridFS(client.get_default_database())
+    return _fs
+
+
+def close_client():
+    """Closes this process's client; the next call creates a new one."""
+    global _client, _client_pid, _fs
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client, _client_pid, _fs = None, None, None
+
+
+class LazyMongo:
+    """Drop-in for flask_pymongo.PyMongo's .db and .cx, backed by the shared client."""
+
+    @property
+    def cx(self):
+        return get_client()
+
+    @property
+    def db(self):
+        return get_db()
+
+
+mongo = LazyMongo()
@@ -0,0 +1,143 @@
+"""
+Negotiated gzip/Brotli compression of API responses.
+
+register_compression(app) compresses JSON and text responses of at least
+COMPRESSION_MIN_SIZE bytes with the best encoding the client accepts.
+Brotli is used when the optional brotli package is installed.
+
+Cached payloads can be compressed once when the cache is filled, with
+precompress(), and served with encoded_response(). The middleware leaves
+responses that already have a Content-Encoding alone.
+"""
+import os
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+# Responses smaller than this are sent uncompressed; the savings wouldn't cover the overhead
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/plain", "text/html", "text/css", "application/javascript"}
+
+# Levels for responses compressed on every request: fast, most of the gain
+DYNAMIC_LEVELS = {"br": 4, "gzip": 6}
+# Levels for cached payloads. Fills happen on the request path (every new
+# get_cafes viewport is a miss) and produce every encoding, so they stay
+# moderate: brotli 11 costs far more time than the few percent it saves
+PRECOMPRESS_LEVELS = {"br": 5, "gzip": 6}
+
+
+def available_encodings():
+    """Content codings this process can produce, most preferred first."""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def compress(body, encoding, level=None):
+    """
+    Compresses a response body.
+
+    Args:
+        body (bytes): Uncompressed body
+        encoding (str): "br" or "gzip"
+        level (int, optional): Compression level, defaults to DYNAMIC_LEVELS
+
+    Returns:
+        bytes: Compressed body
+    """
+    level = level if level is not None else DYNAMIC_LEVELS[encoding]
+    if encoding == "br":
+        return brotli.compress(body, quality=level)
+    # mtime=0 keeps the output, and so cached copies, byte-for-byte stable
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def precompress(body):
+    """
+    Compresses a body once in every available encoding, for storing in a cache.
+
+    Returns:
+        dict: Encoding -> compressed body; empty if body is below the size threshold
+    """
+    if len(body) < COMPRESSION_MIN_SIZE:
+        return {}
+    return {encoding: compress(body, encoding, PRECOMPRESS_LEVELS[encoding]) for encoding in available_encodings()}
+
+
+def negotiate(accept_encodings, encodings):
+    """
+    Picks the encoding to send from those on offer.
+
+    Args:
+        accept_encodings (Accept): The request's parsed Accept-Encoding header
+        encodings (iterable): Encodings the body is available in
+
+    Returns:
+        str: The chosen encoding, or None to send the body uncompressed
+    """
+    offered = [encoding for encoding in available_encodings() if encoding in encodings]
+    if not offered:
+        return None
+    return accept_encodings.best_match(offered)
+
+
+def encoded_response(response_class, bodies, accept_encodings, content_type):
+    """
+    Builds a response from a body stored in several encodings, such as a
+    precompressed cache entry.
+
+    Args:
+        response_class: The app's response class
+        bodies (dict): Encoding -> body, including "identity"
+        accept_encodings (Accept): The request's parsed Accept-Encoding header
+        content_type (str): Content type of the uncompressed body
+
+    Returns:
+        Response: The response with Content-Encoding and Vary set as needed
+    """
+    encoding = negotiate(accept_encodings, bodies)
+    response = response_class(bodies[encoding or "identity"], content_type=content_type)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if len(bodies) > 1:
+        response.vary.add("Accept-Encoding")
+    return response
+
+
+def compress_response(response, accept_encodings):
+    """Compresses a response in place when it is worth it and the client accepts it."""
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or "no-transform" in response.headers.get("Cache-Control", "")):
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESSION_MIN_SIZE:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate(accept_encodings, available_encodings())
+    if encoding is None:
+        return response
+
+    response.set_data(compress(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    # The compressed bytes differ from the original, so a strong validator no longer applies
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def register_compression(app):
+    """Compresses every eligible response the app sends."""
+
+    @app.after_request
+    def compress_after_request(response):
+        return compress_response(response, request.accept_encodings)
@@ -1,13 +1,388 @@
 import requests
 import time
 import os
+import math
+import json
+import hashlib
+import threading
+from datetime import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from requests.adapters import HTTPAdapter
+from pymongo import GEOSPHERE, ASCENDING, InsertOne, UpdateOne, ReturnDocument
+from app_logging import get_logger
+import clients
 
 # Load environment variables from .env file
 load_dotenv()
+logger = get_logger(__name__)
 
-def search_nearby_cafes(api_key, location, radius=1000, keyword=None, open_now=None, page_token=None):
+# GeoJSON point derived from geometry.location, backed by a 2dsphere index
+CAFE_GEO_FIELD = "geo_point"
+
+# Fields added by this module rather than Google, left out of the content hash
+CAFE_INTERNAL_FIELDS = {"_id", CAFE_GEO_FIELD, "content_hash", "last_seen_at", "stale", "stale_since"}
+
+# Fields Google returns differently on every call, also left out of the content hash
+CAFE_VOLATILE_OPENING_HOURS_FIELDS = {"open_now"}
+CAFE_VOLATILE_PHOTO_FIELDS = {"photo_reference"}
+
+# places_db.meta document holding the cafes data version
+CAFES_VERSION_ID = "cafes"
+
+# Number of cafe upserts sent to MongoDB per bulk_write round trip
+CAFE_BULK_BATCH_SIZE = int(os.getenv('CAFE_BULK_BATCH_SIZE', 1000))
+
+# Google Places Nearby Search endpoint (overridable to point at a local stub server)
+PLACES_NEARBY_URL = os.getenv('PLACES_NEARBY_URL', "https://maps.googleapis.com/maps/api/place/nearbysearch/json")
+
+# Google requires a short delay before a next_page_token becomes valid
+PAGE_TOKEN_DELAY = float(os.getenv('PLACES_PAGE_TOKEN_DELAY', 2))
+
+# Delay between seed locations when harvesting sequentially
+LOCATION_DELAY = 2
+
+# Concurrent harvesting: worker threads and global request rate (requests per second)
+PLACES_MAX_WORKERS = int(os.getenv('PLACES_MAX_WORKERS', 5))
+PLACES_RATE_LIMIT = float(os.getenv('PLACES_RATE_LIMIT', 10))
+
+class RateLimiter:
+    """
+    Thread-safe limiter that spaces calls at least 1 / max_per_second apart.
+    
+    Args:
+        max_per_second (float): Maximum calls per second, or 0/None for no limit
+    """
+    def __init__(self, max_per_second):
+        self.interval = 1.0 / max_per_second if max_per_second else 0
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+    
+    def wait(self):
+        """Blocks until the caller may make its next request."""
+        if not self.interval:
+            return
+        
+        # Reserve the next free slot under the lock, then sleep outside it
+        with self._lock:
+            now = time.monotonic()
+            scheduled = max(now, self._next_time)
+            self._next_time = scheduled + self.interval
+        
+        if scheduled > now:
+            time.sleep(scheduled - now)
+
+# Retry policy for Places requests: attempts after the first, exponential
+# backoff base and cap (seconds), and per-request timeout (seconds)
+PLACES_MAX_RETRIES = int(os.getenv('PLACES_MAX_RETRIES', 4))
+PLACES_BACKOFF_BASE = float(os.getenv('PLACES_BACKOFF_BASE', 1))
+PLACES_BACKOFF_MAX = 30
+PLACES_TIMEOUT = 10
+
+# Places "status" values worth retrying; INVALID_REQUEST is only retried for
+# page tokens, which Google rejects until they become valid
+RETRYABLE_PLACES_STATUSES = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+
+# Places "status" values of a search that returned everything it found
+COMPLETE_PLACES_STATUSES = {"OK", "ZERO_RESULTS"}
+
+class PlacesSession:
+    """
+    Pooled keep-alive HTTP session for Places requests with retries.
+    
+    Connection errors, 5xx responses and retryable Places statuses are retried
+    with exponential backoff. Every attempt, retries included, first waits for
+    the rate limiter, so a burst of failures can't exceed the shared request
+    rate. Latency and retry counts are recorded for every request so a harvest
+    can report them. Its get method has the signature of requests.get and can
+    be passed anywhere an http_get is accepted.
+    
+    Args:
+        max_retries (int, optional): Retries after the first attempt
+        backoff_base (float, optional): Seconds to wait before the first retry, doubled each time
+        pool_size (int, optional): Connections kept open, one per harvesting thread
+        timeout (float, optional): Seconds before a request times out
+        rate_limiter (RateLimiter, optional): Limiter shared by every thread using the session
+    """
+    def __init__(self, max_retries=PLACES_MAX_RETRIES, backoff_base=PLACES_BACKOFF_BASE,
+                 pool_size=PLACES_MAX_WORKERS, timeout=PLACES_TIMEOUT, rate_limiter=None):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        
+        self._lock = threading.Lock()
+        self._latencies = []
+        self._retries = 0
+        self._failures = 0
+    
+    def _should_retry(self, response, params):
+        if response.status_code >= 500:
+            return True
+        try:
+            status = response.json().get("status")
+        except ValueError:
+            return False
+        if status == "INVALID_REQUEST" and params and "pagetoken" in params:
+            return True
+        return status in RETRYABLE_PLACES_STATUSES
+    
+    def get(self, url, params=None):
+        """
+        Sends a GET request, retrying transient failures.
+        
+        Returns:
+            requests.Response: The last response received
+        """
+        attempt = 0
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.wait()
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+                retry = self._should_retry(response, params)
+                error = None
+            except requests.RequestException as e:
+                retry, error = True, e
+            elapsed = time.perf_counter() - start
+            
+            with self._lock:
+                self._latencies.append(elapsed)
+                if retry and attempt < self.max_retries:
+                    self._retries += 1
+                elif retry:
+                    self._failures += 1
+            
+            if not retry or attempt >= self.max_retries:
+                if error:
+                    raise error
+                return response
+            
+            time.sleep(min(self.backoff_base * 2 ** attempt, PLACES_BACKOFF_MAX))
+            attempt += 1
+    
+    def stats(self):
+        """
+        Summarizes the requests sent so far.
+        
+        Returns:
+            dict: Request, retry and failure counts and latency percentiles in milliseconds
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            retries, failures = self._retries, self._failures
+        
+        def percentile(p):
+            if not latencies:
+                return 0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+        
+        return {
+            "requests": len(latencies),
+            "retries": retries,
+            "failures": failures,
+            "latency_ms": {
+                "mean": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0,
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": percentile(1.0)
+            }
+        }
+    
+    def close(self):
+        self.session.close()
+
+# Session used by search_nearby_cafes when no http_get is given, created on first use
+_places_session = None
+_places_session_lock = threading.Lock()
+
+def get_places_session():
+    """
+    Returns the PlacesSession shared by calls that don't inject an http_get.
+    """
+    global _places_session
+    with _places_session_lock:
+        if _places_session is None:
+            _places_session = PlacesSession()
+    return _places_session
+
+# A single Nearby Search returns at most 60 places (3 pages of 20)
+MAX_RESULTS_PER_SEARCH = 60
+
+# Largest radius Nearby Search accepts, in meters
+MAX_SEARCH_RADIUS = 50000
+
+# Adaptive tiling: initial grid is TILE_GRID_SIZE x TILE_GRID_SIZE, saturated
+# tiles are split into quadrants up to MAX_TILE_DEPTH times
+TILE_GRID_SIZE = 2
+MAX_TILE_DEPTH = 6
+
+# Tiles smaller than this (meters across) are never split further
+MIN_TILE_SIZE = 100
+
+# Bounding box (west, south, east, north) covering Gainesville
+GAINESVILLE_BBOX = (-82.43, 29.59, -82.26, 29.72)
+
+EARTH_RADIUS_METERS = 6378100
+
+def haversine_meters(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance between two points in meters.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(a))
+
+def split_bbox(bbox, rows, cols):
+    """
+    Splits a bounding box into a rows x cols grid of tiles.
+    
+    Args:
+        bbox (tuple): (west, south, east, north) in degrees
+        rows (int): Number of tiles from south to north
+        cols (int): Number of tiles from west to east
+        
+    Returns:
+        list: Tile bounding boxes in the same (west, south, east, north) format
+    """
+    west, south, east, north = bbox
+    lat_step = (north - south) / rows
+    lng_step = (east - west) / cols
+    return [
+        (west + c * lng_step, south + r * lat_step, west + (c + 1) * lng_step, south + (r + 1) * lat_step)
+        for r in range(rows)
+        for c in range(cols)
+    ]
+
+def tile_search_circle(tile):
+    """
+    Returns the Nearby Search location and radius whose circle covers a tile.
+    
+    Args:
+        tile (tuple): (west, south, east, north) in degrees
+        
+    Returns:
+        tuple: ("lat,lng" center, radius in meters)
+    """
+    west, south, east, north = tile
+    center_lat = (south + north) / 2
+    center_lng = (west + east) / 2
+    # The circle has to reach the tile's corners
+    radius = haversine_meters(center_lat, center_lng, north, east)
+    return f"{center_lat:.6f},{center_lng:.6f}", min(math.ceil(radius), MAX_SEARCH_RADIUS)
+
+def get_places_db():
+    """
+    Returns places_db from the process-wide MongoClient, which the Flask app
+    shares when harvesting runs inside it.
+    
+    Returns:
+        Database: places_db, or None if MONGO_URI is not set
+    """
+    if not os.getenv('MONGO_URI'):
+        return None
+    return clients.get_places_db()
+
+def get_cafes_version(places_db):
+    """
+    Returns the cafes data version, which every save that changes the
+    collection increments. Readers cache derived data against it.
+    """
+    meta = places_db.meta.find_one({"_id": CAFES_VERSION_ID}, {"version": 1})
+    return meta["version"] if meta else 0
+
+def bump_cafes_version(places_db):
+    """Increments the cafes data version and returns the new value."""
+    meta = places_db.meta.find_one_and_update(
+        {"_id": CAFES_VERSION_ID},
+        {"$inc": {"version": 1}, "$set": {"updated_at": dt.utcnow()}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return meta["version"]
+
+# Callbacks told about every save, to update in-process data derived from the cafes
+_cafe_listeners = []
+
+def add_cafe_listener(callback):
+    """
+    Registers callback(saved_cafes, removed_place_ids, version), called after
+    each save with the cafes written, the place_ids marked stale and the new
+    cafes version.
+    """
+    if callback not in _cafe_listeners:
+        _cafe_listeners.append(callback)
+
+def notify_cafe_listeners(saved_cafes, removed_place_ids, version):
+    """Calls every cafe listener; a failing listener is logged and doesn't fail the save."""
+    for callback in list(_cafe_listeners):
+        try:
+            callback(saved_cafes, removed_place_ids, version)
+        except Exception:
+            logger.exception("Error in cafe listener")
+
+def add_geo_point(cafe):
+    """
+    Adds a GeoJSON point built from geometry.location to a cafe document.
+    
+    Args:
+        cafe (dict): Cafe dictionary from Google Places API
+        
+    Returns:
+        dict: The same cafe dictionary, with the geo point set when coordinates are present
+    """
+    location = cafe.get("geometry", {}).get("location", {})
+    if "lat" in location and "lng" in location:
+        # GeoJSON stores coordinates as [longitude, latitude]
+        cafe[CAFE_GEO_FIELD] = {
+            "type": "Point",
+            "coordinates": [location["lng"], location["lat"]]
+        }
+    return cafe
+
+def ensure_cafe_indexes(places_db):
+    """
+    Creates the unique place_id index used by upserts and the 2dsphere index
+    used by viewport queries, backfilling the geo point on cafes stored before
+    it existed. Safe to run repeatedly.
+    
+    Args:
+        places_db: pymongo Database holding the cafes collection
+        
+    Returns:
+        int: Number of cafes that were backfilled
+    """
+    cafes_collection = places_db['cafes']
+    
+    # Backfill first so the index is built over complete data
+    result = cafes_collection.update_many(
+        {
+            CAFE_GEO_FIELD: {"$exists": False},
+            "geometry.location.lat": {"$type": "number"},
+            "geometry.location.lng": {"$type": "number"}
+        },
+        [{"$set": {CAFE_GEO_FIELD: {
+            "type": "Point",
+            "coordinates": ["$geometry.location.lng", "$geometry.location.lat"]
+        }}}]
+    )
+    cafes_collection.create_index([(CAFE_GEO_FIELD, GEOSPHERE)])
+    cafes_collection.create_index(
+        [("place_id", ASCENDING)],
+        unique=True,
+        partialFilterExpression={"place_id": {"$type": "string"}}
+    )
+    return result.modified_count
+
+def search_nearby_cafes(api_key, location, radius=1000, keyword=None, open_now=None, page_token=None,
+                        http_get=None, base_url=PLACES_NEARBY_URL):
     """
     Searches for cafes within a specified radius of a given location.
     
@@ -18,11 +393,14 @@ def search_nearby_cafes(api_key, location, radius=1000, keyword=None, open_now=N
         keyword (str, optional): Additional keyword to filter results
         open_now (bool, optional): Whether to return only cafes that are open now
         page_token (str, optional): Token for the next page of results
+        http_get (callable, optional): Function with the signature of requests.get used to send the
+            request, defaults to the shared PlacesSession
+        base_url (str, optional): Nearby Search endpoint, defaults to PLACES_NEARBY_URL
     
     Returns:
         dict: Response from Google Places API containing cafe information
     """
-    base_url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+    http_get = http_get or get_places_session().get
     
     if page_token:
         params = {
@@ -43,10 +421,12 @@ def search_nearby_cafes(api_key, location, radius=1000, keyword=None, open_now=N
         if open_now is not None:
             params["open_now"] = "true" if open_now else "false"
     
-    response = requests.get(base_url, params=params)
+    response = http_get(base_url, params=params)
     return response.json()
 
-def get_all_cafes(api_key, location, radius=1500, keyword=None, open_now=None, max_results=None):
+def get_all_cafes(api_key, location, radius=1500, keyword=None, open_now=None, max_results=None,
+                  page_token_delay=PAGE_TOKEN_DELAY, rate_limiter=None, http_get=None, base_url=PLACES_NEARBY_URL,
+                  return_status=False):
     """
     Retrieves all cafes within specified radius by handling pagination.
     
@@ -57,12 +437,29 @@ def get_all_cafes(api_key, location, radius=1500, keyword=None, open_now=None, m
         keyword (str, optional): Additional keyword to filter results
         open_now (bool, optional): Whether to return only cafes that are open now
         max_results (int, optional): Maximum number of results to return
+        page_token_delay (float, optional): Seconds to wait before using a next_page_token
+        rate_limiter (RateLimiter, optional): Limiter shared with other harvesting threads
+        http_get (callable, optional): Function with the signature of requests.get used to send requests
+        base_url (str, optional): Nearby Search endpoint, defaults to PLACES_NEARBY_URL
+        return_status (bool, optional): Also return the search's final Places status
     
     Returns:
-        list: All cafe results from all pages up to max_results
+        list: All cafe results from all pages up to max_results, or with return_status a
+        (cafes, status) tuple whose status is the first page's that was not OK or
+        ZERO_RESULTS, or "OK" if every page succeeded
     """
+    def search(page_token=None):
+        if rate_limiter:
+            rate_limiter.wait()
+        return search_nearby_cafes(api_key, location, radius, keyword, open_now, page_token,
+                                   http_get=http_get, base_url=base_url)
+    
+    def page_status(response):
+        return response.get("status", "UNKNOWN_ERROR")
+    
     all_cafes = []
-    response = search_nearby_cafes(api_key, location, radius, keyword, open_now)
+    response = search()
+    status = page_status(response)
     
     # Add results from first page
     if "results" in response:
@@ -76,10 +473,13 @@ def get_all_cafes(api_key, location, radius=1500, keyword=None, open_now=None, m
             break
         
         # Google API requires a short delay before using next_page_token
-        time.sleep(2)
+        time.sleep(page_token_delay)
         
         page_token = response["next_page_token"]
-        response = search_nearby_cafes(api_key, location, radius, keyword, open_now, page_token)
+        response = search(page_token)
+        # A failed later page means the search missed places, even though it started well
+        if status in COMPLETE_PLACES_STATUSES and page_status(response) not in COMPLETE_PLACES_STATUSES:
+            status = page_status(response)
         
         if "results" in response:
             all_cafes.extend(response["results"])
@@ -88,85 +488,356 @@ def get_all_cafes(api_key, location, radius=1500, keyword=None, open_now=None, m
     if max_results and len(all_cafes) > max_results:
         all_cafes = all_cafes[:max_results]
     
+    if return_status:
+        return all_cafes, status
     return all_cafes
 
-def save_cafes_to_mongodb(cafes_data):
+def harvest_cafes(api_key, locations, radius, max_workers=1, max_requests_per_second=PLACES_RATE_LIMIT,
+                  page_token_delay=PAGE_TOKEN_DELAY, location_delay=LOCATION_DELAY,
+                  http_get=None, base_url=PLACES_NEARBY_URL):
+    """
+    Runs the paginated search for every location, in parallel when max_workers > 1.
+    
+    Each location's pages still have to be fetched in order, but the chains for
+    different locations overlap, so the page-token waits run concurrently. All
+    threads share one rate limiter. Without an http_get, requests go through a
+    PlacesSession that waits for it before every attempt, retries included;
+    an injected http_get is throttled once per request, as it retries on its own.
+    
+    Args:
+        api_key (str): Google Maps API key
+        locations (list): Latitude/longitude strings in the format "lat,lng"
+        radius (int): Search radius in meters
+        max_workers (int, optional): Number of locations searched at once; 1 searches sequentially
+        max_requests_per_second (float, optional): Global request rate across all threads
+        page_token_delay (float, optional): Seconds to wait before using a next_page_token
+        location_delay (float, optional): Seconds to wait between locations when searching sequentially
+        http_get (callable, optional): Function with the signature of requests.get used to send requests
+        base_url (str, optional): Nearby Search endpoint, defaults to PLACES_NEARBY_URL
+    
+    Returns:
+        list: (location, cafes, status) tuples in the order of locations, status being
+        the search's final Places status
+    """
+    rate_limiter = RateLimiter(max_requests_per_second)
+    places_session = None
+    if http_get is None:
+        # A session of the harvest's own throttles every attempt, retries included
+        places_session = PlacesSession(pool_size=max(max_workers, 1), rate_limiter=rate_limiter)
+        http_get, rate_limiter = places_session.get, None
+    
+    def harvest(loc):
+        logger.debug("Searching cafes", extra={"fields": {"location": loc, "radius": radius}})
+        
+        # Get cafes from Google Places API for this location
+        cafes_data, status = get_all_cafes(api_key, loc, radius, page_token_delay=page_token_delay,
+                                           rate_limiter=rate_limiter, http_get=http_get, base_url=base_url,
+                                           return_status=True)
+        if cafes_data:
+            logger.debug("Found cafes", extra={"fields": {"location": loc, "count": len(cafes_data)}})
+        if status not in COMPLETE_PLACES_STATUSES:
+            logger.warning("Cafe search failed", extra={"fields": {"location": loc, "status": status}})
+        return loc, cafes_data, status
+    
+    try:
+        if max_workers > 1 and len(locations) > 1:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(locations))) as executor:
+                return list(executor.map(harvest, locations))
+        
+        results = []
+        for i, loc in enumerate(locations):
+            # Avoid rate limits
+            if i > 0:
+                time.sleep(location_delay)
+            results.append(harvest(loc))
+        return results
+    finally:
+        if places_session:
+            places_session.close()
+
+def harvest_cafes_tiled(api_key, bbox, grid_size=TILE_GRID_SIZE, max_depth=MAX_TILE_DEPTH,
+                        min_tile_size=MIN_TILE_SIZE, max_workers=1, **harvest_options):
+    """
+    Covers a bounding box with Nearby Searches, subdividing saturated tiles.
+    
+    The box starts as a grid_size x grid_size grid. Each tile is searched with
+    the smallest circle that covers it, and any tile that hits the 60-result
+    cap is split into four quadrants and searched again, like a quadtree, until
+    no tile saturates or the depth/size limits are reached. Sparse areas are
+    therefore covered with few calls and dense areas get finer tiles.
+    
+    Args:
+        api_key (str): Google Maps API key
+        bbox (tuple): (west, south, east, north) in degrees
+        grid_size (int, optional): Tiles per side of the initial grid
+        max_depth (int, optional): Maximum number of times a tile is split
+        min_tile_size (float, optional): Tiles smaller than this many meters across are not split
+        max_workers (int, optional): Tiles searched at once within each level
+        **harvest_options: Passed to harvest_cafes (max_requests_per_second, page_token_delay,
+            location_delay, http_get, base_url)
+    
+    Returns:
+        list: (location, radius, cafes, status) tuples for every tile searched
+    """
+    results = []
+    tiles = split_bbox(bbox, grid_size, grid_size)
+    depth = 0
+    
+    while tiles:
+        # Tiles on the same level share a search radius, so harvest them together
+        circles = [tile_search_circle(tile) for tile in tiles]
+        radius = max(radius for _, radius in circles)
+        level_results = harvest_cafes(api_key, [loc for loc, _ in circles], radius,
+                                      max_workers=max_workers, **harvest_options)
+        results.extend((loc, radius, cafes_data, status) for loc, cafes_data, status in level_results)
+        
+        # Split the tiles that returned a full result set
+        next_tiles = []
+        for tile, (loc, cafes_data, _) in zip(tiles, level_results):
+            west, south, east, north = tile
+            tile_size = haversine_meters(south, west, north, east)
+            if len(cafes_data) >= MAX_RESULTS_PER_SEARCH and depth < max_depth and tile_size > min_tile_size:
+                next_tiles.extend(split_bbox(tile, 2, 2))
+        
+        logger.info("Searched tile level", extra={"fields": {
+            "depth": depth, "tiles": len(tiles), "saturated": len(next_tiles) // 4
+        }})
+        tiles = next_tiles
+        depth += 1
+    
+    return results
+
+def build_cafe_upsert(cafe):
+    """
+    Builds the bulk write operation that stores a single cafe.
+    
+    Args:
+        cafe (dict): Cafe dictionary from Google Places API
+        
+    Returns:
+        UpdateOne or InsertOne: Upsert keyed on place_id, falling back to
+        name and location, or a plain insert if the cafe can't be identified
+    """
+    add_geo_point(cafe)
+    
+    # Seeing a place again brings it back if an incremental harvest flagged it stale
+    update = {"$set": {**cafe, "stale": False}, "$unset": {"stale_since": ""}}
+    
+    # Use place_id as a unique identifier if available
+    if 'place_id' in cafe:
+        return UpdateOne({"place_id": cafe["place_id"]}, update, upsert=True)
+    
+    # No place_id, use name and location as identifier
+    if 'name' in cafe and 'geometry' in cafe and 'location' in cafe['geometry']:
+        return UpdateOne(
+            {
+                "name": cafe["name"],
+                "geometry.location.lat": cafe["geometry"]["location"]["lat"],
+                "geometry.location.lng": cafe["geometry"]["location"]["lng"]
+            },
+            update,
+            upsert=True
+        )
+    
+    # Cannot identify cafe uniquely, just insert
+    return InsertOne(cafe)
+
+def cafe_content_hash(cafe):
+    """
+    Hashes the Google-provided content of a cafe, ignoring fields added here
+    and fields Google changes on every call (opening_hours.open_now and photo
+    references).
+    
+    Args:
+        cafe (dict): Cafe dictionary from Google Places API
+        
+    Returns:
+        str: Hex digest that changes only when the place's data changes
+    """
+    content = {key: value for key, value in cafe.items() if key not in CAFE_INTERNAL_FIELDS}
+    if isinstance(content.get("opening_hours"), dict):
+        content["opening_hours"] = {key: value for key, value in content["opening_hours"].items()
+                                    if key not in CAFE_VOLATILE_OPENING_HOURS_FIELDS}
+    if isinstance(content.get("photos"), list):
+        content["photos"] = [
+            {key: value for key, value in photo.items() if key not in CAFE_VOLATILE_PHOTO_FIELDS}
+            if isinstance(photo, dict) else photo
+            for photo in content["photos"]
+        ]
+    encoded = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+def harvest_area_filter(searches):
     """
-    Saves cafe data to MongoDB.
+    Builds a filter matching the stored cafes a harvest is known to have seen
+    all of: the circles of the searches that succeeded (OK or ZERO_RESULTS)
+    and came back under the MAX_RESULTS_PER_SEARCH cap. A capped search may
+    have left places out, and a failed one returned nothing, so neither
+    circle is included.
+    
+    Args:
+        searches (list): (location, radius, cafes, status) tuples, location being
+            "lat,lng", radius the search radius in meters and status the Places status
+        
+    Returns:
+        dict: MongoDB filter on the cafe geo point, or None if no search qualified
+    """
+    circles = []
+    for loc, radius, cafes_data, status in searches:
+        if status not in COMPLETE_PLACES_STATUSES or len(cafes_data) >= MAX_RESULTS_PER_SEARCH:
+            continue
+        lat, lng = (float(value) for value in loc.split(","))
+        circles.append({CAFE_GEO_FIELD: {"$geoWithin": {
+            "$centerSphere": [[lng, lat], radius / EARTH_RADIUS_METERS]
+        }}})
+    return {"$or": circles} if circles else None
+
+def save_cafes_incremental(cafes_data, scope=None, places_db=None, batch_size=None):
+    """
+    Saves a harvest incrementally, writing only places whose content changed.
+    
+    Every place gets a content hash and a last_seen_at timestamp. Places whose
+    stored hash matches are only touched to refresh last_seen_at. Changed and
+    new places are upserted in bulk. Stored places inside scope that the
+    harvest didn't return are flagged stale instead of being left as they are.
+    
+    Args:
+        cafes_data (list): Cafe dictionaries from Google Places API, each with a place_id
+        scope (dict, optional): Filter for the area the harvest covered; stale marking is skipped without it
+        places_db (Database, optional): Database to write to, defaults to the shared places_db
+        batch_size (int, optional): Places per lookup and bulk_write, defaults to CAFE_BULK_BATCH_SIZE
+        
+    Returns:
+        tuple: (success status, message, dict of new/updated/unchanged/stale counts)
+    """
+    counts = {"new": 0, "updated": 0, "unchanged": 0, "stale": 0}
+    try:
+        if places_db is None:
+            places_db = get_places_db()
+        if places_db is None:
+            return False, "MongoDB URI not found in environment variables", counts
+        
+        cafes_collection = places_db['cafes']
+        batch_size = batch_size or CAFE_BULK_BATCH_SIZE
+        seen_at = dt.utcnow()
+        saved_cafes = []
+        stale_ids = []
+        
+        try:
+            ensure_cafe_indexes(places_db)
+        except Exception as e:
+            logger.warning("Could not create cafe indexes", extra={"fields": {"error": str(e)}})
+        
+        for i in range(0, len(cafes_data), batch_size):
+            batch = cafes_data[i:i + batch_size]
+            
+            # Fetch the stored hashes for the whole batch in one query
+            stored = cafes_collection.find(
+                {"place_id": {"$in": [cafe["place_id"] for cafe in batch]}},
+                {"_id": 0, "place_id": 1, "content_hash": 1, "stale": 1}
+            )
+            stored_by_id = {doc["place_id"]: doc for doc in stored}
+            
+            unchanged_ids = []
+            operations = []
+            for cafe in batch:
+                content_hash = cafe_content_hash(cafe)
+                existing = stored_by_id.get(cafe["place_id"])
+                
+                if existing and existing.get("content_hash") == content_hash and not existing.get("stale"):
+                    unchanged_ids.append(cafe["place_id"])
+                    continue
+                
+                counts["updated" if existing else "new"] += 1
+                add_geo_point(cafe)
+                saved_cafes.append(cafe)
+                operations.append(UpdateOne(
+                    {"place_id": cafe["place_id"]},
+                    {
+                        "$set": {**cafe, "content_hash": content_hash, "last_seen_at": seen_at, "stale": False},
+                        "$unset": {"stale_since": ""}
+                    },
+                    upsert=True
+                ))
+            
+            if operations:
+                cafes_collection.bulk_write(operations, ordered=False)
+            
+            # Unchanged places only need their last_seen_at bumped
+            if unchanged_ids:
+                cafes_collection.update_many({"place_id": {"$in": unchanged_ids}}, {"$set": {"last_seen_at": seen_at}})
+                counts["unchanged"] += len(unchanged_ids)
+        
+        # Anything in the searched area that wasn't seen in this run is stale
+        if scope is not None:
+            stale_filter = {"$and": [scope, {"last_seen_at": {"$not": {"$gte": seen_at}}}, {"stale": {"$ne": True}}]}
+            # Read the place_ids first so listeners can drop exactly these places
+            stale_ids = [doc["place_id"] for doc in cafes_collection.find(stale_filter, {"_id": 0, "place_id": 1})]
+            if stale_ids:
+                result = cafes_collection.update_many(
+                    {"$and": [stale_filter, {"place_id": {"$in": stale_ids}}]},
+                    {"$set": {"stale": True, "stale_since": seen_at}}
+                )
+                counts["stale"] = result.modified_count
+        
+        if counts["new"] or counts["updated"] or counts["stale"]:
+            version = bump_cafes_version(places_db)
+            notify_cafe_listeners(saved_cafes, stale_ids, version)
+        
+        message = (f"Successfully processed {len(cafes_data)} cafes. New: {counts['new']}, "
+                   f"Updated: {counts['updated']}, Unchanged: {counts['unchanged']}, Stale: {counts['stale']}")
+        return True, message, counts
+        
+    except Exception as e:
+        return False, f"Error saving cafes to MongoDB: {str(e)}", counts
+
+def save_cafes_to_mongodb(cafes_data, places_db=None, batch_size=None):
+    """
+    Saves cafe data to MongoDB with batched bulk upserts.
     
     Args:
         cafes_data (list): List of cafe dictionaries from Google Places API
+        places_db (Database, optional): Database to write to, defaults to the shared places_db
+        batch_size (int, optional): Operations per bulk_write, defaults to CAFE_BULK_BATCH_SIZE
         
     Returns:
         tuple: (success status, message)
     """
     try:
-        # Connect to MongoDB using URI from environment variable
-        mongo_uri = os.getenv('MONGO_URI')
-        if not mongo_uri:
+        if places_db is None:
+            places_db = get_places_db()
+        if places_db is None:
             return False, "MongoDB URI not found in environment variables"
         
-        # Connect to the database
-        client = MongoClient(mongo_uri)
-        places_db = client['places_db']
         cafes_collection = places_db['cafes']
+        batch_size = batch_size or CAFE_BULK_BATCH_SIZE
+        
+        # Upserts stay correct without the indexes, just slower, so don't fail the save
+        try:
+            ensure_cafe_indexes(places_db)
+        except Exception as e:
+            logger.warning("Could not create cafe indexes", extra={"fields": {"error": str(e)}})
+        
+        operations = [build_cafe_upsert(cafe) for cafe in cafes_data]
         
-        # Insert or update each cafe
+        # Insert or update the cafes a batch at a time
         insert_count = 0
         update_count = 0
         
-        for cafe in cafes_data:
-            # Use place_id as a unique identifier if available
-            if 'place_id' in cafe:
-                # Check if this cafe already exists
-                existing_cafe = cafes_collection.find_one({"place_id": cafe["place_id"]})
-                
-                if existing_cafe:
-                    # Update existing cafe
-                    cafes_collection.update_one(
-                        {"place_id": cafe["place_id"]},
-                        {"$set": cafe}
-                    )
-                    update_count += 1
-                else:
-                    # Insert new cafe
-                    cafes_collection.insert_one(cafe)
-                    insert_count += 1
-            else:
-                # No place_id, use name and location as identifier
-                if 'name' in cafe and 'geometry' in cafe and 'location' in cafe['geometry']:
-                    existing_cafe = cafes_collection.find_one({
-                        "name": cafe["name"],
-                        "geometry.location.lat": cafe["geometry"]["location"]["lat"],
-                        "geometry.location.lng": cafe["geometry"]["location"]["lng"]
-                    })
-                    
-                    if existing_cafe:
-                        # Update existing cafe
-                        cafes_collection.update_one(
-                            {
-                                "name": cafe["name"],
-                                "geometry.location.lat": cafe["geometry"]["location"]["lat"],
-                                "geometry.location.lng": cafe["geometry"]["location"]["lng"]
-                            },
-                            {"$set": cafe}
-                        )
-                        update_count += 1
-                    else:
-                        # Insert new cafe
-                        cafes_collection.insert_one(cafe)
-                        insert_count += 1
-                else:
-                    # Cannot identify cafe uniquely, just insert
-                    cafes_collection.insert_one(cafe)
-                    insert_count += 1
+        for i in range(0, len(operations), batch_size):
+            result = cafes_collection.bulk_write(operations[i:i + batch_size], ordered=False)
+            insert_count += result.upserted_count + result.inserted_count
+            update_count += result.matched_count
         
+        version = bump_cafes_version(places_db)
+        notify_cafe_listeners(cafes_data, [], version)
         return True, f"Successfully processed {len(cafes_data)} cafes. Inserted: {insert_count}, Updated: {update_count}"
         
     except Exception as e:
         return False, f"Error saving cafes to MongoDB: {str(e)}"
 
-def fetch_and_store_cafes(api_key, location, radius=5000):
+def fetch_and_store_cafes(api_key, location, radius=5000, concurrent=False, max_workers=None, bbox=None,
+                          incremental=False, **harvest_options):
     """
     Fetches cafes from Google Places API and stores them in MongoDB.
     
@@ -174,10 +845,29 @@ def fetch_and_store_cafes(api_key, location, radius=5000):
         api_key (str): Google Maps API key
         location (str): Latitude/longitude in the format "lat,lng" or list of such coordinates
         radius (int): Search radius in meters (max 50000, but results limited to 60 places per location)
+        concurrent (bool, optional): Search all locations in parallel instead of one after another
+        max_workers (int, optional): Threads used in concurrent mode, defaults to PLACES_MAX_WORKERS
+        bbox (tuple, optional): (west, south, east, north) to cover with adaptive tiling instead of
+            searching around location; radius is then derived from the tiles
+        incremental (bool, optional): Skip writes for unchanged places and mark places in the
+            searched area that are no longer returned as stale
+        **harvest_options: Passed to harvest_cafes (max_requests_per_second, page_token_delay,
+            location_delay, http_get, base_url), or in tiling mode also to harvest_cafes_tiled
+            (grid_size, max_depth, min_tile_size). Without http_get, requests go through a
+            PlacesSession whose stats are returned as http_stats.
         
     Returns:
         dict: Status and result of the operation
     """
+    places_session = None
+    if harvest_options.get("http_get") is None:
+        # The session throttles every attempt, retries included, so the harvest's
+        # own limiter, which only sees each search once, is turned off
+        rate_limiter = RateLimiter(harvest_options.get("max_requests_per_second", PLACES_RATE_LIMIT))
+        places_session = PlacesSession(pool_size=max_workers or PLACES_MAX_WORKERS, rate_limiter=rate_limiter)
+        harvest_options["http_get"] = places_session.get
+        harvest_options["max_requests_per_second"] = 0
+    
     try:
         total_cafes = []
         total_processed = 0
@@ -197,18 +887,31 @@ def fetch_and_store_cafes(api_key, location, radius=5000):
         else:
             locations = [location]
         
-        for loc in locations:
-            print(f"Searching cafes near {loc} with radius {radius}m")
-            
-            # Get cafes from Google Places API for this location
-            cafes_data = get_all_cafes(api_key, loc, radius)
-            if cafes_data:
-                total_cafes.extend(cafes_data)
-                print(f"Found {len(cafes_data)} cafes at location {loc}")
-            
-            # Avoid rate limits
-            if len(locations) > 1:
-                time.sleep(2)
+        if concurrent:
+            max_workers = max_workers or PLACES_MAX_WORKERS
+        else:
+            max_workers = 1
+        
+        if bbox:
+            harvest_results = harvest_cafes_tiled(api_key, bbox, max_workers=max_workers, **harvest_options)
+        else:
+            harvest_results = [
+                (loc, radius, cafes_data, status)
+                for loc, cafes_data, status in harvest_cafes(api_key, locations, radius, max_workers=max_workers,
+                                                     **harvest_options)
+            ]
+        
+        for _, _, cafes_data, _ in harvest_results:
+            total_cafes.extend(cafes_data)
+        
+        http_stats = places_session.stats() if places_session else None
+        if http_stats:
+            logger.info("Places requests finished", extra={"fields": {
+                "requests": http_stats['requests'],
+                "retries": http_stats['retries'],
+                "failures": http_stats['failures'],
+                "p95_latency_ms": http_stats['latency_ms']['p95']
+            }})
         
         # Remove duplicates based on place_id
         seen_place_ids = set()
@@ -219,12 +922,31 @@ def fetch_and_store_cafes(api_key, location, radius=5000):
                 seen_place_ids.add(cafe['place_id'])
                 unique_cafes.append(cafe)
         
-        print(f"Total unique cafes found: {len(unique_cafes)}")
+        logger.info("Harvest complete", extra={"fields": {"unique_cafes": len(unique_cafes)}})
         
         if not unique_cafes:
             return {
                 "success": False,
-                "message": "No cafes found from Google Places API"
+                "message": "No cafes found from Google Places API",
+                "http_stats": http_stats
+            }
+        
+        if incremental:
+            # A harvest with failed requests or searches may have missed places, so don't
+            # mark any stale; otherwise only the searches that returned everything in their
+            # circle count. The statuses also cover an injected http_get, which has no stats
+            complete = (not http_stats or http_stats["failures"] == 0) and all(
+                status in COMPLETE_PLACES_STATUSES for _, _, _, status in harvest_results
+            )
+            scope = harvest_area_filter(harvest_results) if complete else None
+            success, message, counts = save_cafes_incremental(unique_cafes, scope=scope)
+            
+            return {
+                "success": success,
+                "message": message,
+                "cafe_count": len(unique_cafes),
+                "http_stats": http_stats,
+                **counts
             }
         
         # Save cafes to MongoDB
@@ -233,7 +955,8 @@ def fetch_and_store_cafes(api_key, location, radius=5000):
         return {
             "success": success,
             "message": message,
-            "cafe_count": len(unique_cafes)
+            "cafe_count": len(unique_cafes),
+            "http_stats": http_stats
         }
         
     except Exception as e:
@@ -241,13 +964,17 @@ def fetch_and_store_cafes(api_key, location, radius=5000):
             "success": False,
             "message": f"Error fetching and storing cafes: {str(e)}"
         }
+    finally:
+        if places_session:
+            places_session.close()
 
 # Example usage
 if __name__ == "__main__":
     api_key = os.getenv('GOOGLE_MAPS_API_KEY')
     location = "29.6456,-82.3519"  # Gainesville, FL
     
-    result = fetch_and_store_cafes(api_key, location)
+    # Tile the whole city so dense areas aren't cut off at 60 results per search
+    result = fetch_and_store_cafes(api_key, location, bbox=GAINESVILLE_BBOX, concurrent=True, incremental=True)
     print(result["message"])
     if result["success"]:
         print(f"Total cafes processed: {result['cafe_count']}")
\ No newline at end of file
@@ -0,0 +1,157 @@
+"""
+Index bootstrap for every collection the Flask app queries.
+
+Creating the indexes is idempotent and is one of the startup tasks
+(`flask --app studyfindr startup-tasks`, or `python studyfindr.py` in
+development). It can also be run by hand, optionally followed by a check that explains each endpoint's
+query shape and fails if any of them would scan a whole collection:
+
+    python indexes.py           # create missing indexes
+    python indexes.py --check   # create them, then fail on any COLLSCAN
+"""
+import sys
+import argparse
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import PyMongoError
+from googlemaps import ensure_cafe_indexes
+
+# Indexes on the app database, by collection
+APP_INDEXES = {
+    "users": [
+        # Registration and login assume one account per email
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "reviews": [
+        # add_review upserts one review per user and location; also serves get_user_reviews
+        IndexModel([("user_email", ASCENDING), ("location_id", ASCENDING)], unique=True),
+        # get_location_reviews pages on (sort key, _id)
+        IndexModel([("location_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("location_id", ASCENDING), ("likes_count", DESCENDING), ("_id", DESCENDING)]),
+    ],
+    "bookmarks": [
+        # add_bookmark treats place_id, and otherwise name and coordinates, as the bookmark's identity
+        IndexModel([("place_id", ASCENDING)], unique=True,
+                   partialFilterExpression={"place_id": {"$type": "string"}}),
+        IndexModel([("name", ASCENDING), ("coordinates.lat", ASCENDING), ("coordinates.lng", ASCENDING)]),
+        IndexModel([("user_email", ASCENDING)]),
+    ],
+    "fs.files": [
+        # Thumbnail variants of an upload
+        IndexModel([("metadata.variant_of", ASCENDING), ("metadata.size", ASCENDING)]),
+    ],
+}
+
+
+def ensure_indexes(db, places_db):
+    """
+    Creates every index the app relies on. Safe to run repeatedly.
+
+    An index that can't be built (for example a unique index over existing
+    duplicates) is reported instead of stopping the others.
+
+    Args:
+        db (Database): The app database (users, reviews, bookmarks, GridFS)
+        places_db (Database): Database holding the cafes collection
+
+    Returns:
+        dict: Collection name -> list of index names created or confirmed, and
+        "errors" -> list of messages for indexes that failed
+    """
+    results = {"errors": []}
+
+    for collection_name, indexes in APP_INDEXES.items():
+        results[collection_name] = []
+        for index in indexes:
+            try:
+                results[collection_name].extend(db[collection_name].create_indexes([index]))
+            except PyMongoError as e:
+                results["errors"].append(f"{collection_name}.{index.document['name']}: {str(e)}")
+
+    try:
+        ensure_cafe_indexes(places_db)
+        results["cafes"] = [name for name in places_db.cafes.index_information() if name != "_id_"]
+    except PyMongoError as e:
+        results["errors"].append(f"cafes: {str(e)}")
+
+    return results
+
+
+def query_shapes(db, places_db):
+    """
+    Returns the query each endpoint sends, as (name, cursor) pairs to explain.
+
+    Values are placeholders; only the shape of each filter and sort matters.
+    """
+    reviews = db.reviews
+    bookmarks = db.bookmarks
+    return [
+        ("login / register / get_user", db.users.find({"email": "check@example.com"})),
+        ("add_review / get_review", reviews.find({"user_email": "check@example.com", "location_id": "check"})),
+        ("get_user_reviews", reviews.find({"user_email": "check@example.com"})),
+        ("get_location_reviews",
+         reviews.find({"location_id": "check"}).sort([("created_at", DESCENDING), ("_id", DESCENDING)])),
+        ("get_location_reviews sort_by=likes",
+         reviews.find({"location_id": "check"}).sort([("likes_count", DESCENDING), ("_id", DESCENDING)])),
+        ("add_bookmark by place_id", bookmarks.find({"place_id": "check"})),
+        ("add_bookmark by coordinates",
+         bookmarks.find({"name": "check", "coordinates.lat": 29.6, "coordinates.lng": -82.3})),
+        ("get_bookmarks", bookmarks.find({"user_email": "check@example.com"})),
+        ("uploads thumbnail", db["fs.files"].find({"metadata.variant_of": "check", "metadata.size": 64})),
+        ("get_cafes viewport", places_db.cafes.find({"stale": {"$ne": True}, "place_id": {"$in": ["check"]}})),
+        ("save_cafes_to_mongodb", places_db.cafes.find({"place_id": "check"})),
+    ]
+
+
+def _plan_stages(plan):
+    """Yields every stage name in an explain plan, however deeply nested."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _plan_stages(value)
+
+
+def check_query_plans(db, places_db):
+    """
+    Explains every endpoint query shape and lists the ones that scan a collection.
+
+    Returns:
+        list: Names of the query shapes whose winning plan contains a COLLSCAN
+    """
+    collscans = []
+    for name, cursor in query_shapes(db, places_db):
+        winning_plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        if "COLLSCAN" in _plan_stages(winning_plan):
+            collscans.append(name)
+    return collscans
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the Study-Findr MongoDB indexes")
+    parser.add_argument("--check", action="store_true",
+                        help="explain every endpoint query afterwards and fail on a COLLSCAN")
+    args = parser.parse_args()
+
+    from studyfindr import mongo, places_db
+
+    results = ensure_indexes(mongo.db, places_db)
+    for collection_name, names in results.items():
+        if collection_name != "errors":
+            print(f"{collection_name}: {', '.join(names)}")
+    for error in results["errors"]:
+        print(f"Error: {error}")
+
+    exit_code = 1 if results["errors"] else 0
+    if args.check:
+        collscans = check_query_plans(mongo.db, places_db)
+        for name in collscans:
+            print(f"COLLSCAN: {name}")
+        if collscans:
+            exit_code = 1
+        else:
+            print("All endpoint queries use an index")
+
+    sys.exit(exit_code)
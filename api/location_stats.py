@@ -0,0 +1,206 @@
+"""
+Per-location review statistics, kept up to date as reviews are written.
+
+The location_stats collection holds one document per location_id:
+
+    {"_id": location_id, "review_count": 3,
+     "sums": {"quietness": 11, ...}, "counts": {"quietness": 3, ...}}
+
+add_review applies each new or edited review as a $inc of the difference,
+so reading the averages for any number of locations is a single _id lookup
+rather than a scan of their reviews. rebuild_location_stats recomputes the
+collection from the reviews; the startup tasks run it once to cover reviews
+written before the statistics were maintained.
+"""
+import os
+import socket
+from datetime import datetime as dt
+from pymongo import UpdateOne
+from app_logging import get_logger
+from migrations import claim_migration
+
+logger = get_logger(__name__)
+
+# The numeric scores every review carries
+RATING_FIELDS = ["quietness", "seating", "vibes", "crowdedness", "internet"]
+
+LOCATION_STATS_MIGRATION = "location_stats"
+
+
+def _score(review, field):
+    """Returns a review's score for field, or None if it has no numeric score."""
+    value = (review or {}).get(field)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return value
+
+
+def apply_review_change(db, location_id, new_review=None, old_review=None):
+    """
+    Adjusts a location's running sums and counts for one review write.
+
+    Pass new_review alone for a new review, both for an edited review (the old
+    scores are subtracted and the new ones added), and old_review alone for a
+    deleted review.
+
+    Args:
+        db (Database): The app database
+        location_id: The reviewed location
+        new_review (dict, optional): The review's scores after the write
+        old_review (dict, optional): The review's scores before the write
+    """
+    inc = {"review_count": (new_review is not None) - (old_review is not None)}
+    for field in RATING_FIELDS:
+        new, old = _score(new_review, field), _score(old_review, field)
+        inc[f"sums.{field}"] = (new or 0) - (old or 0)
+        inc[f"counts.{field}"] = (new is not None) - (old is not None)
+
+    db.location_stats.update_one(
+        {"_id": location_id},
+        {"$inc": inc, "$set": {"updated_at": dt.utcnow()}},
+        upsert=True
+    )
+
+
+def summarize(stats):
+    """
+    Turns a location_stats document into the review count and per-field averages.
+
+    Returns:
+        dict: {"review_count": n, "averages": {field: average or None}}
+    """
+    stats = stats or {}
+    sums, counts = stats.get("sums", {}), stats.get("counts", {})
+    averages = {}
+    for field in RATING_FIELDS:
+        count = counts.get(field, 0)
+        averages[field] = round(sums.get(field, 0) / count, 2) if count > 0 else None
+    return {"review_count": stats.get("review_count", 0), "averages": averages}
+
+
+def get_location_stats(db, location_ids):
+    """
+    Reads the statistics of many locations with one query.
+
+    Returns:
+        dict: location_id -> summarize() result, for every requested location
+    """
+    found = db.location_stats.find({"_id": {"$in": list(location_ids)}}).batch_size(len(location_ids) or 1)
+    stats_by_id = {stats["_id"]: stats for stats in found}
+    return {location_id: summarize(stats_by_id.get(location_id)) for location_id in location_ids}
+
+
+def rebuild_location_stats(db):
+    """
+    Recomputes every location's statistics from its reviews with one aggregation.
+
+    Returns:
+        int: Number of locations written
+    """
+    group = {"_id": "$location_id", "review_count": {"$sum": 1}}
+    for field in RATING_FIELDS:
+        group[f"sum_{field}"] = {"$sum": f"${field}"}
+        group[f"count_{field}"] = {"$sum": {"$cond": [{"$isNumber": f"${field}"}, 1, 0]}}
+
+    now = dt.utcnow()
+    writes = [
+        UpdateOne({"_id": row["_id"]}, {"$set": {
+            "review_count": row["review_count"],
+            "sums": {field: row[f"sum_{field}"] for field in RATING_FIELDS},
+            "counts": {field: row[f"count_{field}"] for field in RATING_FIELDS},
+            "updated_at": now
+        }}, upsert=True)
+        for row in db.reviews.aggregate([{"$group": group}])
+    ]
+    if writes:
+        db.location_stats.bulk_write(writes, ordered=False)
+    return len(writes)
+
+
+def backfill_location_stats(db, owner=None):
+    """
+    Builds location_stats from the existing reviews, once.
+
+    Claimed like any other migration so that only one worker rebuilds; later
+    starts cost a single lookup. A review written while the rebuild runs can
+    be counted twice or not at all; run rebuild_location_stats again to fix.
+
+    Args:
+        db (Database): The app database
+        owner (str, optional): Name recorded on the claim, defaults to host:pid
+
+    Returns:
+        int: Number of locations written, or None if there was nothing to do
+    """
+    owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+    if claim_migration(db, LOCATION_STATS_MIGRATION, owner) is None:
+        return None
+
+    written = rebuild_location_stats(db)
+    db.migrations.update_one(
+        {"_id": LOCATION_STATS_MIGRATION, "owner": owner},
+        {"$set": {"completed_at": dt.utcnow(), "lease_expires_at": None, "processed": written}}
+    )
+    logger.info("Location stats rebuilt", extra={"fields": {"locations": written}})
+    return written
+
+
+def summarize_locations(db, location_ids, user_email=None):
+    """
+    Builds the review stats of many locations and, for a signed-in user,
+    whether they bookmarked and reviewed each one, in one round trip.
+
+    With a user, a single aggregation on their user document looks up the
+    locations' stats, their reviews of those locations and the bookmarks
+    saved for them, each by an indexed $in. Without one, only the stats are
+    read.
+
+    Args:
+        db (Database): The app database
+        location_ids (list): Locations to summarize, as reviews store them
+        user_email (str, optional): The requesting user
+
+    Returns:
+        dict: location_id -> {"review_count", "averages", "bookmarked",
+        "reviewed"}, or None if user_email names no user
+    """
+    location_ids = list(location_ids)
+    if not user_email:
+        summaries = get_location_stats(db, location_ids)
+        for summary in summaries.values():
+            summary.update(bookmarked=False, reviewed=False)
+        return summaries
+
+    found = list(db.users.aggregate([
+        {"$match": {"email": user_email}},
+        {"$limit": 1},
+        {"$lookup": {"from": "location_stats", "as": "stats", "pipeline": [
+            {"$match": {"_id": {"$in": location_ids}}}
+        ]}},
+        {"$lookup": {"from": "reviews", "as": "reviews", "pipeline": [
+            {"$match": {"user_email": user_email, "location_id": {"$in": location_ids}}},
+            {"$project": {"_id": 0, "location_id": 1}}
+        ]}},
+        {"$lookup": {"from": "bookmarks", "as": "place_bookmarks", "pipeline": [
+            {"$match": {"place_id": {"$in": location_ids}}},
+            {"$project": {"_id": 1, "place_id": 1}}
+        ]}},
+        {"$project": {"_id": 0, "bookmarks": 1, "stats": 1, "reviews": 1, "place_bookmarks": 1}}
+    ]))
+    if not found:
+        return None
+    user = found[0]
+
+    stats_by_id = {stats["_id"]: stats for stats in user["stats"]}
+    reviewed = {review["location_id"] for review in user["reviews"]}
+    # A user's bookmarks list holds bookmark _ids and place_ids
+    saved = {str(bookmark_id) for bookmark_id in user.get("bookmarks", []) if bookmark_id}
+    bookmarked = {bookmark["place_id"] for bookmark in user["place_bookmarks"] if str(bookmark["_id"]) in saved}
+
+    summaries = {}
+    for location_id in location_ids:
+        summary = summarize(stats_by_id.get(location_id))
+        summary["bookmarked"] = location_id in bookmarked or str(location_id) in saved
+        summary["reviewed"] = location_id in reviewed
+        summaries[location_id] = summary
+    return summaries
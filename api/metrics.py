@@ -0,0 +1,213 @@
+"""
+Per-route request latency and MongoDB command metrics.
+
+The Flask app records every request into a MetricsRegistry, and a
+RequestCommandListener attached to the MongoClient attributes each MongoDB
+command to the request that sent it. GET /metrics renders the registry in
+the Prometheus text exposition format:
+
+    studyfindr_request_duration_seconds_bucket{method="GET",route="/api/get_cafes",le="0.05"} 12
+    studyfindr_request_mongo_commands_bucket{method="GET",route="/api/get_cafes",le="1"} 12
+    studyfindr_mongo_commands_total{command="find"} 40
+"""
+import threading
+from pymongo import monitoring
+
+# Request latency bucket bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Bucket bounds for the number of MongoDB commands one request sends
+COMMAND_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the shape Prometheus expects."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def render(self, name, labels):
+        lines = []
+        for bound, count in zip(self.buckets, self.counts):
+            lines.append(f"{name}_bucket{_labels(labels, le=_number(bound))} {count}")
+        lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {self.count}')
+        lines.append(f"{name}_sum{_labels(labels)} {_number(self.sum)}")
+        lines.append(f"{name}_count{_labels(labels)} {self.count}")
+        return lines
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(labels, **extra):
+    pairs = list(labels.items()) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store of request and MongoDB command metrics.
+
+    Routes are recorded by their URL rule (e.g. /api/reviews/<location_id>),
+    not the concrete path, so the number of series stays bounded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._request_latency = {}
+            self._request_commands = {}
+            self._requests = {}
+            self._commands = {}
+            self._command_seconds = {}
+            self._command_failures = {}
+
+    def observe_request(self, method, route, status, duration, commands=0):
+        """
+        Records one handled request.
+
+        Args:
+            method (str): HTTP method
+            route (str): URL rule that matched the request
+            status (int): Response status code
+            duration (float): Handling time in seconds
+            commands (int, optional): MongoDB commands the request sent
+        """
+        key = (method, route)
+        with self._lock:
+            if key not in self._request_latency:
+                self._request_latency[key] = Histogram(LATENCY_BUCKETS)
+                self._request_commands[key] = Histogram(COMMAND_COUNT_BUCKETS)
+            self._request_latency[key].observe(duration)
+            self._request_commands[key].observe(commands)
+            status_key = (method, route, str(status))
+            self._requests[status_key] = self._requests.get(status_key, 0) + 1
+
+    def observe_command(self, command_name, duration, failed=False):
+        """Records one MongoDB command and its round-trip time in seconds."""
+        with self._lock:
+            self._commands[command_name] = self._commands.get(command_name, 0) + 1
+            self._command_seconds[command_name] = self._command_seconds.get(command_name, 0.0) + duration
+            if failed:
+                self._command_failures[command_name] = self._command_failures.get(command_name, 0) + 1
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                "# HELP studyfindr_requests_total Requests handled, by route and status.",
+                "# TYPE studyfindr_requests_total counter",
+            ]
+            for (method, route, status), count in sorted(self._requests.items()):
+                labels = {"method": method, "route": route, "status": status}
+                lines.append(f"studyfindr_requests_total{_labels(labels)} {count}")
+
+            lines += [
+                "# HELP studyfindr_request_duration_seconds Request handling time, by route.",
+                "# TYPE studyfindr_request_duration_seconds histogram",
+            ]
+            for (method, route), histogram in sorted(self._request_latency.items()):
+                lines += histogram.render("studyfindr_request_duration_seconds",
+                                          {"method": method, "route": route})
+
+            lines += [
+                "# HELP studyfindr_request_mongo_commands MongoDB commands sent per request, by route.",
+                "# TYPE studyfindr_request_mongo_commands histogram",
+            ]
+            for (method, route), histogram in sorted(self._request_commands.items()):
+                lines += histogram.render("studyfindr_request_mongo_commands",
+                                          {"method": method, "route": route})
+
+            lines += [
+                "# HELP studyfindr_mongo_commands_total MongoDB commands sent, by command name.",
+                "# TYPE studyfindr_mongo_commands_total counter",
+            ]
+            for name, count in sorted(self._commands.items()):
+                lines.append(f"studyfindr_mongo_commands_total{_labels({'command': name})} {count}")
+
+            lines += [
+                "# HELP studyfindr_mongo_command_seconds_total Time spent in MongoDB commands, by command name.",
+                "# TYPE studyfindr_mongo_command_seconds_total counter",
+            ]
+            for name, seconds in sorted(self._command_seconds.items()):
+                lines.append(f"studyfindr_mongo_command_seconds_total{_labels({'command': name})} {_number(seconds)}")
+
+            lines += [
+                "# HELP studyfindr_mongo_command_failures_total Failed MongoDB commands, by command name.",
+                "# TYPE studyfindr_mongo_command_failures_total counter",
+            ]
+            for name, count in sorted(self._command_failures.items()):
+                lines.append(f"studyfindr_mongo_command_failures_total{_labels({'command': name})} {count}")
+
+        return "\n".join(lines) + "\n"
+
+
+class RequestCommandListener(monitoring.CommandListener):
+    """
+    Records every MongoDB command into a registry and, between start_request()
+    and finish_request() on the same thread, into that request's breakdown.
+
+    PyMongo publishes command events on the thread that sent the command, so
+    a thread-local breakdown belongs to the request that thread is serving.
+
+    Args:
+        registry (MetricsRegistry): Where command totals are recorded
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._local = threading.local()
+
+    def start_request(self):
+        self._local.commands = {}
+
+    def finish_request(self):
+        """
+        Stops attributing commands to the current request.
+
+        Returns:
+            dict: Command name -> {"count": int, "ms": float} for the request
+        """
+        commands = getattr(self._local, "commands", None) or {}
+        self._local.commands = None
+        return commands
+
+    def _record(self, event, failed):
+        duration = event.duration_micros / 1e6
+        self.registry.observe_command(event.command_name, duration, failed)
+        commands = getattr(self._local, "commands", None)
+        if commands is not None:
+            entry = commands.setdefault(event.command_name, {"count": 0, "ms": 0.0})
+            entry["count"] += 1
+            entry["ms"] += duration * 1000
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event, failed=False)
+
+    def failed(self, event):
+        self._record(event, failed=True)
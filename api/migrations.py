@@ -0,0 +1,189 @@
+"""
+One-off data migrations that run outside the request path.
+
+Each migration records its progress in the migrations collection, keyed by
+name. Once a migration has finished, checking it costs a single find_one,
+however many users there are. The startup tasks (`flask --app studyfindr
+startup-tasks`, or `python studyfindr.py` in development) run an unfinished
+migration in a background thread, resuming after the last checkpointed _id.
+A claim with a lease keeps two concurrent runs from migrating the same users.
+
+It can also be run in the foreground:
+
+    python migrations.py
+"""
+import os
+import socket
+import threading
+from datetime import datetime as dt, timedelta
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+IMAGE_MIGRATION = "profile_pictures_to_gridfs"
+
+# Users migrated per batch; progress is checkpointed after every batch
+MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', 100))
+
+# How long a claim on a migration lasts without a checkpoint before another
+# worker may take it over (e.g. after the claiming worker died)
+MIGRATION_LEASE_SECONDS = int(os.getenv('MIGRATION_LEASE_SECONDS', 300))
+
+CONTENT_TYPES = {".png": "image/png", ".gif": "image/gif"}
+
+
+def is_migration_complete(db, name):
+    """Returns True once the named migration has finished."""
+    return db.migrations.find_one({"_id": name, "completed_at": {"$ne": None}}, {"_id": 1}) is not None
+
+
+def claim_migration(db, name, owner):
+    """
+    Claims an unfinished migration whose lease is free or has expired.
+
+    Returns:
+        dict: The migration's progress document, or None if it is finished
+        or another worker holds the lease
+    """
+    now = dt.utcnow()
+    try:
+        return db.migrations.find_one_and_update(
+            {
+                "_id": name,
+                "completed_at": None,
+                "$or": [{"lease_expires_at": None}, {"lease_expires_at": {"$lt": now}}]
+            },
+            {
+                "$set": {"owner": owner, "lease_expires_at": now + timedelta(seconds=MIGRATION_LEASE_SECONDS)},
+                "$setOnInsert": {"started_at": now, "last_id": None, "processed": 0, "migrated": 0}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # The document exists but didn't match: finished or leased elsewhere
+        return None
+
+
+def migrate_existing_images(db, fs, upload_folder, batch_size=None, owner=None):
+    """
+    Moves profile pictures stored under upload_folder into GridFS.
+
+    Users are processed in _id order, batch_size at a time. After each batch
+    the last _id is saved, so an interrupted run resumes where it stopped.
+    Does nothing if the migration already finished or another worker is
+    running it.
+
+    Args:
+        db (Database): The app database
+        fs (GridFS): GridFS the pictures are moved into
+        upload_folder (str): Directory the old uploads were saved in
+        batch_size (int, optional): Users per batch, defaults to MIGRATION_BATCH_SIZE
+        owner (str, optional): Name recorded on the claim, defaults to host:pid
+
+    Returns:
+        int: Number of pictures migrated by this run
+    """
+    batch_size = batch_size or MIGRATION_BATCH_SIZE
+    owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+
+    progress = claim_migration(db, IMAGE_MIGRATION, owner)
+    if progress is None:
+        return 0
+
+    logger.info("Starting migration of existing images to GridFS",
+                extra={"fields": {"resume_after": progress["last_id"]}})
+    last_id = progress["last_id"]
+    count = 0
+
+    while True:
+        query = {"profile_picture": {"$regex": "^/uploads/"}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        users = list(
+            db.users.find(query, {"profile_picture": 1, "username": 1, "email": 1})
+            .sort("_id", ASCENDING)
+            .limit(batch_size)
+        )
+        if not users:
+            break
+
+        migrated = 0
+        for user in users:
+            # Pictures already in GridFS are served by id and have no file on disk
+            filename = user["profile_picture"].replace("/uploads/", "")
+            file_path = os.path.join(upload_folder, filename)
+            if not os.path.exists(file_path):
+                continue
+
+            try:
+                with open(file_path, 'rb') as f:
+                    file_data = f.read()
+
+                content_type = CONTENT_TYPES.get(os.path.splitext(filename)[1].lower(), "image/jpeg")
+                file_id = fs.put(file_data, filename=filename, content_type=content_type)
+                db.users.update_one(
+                    {"_id": user["_id"]},
+                    {"$set": {"profile_picture": f"/uploads/{str(file_id)}"}}
+                )
+                migrated += 1
+                logger.debug("Migrated image", extra={"fields": {"user": user.get('username', user.get('email'))}})
+            except Exception:
+                logger.exception("Error migrating file", extra={"fields": {"filename": filename}})
+
+        last_id = users[-1]["_id"]
+        count += migrated
+        # Checkpoint and extend the lease together
+        db.migrations.update_one(
+            {"_id": IMAGE_MIGRATION},
+            {
+                "$set": {
+                    "last_id": last_id,
+                    "lease_expires_at": dt.utcnow() + timedelta(seconds=MIGRATION_LEASE_SECONDS)
+                },
+                "$inc": {"processed": len(users), "migrated": migrated}
+            }
+        )
+
+    db.migrations.update_one(
+        {"_id": IMAGE_MIGRATION},
+        {"$set": {"completed_at": dt.utcnow(), "lease_expires_at": None}}
+    )
+    logger.info("Migration complete", extra={"fields": {"migrated": count}})
+    return count
+
+
+def start_image_migration(db, fs, upload_folder):
+    """
+    Runs the image migration in a background thread unless it already finished.
+
+    Returns:
+        threading.Thread: The started thread, or None if there was nothing to do
+    """
+    if is_migration_complete(db, IMAGE_MIGRATION):
+        return None
+
+    def run():
+        try:
+            migrate_existing_images(db, fs, upload_folder)
+        except Exception:
+            logger.exception("Migration error")
+
+    thread = threading.Thread(target=run, name="image-migration", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    from studyfindr import mongo, fs, UPLOAD_FOLDER
+
+    if is_migration_complete(mongo.db, IMAGE_MIGRATION):
+        print("Image migration already complete")
+    else:
+        migrated = migrate_existing_images(mongo.db, fs, UPLOAD_FOLDER)
+        if is_migration_complete(mongo.db, IMAGE_MIGRATION):
+            print(f"Image migration complete, migrated {migrated} images")
+        else:
+            print("Image migration is being run by another worker")
@@ -0,0 +1,166 @@
+"""
+Local stand-in for the Google Places Nearby Search API.
+
+Serves deterministic, paginated cafe results so harvesting can be tested and
+benchmarked without an API key or network access:
+
+    with PlacesStubServer(pages=3, results_per_page=20) as stub:
+        fetch_and_store_cafes("key", locations, base_url=stub.url, ...)
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from googlemaps import haversine_meters, MAX_RESULTS_PER_SEARCH
+
+
+class PlacesStubServer:
+    """
+    Threaded HTTP server answering Nearby Search requests.
+
+    By default every location gets `pages` pages of `results_per_page` cafes,
+    chained with next_page_token. Each place_id is derived from the location,
+    page and index, so repeated harvests of the same location return the same
+    places.
+
+    When `places` is given, the stub instead behaves like a real map: a search
+    returns the places within `radius` of `location`, nearest first, capped at
+    60 results in pages of 20.
+
+    Args:
+        pages (int): Pages returned per location
+        results_per_page (int): Cafes per page (Google returns at most 20)
+        latency (float): Seconds each response is delayed, to mimic the network
+        places (list, optional): Place dictionaries with geometry.location to search over
+        errors (list, optional): Failures returned, in order, before any normal response;
+            an int is sent as an HTTP status code, a string as the Places "status" field
+    """
+
+    def __init__(self, pages=3, results_per_page=20, latency=0.0, places=None, errors=None):
+        self.pages = pages
+        self.results_per_page = results_per_page
+        self.latency = latency
+        self.places = places
+        self.errors = list(errors or [])
+        self.request_count = 0
+        self.connection_count = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/maps/api/place/nearbysearch/json"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def respond(self, params):
+        """Builds the JSON body for one request's query parameters."""
+        if self.places is not None:
+            return self._respond_from_places(params)
+
+        if "pagetoken" in params:
+            location, page = params["pagetoken"].rsplit("|", 1)
+            page = int(page)
+        elif "location" in params:
+            location, page = params["location"], 0
+        else:
+            return {"status": "INVALID_REQUEST", "results": []}
+
+        lat, lng = (float(value) for value in location.split(","))
+        results = [
+            {
+                "place_id": f"stub-{location}-{page}-{i}",
+                "name": f"Stub Cafe {page}-{i}",
+                "geometry": {"location": {"lat": lat + i * 1e-4, "lng": lng + page * 1e-4}},
+                "rating": 4.0,
+                "vicinity": "Stub Street",
+                "business_status": "OPERATIONAL"
+            }
+            for i in range(self.results_per_page)
+        ]
+
+        body = {"status": "OK", "results": results}
+        if page + 1 < self.pages:
+            body["next_page_token"] = f"{location}|{page + 1}"
+        return body
+
+    def _respond_from_places(self, params):
+        if "pagetoken" in params:
+            location, radius, page = params["pagetoken"].rsplit("|", 2)
+            page = int(page)
+        elif "location" in params:
+            location, radius, page = params["location"], params["radius"], 0
+        else:
+            return {"status": "INVALID_REQUEST", "results": []}
+
+        lat, lng = (float(value) for value in location.split(","))
+        distances = []
+        for place in self.places:
+            place_location = place["geometry"]["location"]
+            distance = haversine_meters(lat, lng, place_location["lat"], place_location["lng"])
+            if distance <= float(radius):
+                distances.append((distance, place))
+        distances.sort(key=lambda item: item[0])
+        matches = [place for _, place in distances[:MAX_RESULTS_PER_SEARCH]]
+
+        page_size = 20
+        body = {"status": "OK", "results": matches[page * page_size:(page + 1) * page_size]}
+        if (page + 1) * page_size < len(matches):
+            body["next_page_token"] = f"{location}|{radius}|{page + 1}"
+        return body
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep connections open so clients can reuse them
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connection_count += 1
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                params = {key: values[0] for key, values in query.items()}
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                with stub._lock:
+                    stub.request_count += 1
+                    error = stub.errors.pop(0) if stub.errors else None
+                if isinstance(error, int):
+                    body, status_code = {"status": "UNKNOWN_ERROR", "results": []}, error
+                elif error:
+                    body, status_code = {"status": error, "results": []}, 200
+                else:
+                    body, status_code = stub.respond(params), 200
+
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
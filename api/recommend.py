@@ -0,0 +1,186 @@
+"""
+Ranking of study spots near a point for /api/recommend.
+
+Every cafe's features are precomputed into NumPy arrays once per snapshot:
+position, Google rating and the average of each review score from
+location_stats, all scaled to 0..1. Ranking a request is then a handful
+of vectorized operations over those arrays (haversine distance, a radius
+mask, one weighted sum) followed by np.argpartition to pick the top k
+without sorting every candidate. A spatial index lookup can narrow the
+rows scored to those near the search point first.
+
+    features = load_place_features(places_db, db)
+    for index, score, distance in rank(features, 29.65, -82.34, 2000, DEFAULT_WEIGHTS, 10):
+        ...
+"""
+import numpy as np
+from googlemaps import EARTH_RADIUS_METERS
+from location_stats import RATING_FIELDS, summarize
+
+# Per-place scores, in feature column order; each is on a 0..5 scale
+FEATURES = ["rating"] + RATING_FIELDS
+# Names /api/recommend accepts weights for
+WEIGHT_NAMES = FEATURES + ["distance"]
+DEFAULT_WEIGHTS = {name: 1.0 for name in WEIGHT_NAMES}
+
+MAX_SCORE = 5.0
+# Stands in for a score nobody has given yet, so unreviewed places are neither favoured nor buried
+NEUTRAL_SCORE = MAX_SCORE / 2
+
+CAFE_FEATURE_FIELDS = {"place_id": 1, "name": 1, "geometry.location": 1, "rating": 1}
+
+
+def review_location_ids(cafe):
+    """Returns the location_ids a cafe's reviews may be stored under, as the front end builds them."""
+    location_ids = [str(cafe["_id"])]
+    place_id = cafe.get("place_id")
+    if place_id:
+        location_ids += [place_id, f"place-{place_id}"]
+    return location_ids
+
+
+class PlaceFeatures:
+    """
+    Column arrays describing every place, row i being one place.
+
+    Attributes:
+        ids (list): Cafe _ids as strings
+        place_ids (list): Google place_ids
+        names (list): Display names
+        lat, lng (ndarray): Position in degrees (float64)
+        rating (ndarray): Google rating, NaN if unrated (float32)
+        averages (ndarray): (n, len(RATING_FIELDS)) average review scores, NaN if unscored (float32)
+        review_counts (ndarray): Reviews per place (int32)
+        scores (ndarray): (n, len(FEATURES)) features scaled to 0..1, gaps filled with NEUTRAL_SCORE (float32)
+    """
+
+    def __init__(self, ids, place_ids, names, lat, lng, rating, averages, review_counts):
+        self.ids = ids
+        self.place_ids = place_ids
+        self.names = names
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.rating = np.asarray(rating, dtype=np.float32)
+        self.averages = np.asarray(averages, dtype=np.float32).reshape(len(ids), len(RATING_FIELDS))
+        self.review_counts = np.asarray(review_counts, dtype=np.int32)
+
+        # Precomputed once so each request's haversine is a few array operations
+        self._lat_rad = np.radians(self.lat)
+        self._lng_rad = np.radians(self.lng)
+        self._cos_lat = np.cos(self._lat_rad)
+        raw = np.column_stack([self.rating, self.averages])
+        self.scores = (np.nan_to_num(raw, nan=NEUTRAL_SCORE) / MAX_SCORE).astype(np.float32)
+        # Spatial index keys (place_id, else _id) -> row
+        self._rows = {place_id or id_: i for i, (id_, place_id) in enumerate(zip(ids, place_ids))}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows(self, keys):
+        """Returns the rows of the places with these spatial index keys, skipping unknown ones."""
+        rows = self._rows
+        return np.fromiter((rows[key] for key in keys if key in rows), dtype=np.int64)
+
+    def distances(self, lat, lng, rows=None):
+        """Great-circle distance in meters from (lat, lng) to every place, or to the given rows."""
+        lat_rad, lng_rad = np.radians(lat), np.radians(lng)
+        place_lat, place_lng, cos_lat = self._lat_rad, self._lng_rad, self._cos_lat
+        if rows is not None:
+            place_lat, place_lng, cos_lat = place_lat[rows], place_lng[rows], cos_lat[rows]
+        a = (np.sin((place_lat - lat_rad) / 2) ** 2
+             + np.cos(lat_rad) * cos_lat * np.sin((place_lng - lng_rad) / 2) ** 2)
+        return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def describe(self, index):
+        """Returns place index as a JSON-ready dict."""
+        averages = [None if np.isnan(value) else round(float(value), 2) for value in self.averages[index]]
+        rating = self.rating[index]
+        return {
+            "id": self.ids[index],
+            "place_id": self.place_ids[index],
+            "name": self.names[index],
+            "lat": float(self.lat[index]),
+            "lng": float(self.lng[index]),
+            "rating": None if np.isnan(rating) else round(float(rating), 2),
+            "review_count": int(self.review_counts[index]),
+            "averages": dict(zip(RATING_FIELDS, averages))
+        }
+
+
+def load_place_features(places_db, db):
+    """
+    Reads every live cafe and its review stats into a PlaceFeatures.
+
+    Args:
+        places_db (Database): Database holding the cafes collection
+        db (Database): The app database holding location_stats
+
+    Returns:
+        PlaceFeatures: One row per cafe with a location
+    """
+    # Reviewed locations are far fewer than cafes, so read them all rather than $in 50k ids
+    stats_by_id = {stats["_id"]: stats for stats in db.location_stats.find({"review_count": {"$gt": 0}})}
+
+    ids, place_ids, names, lat, lng, rating, averages, review_counts = [], [], [], [], [], [], [], []
+    for cafe in places_db.cafes.find({"stale": {"$ne": True}}, CAFE_FEATURE_FIELDS):
+        location = cafe.get("geometry", {}).get("location")
+        if not location:
+            continue
+        stats = next((stats_by_id[key] for key in review_location_ids(cafe) if key in stats_by_id), None)
+        summary = summarize(stats)
+
+        ids.append(str(cafe["_id"]))
+        place_ids.append(cafe.get("place_id", ""))
+        names.append(cafe.get("name", "Unknown Cafe"))
+        lat.append(location["lat"])
+        lng.append(location["lng"])
+        rating.append(cafe.get("rating") or np.nan)
+        averages.append([np.nan if summary["averages"][field] is None else summary["averages"][field]
+                         for field in RATING_FIELDS])
+        review_counts.append(summary["review_count"])
+
+    return PlaceFeatures(ids, place_ids, names, lat, lng, rating, averages, review_counts)
+
+
+def rank(features, lat, lng, radius, weights, limit, candidates=None):
+    """
+    Scores the places within radius meters of (lat, lng) and returns the best.
+
+    Each place scores the weighted mean of its scaled features plus
+    weights["distance"] * (1 - distance / radius). A negative weight prefers
+    lower values of that feature.
+
+    Args:
+        features (PlaceFeatures): Snapshot to rank
+        lat, lng (float): Search center in degrees
+        radius (float): Search radius in meters
+        weights (dict): Weight per name in WEIGHT_NAMES
+        limit (int): Number of places to return
+        candidates (ndarray, optional): Rows to consider, e.g. from a spatial index
+            lookup of the same circle; defaults to every place
+
+    Returns:
+        list: (row index, score, distance in meters) tuples, best first
+    """
+    if not len(features):
+        return []
+    if candidates is None:
+        candidates = np.arange(len(features))
+    distances = features.distances(lat, lng, candidates)
+    inside = distances <= radius
+    candidates, candidate_distances = candidates[inside], distances[inside]
+    if not candidates.size:
+        return []
+
+    feature_weights = np.array([weights[name] for name in FEATURES], dtype=np.float32)
+    scores = features.scores[candidates] @ feature_weights
+    scores += weights["distance"] * (1 - candidate_distances / radius)
+    scores /= sum(abs(weight) for weight in weights.values()) or 1.0
+
+    # Partition out the top `limit` in linear time, then sort just those
+    if candidates.size > limit:
+        top = np.argpartition(-scores, limit - 1)[:limit]
+    else:
+        top = np.arange(candidates.size)
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [(int(candidates[i]), float(scores[i]), float(candidate_distances[i])) for i in top]
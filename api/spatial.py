@@ -0,0 +1,323 @@
+"""
+In-process spatial index of points (cafes, bookmarks) for nearest-neighbour
+and bounding-box lookups without a database round trip.
+
+Points are bucketed into a fixed grid of cell_degrees-sized cells and kept
+sorted by cell number, so the points of a run of cells in one grid row are
+a contiguous slice found with np.searchsorted. A query visits only the
+cells overlapping its box, then filters exactly.
+
+Writes are applied incrementally: an upserted or removed point masks its
+old row and goes into a small pending buffer that every query also scans.
+Once the buffer outgrows SPATIAL_MERGE_FRACTION of the index it is merged
+into the sorted arrays.
+
+    index = SpatialIndex(["a", "b"], [29.64, 29.65], [-82.35, -82.34])
+    index.nearest(29.645, -82.345, k=1)     # [("a", 712.3)]
+    index.within((-82.36, 29.63, -82.33, 29.66))
+
+PackedPoints keeps the same kind of points in column arrays for bulk export
+as packed little-endian float32, also updated in place as points come and go.
+"""
+import os
+import math
+import threading
+import numpy as np
+from googlemaps import EARTH_RADIUS_METERS
+
+# Grid cell size; 0.01 degrees is about 1.1 km of latitude
+SPATIAL_CELL_DEGREES = float(os.getenv('SPATIAL_CELL_DEGREES', 0.01))
+
+# Pending writes are merged once they exceed this fraction of the index (or 256 points)
+SPATIAL_MERGE_FRACTION = 0.05
+SPATIAL_MIN_MERGE = 256
+
+
+def haversine_array(lat, lng, lats, lngs):
+    """Great-circle distance in meters from (lat, lng) to every point of lats, lngs (degrees)."""
+    lat_rad, lats_rad = np.radians(lat), np.radians(lats)
+    a = (np.sin((lats_rad - lat_rad) / 2) ** 2
+         + np.cos(lat_rad) * np.cos(lats_rad) * np.sin(np.radians(lngs - lng) / 2) ** 2)
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def radius_bbox(lat, lng, radius):
+    """Returns a (west, south, east, north) box containing the circle of radius meters around (lat, lng)."""
+    d_lat = math.degrees(radius / EARTH_RADIUS_METERS)
+    south, north = max(lat - d_lat, -90.0), min(lat + d_lat, 90.0)
+    cos_lat = min(math.cos(math.radians(south)), math.cos(math.radians(north)))
+    if cos_lat <= 1e-9 or d_lat / cos_lat >= 180:
+        return -180.0, south, 180.0, north
+    d_lng = d_lat / cos_lat
+    # Boxes crossing the antimeridian are clamped; the app only covers one city
+    return max(lng - d_lng, -180.0), south, min(lng + d_lng, 180.0), north
+
+
+class SpatialIndex:
+    """
+    Grid index over keyed points.
+
+    Args:
+        keys (list): One key per point, e.g. place_id or bookmark _id as a string
+        lat, lng (list): Coordinates in degrees
+        cell_degrees (float, optional): Grid cell size, defaults to SPATIAL_CELL_DEGREES
+    """
+
+    def __init__(self, keys, lat, lng, cell_degrees=None):
+        self.cell_degrees = cell_degrees or SPATIAL_CELL_DEGREES
+        self._columns = int(math.ceil(360 / self.cell_degrees)) + 1
+        self._lock = threading.Lock()
+        self._pending = {}  # key -> (lat, lng) written since the last merge
+        self._build(list(keys), np.asarray(lat, dtype=np.float64), np.asarray(lng, dtype=np.float64))
+
+    def _cell_coords(self, lat, lng):
+        row = np.floor((np.asarray(lat) + 90) / self.cell_degrees).astype(np.int64)
+        column = np.floor((np.asarray(lng) + 180) / self.cell_degrees).astype(np.int64)
+        return row, column
+
+    def _build(self, keys, lat, lng):
+        row, column = self._cell_coords(lat, lng)
+        cells = row * self._columns + column
+        order = np.argsort(cells, kind="stable")
+        sorted_keys = np.empty(len(keys), dtype=object)
+        sorted_keys[:] = keys
+        sorted_keys = sorted_keys[order]
+        # Swapped in as one tuple so concurrent queries see either the old or the new arrays
+        self._base = (sorted_keys, lat[order], lng[order], cells[order], np.ones(len(keys), dtype=bool))
+        self._positions = {key: i for i, key in enumerate(sorted_keys)}
+
+    def __len__(self):
+        alive = self._base[4]
+        return int(alive.sum()) + len(self._pending)
+
+    def upsert(self, key, lat, lng):
+        """Adds a point, or moves it if key is already indexed."""
+        with self._lock:
+            position = self._positions.get(key)
+            if position is not None:
+                self._base[4][position] = False
+            self._pending[key] = (float(lat), float(lng))
+            self._merge_if_needed()
+
+    def remove(self, key):
+        """Drops a point; unknown keys are ignored."""
+        with self._lock:
+            position = self._positions.get(key)
+            if position is not None:
+                self._base[4][position] = False
+            self._pending.pop(key, None)
+
+    def _merge_if_needed(self):
+        keys, lat, lng, _, alive = self._base
+        if len(self._pending) <= max(SPATIAL_MIN_MERGE, SPATIAL_MERGE_FRACTION * len(keys)):
+            return
+        pending_lat = np.fromiter((point[0] for point in self._pending.values()), dtype=np.float64)
+        pending_lng = np.fromiter((point[1] for point in self._pending.values()), dtype=np.float64)
+        self._build(list(keys[alive]) + list(self._pending),
+                    np.concatenate([lat[alive], pending_lat]), np.concatenate([lng[alive], pending_lng]))
+        self._pending = {}
+
+    def _candidates(self, west, south, east, north):
+        """Returns (keys, lat, lng) of every live point in the box, from the base arrays and pending writes."""
+        row_start, column_start = self._cell_coords(south, west)
+        row_end, column_end = self._cell_coords(north, east)
+        rows = np.arange(row_start, row_end + 1)
+
+        # One consistent view: a write masks a base row and adds to pending under this lock,
+        # and a merge swaps both at once, so neither may be read separately
+        with self._lock:
+            keys, lat, lng, cells, alive = self._base
+            starts = np.searchsorted(cells, rows * self._columns + column_start, side="left")
+            ends = np.searchsorted(cells, rows * self._columns + column_end, side="right")
+            slices = [np.arange(start, end) for start, end in zip(starts, ends) if end > start]
+            positions = np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+            positions = positions[alive[positions]]
+            pending = list(self._pending.items())
+
+        found_keys, found_lat, found_lng = keys[positions], lat[positions], lng[positions]
+        if pending:
+            pending_keys = np.empty(len(pending), dtype=object)
+            pending_keys[:] = [key for key, _ in pending]
+            found_keys = np.concatenate([found_keys, pending_keys])
+            found_lat = np.concatenate([found_lat, [point[0] for _, point in pending]])
+            found_lng = np.concatenate([found_lng, [point[1] for _, point in pending]])
+
+        inside = (found_lat >= south) & (found_lat <= north) & (found_lng >= west) & (found_lng <= east)
+        return found_keys[inside], found_lat[inside], found_lng[inside]
+
+    def within(self, bbox):
+        """
+        Returns the keys of the points inside bbox.
+
+        Args:
+            bbox (tuple): (west, south, east, north) in degrees
+
+        Returns:
+            list: Keys, in no particular order
+        """
+        return list(self._candidates(*bbox)[0])
+
+    def within_radius(self, lat, lng, radius):
+        """
+        Returns the points within radius meters of (lat, lng).
+
+        Returns:
+            tuple: (keys, distances in meters) as arrays, in no particular order
+        """
+        keys, lats, lngs = self._candidates(*radius_bbox(lat, lng, radius))
+        distances = haversine_array(lat, lng, lats, lngs)
+        inside = distances <= radius
+        return keys[inside], distances[inside]
+
+    def nearest(self, lat, lng, k=10):
+        """
+        Returns the k points closest to (lat, lng).
+
+        Searches a radius that starts at one cell and doubles until it holds k
+        points; every point outside it is farther than every point inside, so
+        the k nearest are among them.
+
+        Returns:
+            list: (key, distance in meters) tuples, nearest first
+        """
+        if k <= 0 or not len(self):
+            return []
+        radius = self.cell_degrees * math.pi / 180 * EARTH_RADIUS_METERS
+        while True:
+            keys, distances = self.within_radius(lat, lng, radius)
+            if len(keys) >= k or radius >= math.pi * EARTH_RADIUS_METERS:
+                break
+            radius *= 2
+
+        if len(keys) > k:
+            top = np.argpartition(distances, k - 1)[:k]
+        else:
+            top = np.arange(len(keys))
+        top = top[np.argsort(distances[top], kind="stable")]
+        return [(keys[i], float(distances[i])) for i in top]
+
+
+class PackedPoints:
+    """
+    Keyed points held in column arrays, for clients that plot or cluster
+    every point rather than query around one.
+
+    Each point owns a slot; an upsert appends or overwrites one and a remove
+    moves the last point into the freed slot, so writes never repack the
+    arrays. Slot order is therefore arbitrary. export() packs the live slots
+    as little-endian float32 once per revision.
+
+    Args:
+        keys (list): One key per point
+        lat, lng (list): Coordinates in degrees
+    """
+
+    EXPORT_DTYPE = np.dtype("<f4")
+
+    def __init__(self, keys, lat, lng):
+        self._keys = list(keys)
+        self._slots = {key: i for i, key in enumerate(self._keys)}
+        capacity = max(len(self._keys), 1024)
+        self._lat = np.empty(capacity, dtype=np.float64)
+        self._lng = np.empty(capacity, dtype=np.float64)
+        self._lat[:len(self._keys)] = lat
+        self._lng[:len(self._keys)] = lng
+        self._lock = threading.Lock()
+        self.revision = 0
+        self._export = None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def upsert(self, key, lat, lng):
+        """Adds a point, or moves it if key is already stored."""
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = len(self._keys)
+                if slot == len(self._lat):
+                    # Double the capacity so appends stay amortized O(1)
+                    self._lat = np.resize(self._lat, 2 * slot)
+                    self._lng = np.resize(self._lng, 2 * slot)
+                self._keys.append(key)
+                self._slots[key] = slot
+            self._lat[slot] = lat
+            self._lng[slot] = lng
+            self.revision += 1
+
+    def remove(self, key):
+        """Drops a point; unknown keys are ignored."""
+        with self._lock:
+            slot = self._slots.pop(key, None)
+            if slot is None:
+                return
+            last = len(self._keys) - 1
+            if slot != last:
+                moved = self._keys[last]
+                self._keys[slot] = moved
+                self._slots[moved] = slot
+                self._lat[slot] = self._lat[last]
+                self._lng[slot] = self._lng[last]
+            self._keys.pop()
+            self.revision += 1
+
+    def columns(self):
+        """Returns (revision, lat, lng): copies of the live coordinates as float64 arrays."""
+        with self._lock:
+            count = len(self._keys)
+            return self.revision, self._lat[:count].copy(), self._lng[:count].copy()
+
+    def export(self):
+        """
+        Returns the current points as packed arrays.
+
+        Returns:
+            dict: {"revision": r, "count": n, "lat": bytes, "lng": bytes}; each
+            array is n little-endian float32 values, point i at the same index
+            in both
+        """
+        export = self._export
+        if export is not None and export["revision"] == self.revision:
+            return export
+        revision, lat, lng = self.columns()
+        export = {"revision": revision, "count": len(lat),
+                  "lat": lat.astype(self.EXPORT_DTYPE).tobytes(), "lng": lng.astype(self.EXPORT_DTYPE).tobytes()}
+        self._export = export
+        return export
+
+
+def load_cafe_index(places_db, cell_degrees=None):
+    """Builds a SpatialIndex of every live cafe, keyed by place_id."""
+    keys, lat, lng = [], [], []
+    for cafe in places_db.cafes.find({"stale": {"$ne": True}}, {"_id": 0, "place_id": 1, "geometry.location": 1}):
+        location = cafe.get("geometry", {}).get("location")
+        if location and cafe.get("place_id"):
+            keys.append(cafe["place_id"])
+            lat.append(location["lat"])
+            lng.append(location["lng"])
+    return SpatialIndex(keys, lat, lng, cell_degrees)
+
+
+def _bookmark_points(db):
+    """Returns (keys, lat, lng) of every bookmark with coordinates, keyed by _id as a string."""
+    keys, lat, lng = [], [], []
+    for bookmark in db.bookmarks.find({}, {"coordinates": 1}):
+        coordinates = bookmark.get("coordinates") or {}
+        try:
+            point = float(coordinates["lat"]), float(coordinates["lng"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        keys.append(str(bookmark["_id"]))
+        lat.append(point[0])
+        lng.append(point[1])
+    return keys, lat, lng
+
+
+def load_bookmark_index(db, cell_degrees=None):
+    """Builds a SpatialIndex of every bookmark with coordinates, keyed by _id as a string."""
+    return SpatialIndex(*_bookmark_points(db), cell_degrees)
+
+
+def load_bookmark_points(db):
+    """Builds the PackedPoints of every bookmark with coordinates, keyed by _id as a string."""
+    return PackedPoints(*_bookmark_points(db))
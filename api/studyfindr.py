@@ -1,107 +1,350 @@
-from flask import Flask, render_template, url_for, flash, redirect, jsonify, request, send_from_directory
+from flask import Flask, Blueprint, current_app, render_template, url_for, flash, redirect, jsonify, request, send_from_directory, g
+from flask.cli import with_appcontext
 from flask_cors import CORS
 from forms import RegistrationForm, LoginForm
 from dotenv import load_dotenv
-from flask_pymongo import PyMongo
 import bcrypt
+import click
 import os
 import requests
 import json
+import math
 import pymongo
 import hashlib
 import secrets
 import time
 import re
+import uuid
 from datetime import datetime as dt
 from werkzeug.utils import secure_filename
-from pymongo import MongoClient
-from gridfs import GridFS
+from werkzeug.wsgi import wrap_file
+from werkzeug.local import LocalProxy
+from pymongo import ReturnDocument
 import base64
+from bson import json_util
 from bson.objectid import ObjectId
-from googlemaps import fetch_and_store_cafes
+from cache import LRUCache, LocalBackend, PayloadCache, SnapshotCache, make_backend
+from thumbnails import THUMBNAIL_SIZES, store_thumbnails, get_or_create_thumbnail
+from googlemaps import fetch_and_store_cafes, get_cafes_version, add_cafe_listener
+from indexes import ensure_indexes
+from app_logging import get_logger
+from migrations import start_image_migration
+from recommend import WEIGHT_NAMES, DEFAULT_WEIGHTS, load_place_features, rank
+from spatial import load_cafe_index, load_bookmark_index, load_bookmark_points
+from location_stats import RATING_FIELDS, apply_review_change, get_location_stats, summarize_locations, backfill_location_stats
+from compression import register_compression, precompress, encoded_response
+from metrics import MetricsRegistry, RequestCommandListener, CONTENT_TYPE as METRICS_CONTENT_TYPE
+import clients
+from clients import mongo
 
 # Load environment variables from .env file
-# Print the current working directory to help debug
-print(f"Current working directory: {os.getcwd()}")
-# Try to load .env file from both the current directory and parent directory
 load_dotenv()
-# Print to verify if MONGO_URI was loaded correctly
-mongo_uri = os.getenv('MONGO_URI')
-print(f"MONGO_URI loaded: {'Yes' if mongo_uri else 'No'}")
+logger = get_logger(__name__)
 
 # Add configuration for file uploads
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+# Thumbnail size used for avatars in review lists
+REVIEW_AVATAR_SIZE = 64
+
+# Fields each endpoint returns, used as find() projections so Mongo only sends those
+REVIEW_FIELDS = {field: 1 for field in [
+    "user_email", "location_id", "quietness", "seating", "vibes", "crowdedness", "internet", "comment",
+    "likes", "dislikes", "likes_count", "dislikes_count", "created_at", "updated_at"
+]}
+BOOKMARK_FIELDS = {field: 1 for field in [
+    "name", "coordinates", "place_id", "description", "address", "rating", "created_at"
+]}
+# Google Places documents carry photos, opening hours, types etc. the map never shows
+CAFE_MAP_FIELDS = {field: 1 for field in [
+    "name", "geometry.location", "icon", "icon_background_color", "place_id", "rating", "vicinity",
+    "business_status"
+]}
+CAFE_COLUMNAR_FIELDS = {field: 1 for field in ["name", "geometry.location", "place_id", "rating"]}
+
+# Response formats of the map endpoints: a list of objects, or parallel arrays
+MAP_FORMATS = ("json", "columnar")
+
+# Set to 0 to leave the profile picture migration to `python migrations.py`
+MIGRATE_IMAGES_ON_STARTUP = os.getenv('MIGRATE_IMAGES_ON_STARTUP', '1') != '0'
+
+# Requests slower than this many milliseconds are logged with their MongoDB
+# command breakdown; 0 turns the slow-request log off
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', 0))
+
+# Every endpoint is registered on this blueprint; create_app() mounts it
+api = Blueprint("api", __name__)
+
+# Per-route latency and MongoDB commands per request, served at /metrics
+metrics = MetricsRegistry()
+command_listener = RequestCommandListener(metrics)
+clients.add_event_listener(command_listener)
+
+# The MongoDB client is shared by the whole process and created on first use,
+# so these only resolve once a request (or startup task) touches them
+users_collection = LocalProxy(lambda: mongo.db.users)
+bookmarks_collection = LocalProxy(lambda: mongo.db.bookmarks)
+places_db = LocalProxy(clients.get_places_db)
+fs = LocalProxy(clients.get_fs)
+
+# Helper function to read the cafes map viewport
+def parse_viewport(args):
+    """
+    Reads either bbox=west,south,east,north or lat, lng and radius (meters).
+    Returns ("bbox", (west, south, east, north)), ("radius", (lat, lng, radius)),
+    or None when neither is given.
+    Raises ValueError on malformed or out-of-range values.
+    """
+    bbox = args.get("bbox")
+    if bbox:
+        parts = bbox.split(",")
+        if len(parts) != 4:
+            raise ValueError("bbox must be west,south,east,north")
+        west, south, east, north = (float(p) for p in parts)
+        if not (-180 <= west < east <= 180 and -90 <= south < north <= 90):
+            raise ValueError("bbox is out of range or crosses the antimeridian")
+        return "bbox", (west, south, east, north)
+    
+    lat = args.get("lat")
+    lng = args.get("lng")
+    radius = args.get("radius")
+    if lat is not None or lng is not None or radius is not None:
+        if lat is None or lng is None or radius is None:
+            raise ValueError("lat, lng and radius must be given together")
+        lat, lng, radius = float(lat), float(lng), float(radius)
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180 and radius > 0):
+            raise ValueError("lat, lng or radius is out of range")
+        return "radius", (lat, lng, radius)
+    
+    return None
 
-# Create uploads directory if it doesn't exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
-app = Flask(__name__) 
-CORS(app)
-
-app.config["MONGO_URI"] = os.getenv('MONGO_URI')
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
-
-mongo = PyMongo(app)
-users_collection = mongo.db.users
-bookmarks_collection = mongo.db.bookmarks
-
-# Create MongoDB client for additional database
-mongo_client = MongoClient(mongo_uri)
-places_db = mongo_client['places_db']
-# Initialize GridFS for file storage
-fs = GridFS(mongo.db)
-
-# Migrate existing profile photos to GridFS
-def migrate_existing_images():
+# Helper function to find the place_ids of the cafes in a viewport with the shared spatial index
+def viewport_place_ids(viewport):
+    kind, bounds = viewport
+    if kind == "bbox":
+        return cafe_index.get().within(bounds)
+    keys, _ = cafe_index.get().within_radius(*bounds)
+    return list(keys)
+
+# Helper function to read and check the ?format= of a map endpoint
+def requested_map_format(args):
+    map_format = args.get("format", "json")
+    if map_format not in MAP_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(MAP_FORMATS)}")
+    return map_format
+
+# Helper function to turn map items into parallel arrays for ?format=columnar
+def to_columnar(items):
+    """
+    Transposes items (dicts with id, place_id, name, lat, lng and rating) into
+    one array per field, which is smaller on the wire and faster for the map
+    front end to decode than a list of objects.
+    """
+    columns = {"ids": [], "place_ids": [], "names": [], "lat": [], "lng": [], "rating": []}
+    for item in items:
+        columns["ids"].append(item["id"])
+        columns["place_ids"].append(item.get("place_id", ""))
+        columns["names"].append(item.get("name", ""))
+        columns["lat"].append(item["lat"])
+        columns["lng"].append(item["lng"])
+        columns["rating"].append(item.get("rating") or 0)
+    return {"format": "columnar", "count": len(items), **columns}
+
+# Helper function to flatten a bookmark into a to_columnar item
+def bookmark_map_item(bookmark):
+    coordinates = bookmark.get("coordinates", {})
+    return {
+        "id": str(bookmark["_id"]),
+        "place_id": bookmark.get("place_id", ""),
+        "name": bookmark.get("name", ""),
+        "lat": coordinates.get("lat"),
+        "lng": coordinates.get("lng"),
+        "rating": bookmark.get("rating")
+    }
+
+# Helper function to add author username and profile picture to reviews
+def attach_review_authors(reviews):
+    """
+    Looks up the authors of a page of reviews with one $in query and copies
+    their username and profile picture onto each review in place.
+    """
+    emails = {review["user_email"] for review in reviews if "user_email" in review}
+    if not emails:
+        return reviews
+    
+    users = mongo.db.users.find(
+        {"email": {"$in": list(emails)}},
+        {"_id": 0, "email": 1, "username": 1, "profile_picture": 1}
+    ).batch_size(len(emails))  # Fetch the whole page in the first batch
+    users_by_email = {user["email"]: user for user in users}
+    
+    for review in reviews:
+        user = users_by_email.get(review.get("user_email"))
+        if user:
+            # Add username
+            if "username" in user:
+                review["user_name"] = user["username"]
+            
+            # Add profile picture if available, as a thumbnail for uploaded pictures
+            if "profile_picture" in user:
+                profile_picture = user["profile_picture"]
+                if profile_picture.startswith("/uploads/"):
+                    profile_picture = f"{profile_picture}?size={REVIEW_AVATAR_SIZE}"
+                review["profile_picture"] = profile_picture
+    
+    return reviews
+
+# Fields get_location_reviews can sort by, and the review field each one pages on
+REVIEW_SORT_KEYS = {"created_at": "created_at", "likes": "likes_count"}
+# The type of each sort's key in a cursor; None is also allowed, for older reviews
+REVIEW_SORT_KEY_TYPES = {"created_at": dt, "likes": int}
+MAX_REVIEW_PAGE_SIZE = 200
+
+# Exact review counts are only computed when asked for, then kept briefly per location
+REVIEW_COUNT_TTL = int(os.getenv('REVIEW_COUNT_TTL', 60))
+review_count_cache = LocalBackend(max_entries=4096)
+
+# Helper function to encode the position after a page of reviews as an opaque cursor
+def encode_review_cursor(sort_by, sort_order, review):
+    position = {"sort_by": sort_by, "sort_order": sort_order,
+                "key": review.get(REVIEW_SORT_KEYS[sort_by]), "_id": review["_id"]}
+    # json_util keeps datetimes and ObjectIds intact through the round trip
+    return base64.urlsafe_b64encode(json_util.dumps(position).encode("utf-8")).decode("ascii").rstrip("=")
+
+# Helper function to decode a cursor and check it was issued for the same sort. The
+# key and _id go into the query, so anything but a plain value of the expected type,
+# such as a {"$ne": null} operator, is rejected
+def decode_review_cursor(cursor, sort_by, sort_order):
     try:
-        print("Starting migration of existing images to GridFS...")
-        # Get all users with profile pictures
-        users_with_pics = mongo.db.users.find({"profile_picture": {"$exists": True}})
-        
-        count = 0
-        for user in users_with_pics:
-            if "profile_picture" in user and user["profile_picture"].startswith("/uploads/"):
-                # Extract the filename from the path
-                filename = user["profile_picture"].replace("/uploads/", "")
-                file_path = os.path.join(UPLOAD_FOLDER, filename)
-                
-                # Check if the file exists
-                if os.path.exists(file_path):
-                    try:
-                        # Open and read the file
-                        with open(file_path, 'rb') as f:
-                            file_data = f.read()
-                            
-                        # Determine content type based on extension
-                        content_type = "image/jpeg"  # Default
-                        if filename.lower().endswith('.png'):
-                            content_type = "image/png"
-                        elif filename.lower().endswith('.gif'):
-                            content_type = "image/gif"
-                        
-                        # Store in GridFS
-                        file_id = fs.put(
-                            file_data,
-                            filename=filename,
-                            content_type=content_type
-                        )
-                        
-                        # Update the user record with the new file ID
-                        mongo.db.users.update_one(
-                            {"_id": user["_id"]},
-                            {"$set": {"profile_picture": f"/uploads/{str(file_id)}"}}
-                        )
-                        
-                        count += 1
-                        print(f"Migrated image for user {user.get('username', user.get('email'))}")
-                    except Exception as e:
-                        print(f"Error migrating file {filename}: {str(e)}")
-        
-        print(f"Migration complete. Migrated {count} images.")
-    except Exception as e:
-        print(f"Migration error: {str(e)}")
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json_util.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        key, review_id = position["key"], position["_id"]
+        matches = position["sort_by"] == sort_by and position["sort_order"] == sort_order
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Invalid cursor")
+    if not matches:
+        raise ValueError("Cursor was issued for a different sort")
+    key_type = REVIEW_SORT_KEY_TYPES[sort_by]
+    valid_key = key is None or (isinstance(key, key_type) and not isinstance(key, bool))
+    if not valid_key or not isinstance(review_id, ObjectId):
+        raise ValueError("Invalid cursor")
+    return key, review_id
+
+# Helper function to build the filter for the reviews after a cursor position
+def reviews_after(sort_field, sort_order, key, review_id):
+    """
+    Matches the reviews that come after (key, review_id) in (sort_field, _id)
+    order, so each page is an index seek instead of a skip over earlier pages.
+
+    Older reviews may have no sort field at all. MongoDB sorts those before
+    every other value, and a range query on a null key matches nothing, so
+    they are paged on _id alone and placed at the matching end of the order.
+    """
+    op = "$lt" if sort_order == -1 else "$gt"
+    if key is None:
+        after = [{sort_field: None, "_id": {op: review_id}}]
+        if sort_order == 1:
+            after.append({sort_field: {"$ne": None}})
+    else:
+        after = [{sort_field: {op: key}}, {sort_field: key, "_id": {op: review_id}}]
+        if sort_order == -1:
+            after.append({sort_field: None})
+    return {"$or": after}
+
+# Helper function to count a location's reviews, cached for REVIEW_COUNT_TTL seconds
+def location_review_count(location_id):
+    count = review_count_cache.get(location_id)
+    if count is None:
+        count = mongo.db.reviews.count_documents({"location_id": location_id})
+        review_count_cache.set(location_id, count, REVIEW_COUNT_TTL)
+    return count
+
+# Helpers building atomic like/dislike updates for rate_review.
+# Each returns a filter that only matches reviews the vote would change and an
+# update pipeline that edits the arrays and keeps the counters in sync.
+def _add_vote(field, user_email):
+    # Append the email only if it isn't there yet, preserving vote order
+    votes = {"$ifNull": [f"${field}", []]}
+    return {"$cond": [
+        {"$in": [{"$literal": user_email}, votes]},
+        votes,
+        {"$concatArrays": [votes, {"$literal": [user_email]}]}
+    ]}
+
+def _remove_vote(field, user_email):
+    return {"$filter": {
+        "input": {"$ifNull": [f"${field}", []]},
+        "cond": {"$ne": ["$$this", {"$literal": user_email}]}
+    }}
+
+def _vote_update(likes, dislikes):
+    return [
+        {"$set": {"likes": likes, "dislikes": dislikes}},
+        {"$set": {"likes_count": {"$size": "$likes"}, "dislikes_count": {"$size": "$dislikes"}}}
+    ]
+
+VOTE_ACTIONS = {
+    "like": lambda email: (
+        {"$or": [{"likes": {"$ne": email}}, {"dislikes": email}]},
+        _vote_update(_add_vote("likes", email), _remove_vote("dislikes", email))
+    ),
+    "dislike": lambda email: (
+        {"$or": [{"dislikes": {"$ne": email}}, {"likes": email}]},
+        _vote_update(_remove_vote("likes", email), _add_vote("dislikes", email))
+    ),
+    "remove": lambda email: (
+        {"$or": [{"likes": email}, {"dislikes": email}]},
+        _vote_update(_remove_vote("likes", email), _remove_vote("dislikes", email))
+    )
+}
+
+# Backfill vote counters on reviews created before they were maintained, so
+# the likes sort in get_location_reviews can use its index instead of $size
+def backfill_review_vote_counts():
+    mongo.db.reviews.update_many(
+        {"likes_count": {"$exists": False}},
+        [{"$set": {
+            "likes_count": {"$size": {"$ifNull": ["$likes", []]}},
+            "dislikes_count": {"$size": {"$ifNull": ["$dislikes", []]}}
+        }}]
+    )
+
+# Tag every request with an ID (reusing the caller's X-Request-ID) for the logs,
+# and start counting the MongoDB commands it sends
+@api.before_app_request
+def start_request_log():
+    g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    g.request_start = time.perf_counter()
+    command_listener.start_request()
+
+@api.after_app_request
+def finish_request_log(response):
+    response.headers["X-Request-ID"] = g.get("request_id", "")
+    duration = time.perf_counter() - g.get("request_start", time.perf_counter())
+    commands = command_listener.finish_request()
+    command_count = sum(command["count"] for command in commands.values())
+
+    # Label by URL rule rather than path so /api/reviews/<id> is one series
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.observe_request(request.method, route, response.status_code, duration, command_count)
+
+    fields = {
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "duration_ms": round(duration * 1000, 1),
+        "mongo_commands": command_count
+    }
+    logger.info("Request handled", extra={"fields": fields})
+    if SLOW_REQUEST_MS and duration * 1000 >= SLOW_REQUEST_MS:
+        breakdown = {name: {"count": command["count"], "ms": round(command["ms"], 1)}
+                     for name, command in commands.items()}
+        logger.warning("Slow request", extra={"fields": {**fields, "route": route, "mongo": breakdown}})
+    return response
+
+@api.route("/metrics", methods=['GET'])
+def get_metrics():
+    return current_app.response_class(metrics.render(), content_type=METRICS_CONTENT_TYPE)
 
 # Helper function to check allowed file extensions
 def allowed_file(filename):
@@ -124,11 +367,10 @@ def mongo_to_json_serializable(obj):
     
     return obj
 
-@app.route("/api/register", methods=['POST'])
+@api.route("/api/register", methods=['POST'])
 def api_register_json():
     try:
         data = request.get_json()
-        print("Received data:", data)
         
         if not data:
             return jsonify({"errors": {"general": "No data received"}}), 400
@@ -136,7 +378,7 @@ def api_register_json():
         form = RegistrationForm(data=data, meta={'csrf': False})
         if form.validate():
             # Check if email already exists
-            existing_user = users_collection.find_one({"email": form.email.data})
+            existing_user = users_collection.find_one({"email": form.email.data}, {"_id": 1})
             if (existing_user):
                 return jsonify({"errors": {"email": ["Email already exists"]}}), 400
 
@@ -151,30 +393,31 @@ def api_register_json():
                 "bookmarks": []
             }
             users_collection.insert_one(user_data)
-            print(f"User registered: {user_data['username']}")
+            logger.info("User registered", extra={"fields": {"username": user_data['username']}})
 
             return jsonify({"message": f"Account created for {form.username.data}!"}), 201
         
         return jsonify({"errors": form.errors}), 400
         
     except Exception as e:
-        print(f"Server error: {str(e)}")
+        logger.exception("Error registering user")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
 
 
-@app.route("/api/login", methods=['POST'])
+@api.route("/api/login", methods=['POST'])
 def api_login_json():
     try:
         data = request.get_json()
-        print("Login attempt:", data)
         
         if not data:
             return jsonify({"errors": {"general": "No data received"}}), 400
             
         form = LoginForm(data=data, meta={'csrf': False})
+        # Never log the payload itself; it carries the password
+        logger.debug("Login attempt", extra={"fields": {"email": data.get("email")}})
         if form.validate():
             # Check MongoDB for the user
-            user = users_collection.find_one({"email": form.email.data})
+            user = users_collection.find_one({"email": form.email.data}, {"password": 1})
             
             if user and bcrypt.checkpw(form.password.data.encode('utf-8'), user["password"].encode('utf-8')):
                 return jsonify({"message": "Login successful"}), 200
@@ -188,11 +431,11 @@ def api_login_json():
         return jsonify({"errors": form.errors}), 400
         
     except Exception as e:
-        print(f"Server error during login: {str(e)}")
+        logger.exception("Server error during login")
         # Make sure we always return a valid JSON response
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
 
-@app.route("/api/add_bookmark", methods=['POST'])
+@api.route("/api/add_bookmark", methods=['POST'])
 def add_bookmark():
     try:
         data = request.get_json()
@@ -238,7 +481,7 @@ def add_bookmark():
         existing = None
         if place_id:
             # If we have a place_id, search by that first (most reliable)
-            existing = bookmarks_collection.find_one({"place_id": place_id})
+            existing = bookmarks_collection.find_one({"place_id": place_id}, {"place_id": 1})
         
         # If not found by place_id, try by location coordinates
         if not existing:
@@ -246,7 +489,7 @@ def add_bookmark():
                 "name": name,
                 "coordinates.lat": latitude,
                 "coordinates.lng": longitude
-            })
+            }, {"place_id": 1})
         
         if existing:
             bookmark_id_str = str(existing["_id"])
@@ -275,6 +518,7 @@ def add_bookmark():
         # Insert the new bookmark
         result = bookmarks_collection.insert_one(bookmark_data)
         bookmark_id_str = str(result.inserted_id)
+        index_bookmark(bookmark_id_str, latitude, longitude)
         
         # If an email is provided, add this new bookmark to the user's bookmarks
         if email:
@@ -290,21 +534,72 @@ def add_bookmark():
         }), 201
 
     except Exception as e:
+        logger.exception("Error in add_bookmark")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
     
 
-@app.route("/api/get_study_spot_vectors", methods=['GET'])
+# "json" is the original list of coordinate objects; "columnar" and "binary" carry packed float32 arrays
+VECTOR_FORMATS = ("json", "columnar", "binary")
+# Serialized exports per format, bookmarks version and snapshot revision
+vector_bodies = LocalBackend(max_entries=8)
+
+# Endpoint to export every study spot's coordinates for clustering and heatmaps
+@api.route("/api/get_study_spot_vectors", methods=['GET'])
 def get_study_spot_vectors():
     try:
-        bookmarks = bookmarks_collection.find({}, {"_id": 0, "coordinates": 1})
-        coordinates_vector = [bookmark["coordinates"] for bookmark in bookmarks]
-        return jsonify({"vectors": coordinates_vector}), 200
+        default_format = "binary" if request.accept_mimetypes.best == "application/octet-stream" else "json"
+        vector_format = request.args.get("format", default_format)
+        if vector_format not in VECTOR_FORMATS:
+            return jsonify({"errors": {"format": f"format must be one of: {', '.join(VECTOR_FORMATS)}"}}), 400
+        
+        # Kept in step with add_bookmark and remove_bookmark, so no collection scan per call
+        points = bookmark_vectors.get()
+        version = bookmark_vectors.version
+        # Every worker at the same bookmarks version serves the same points, though
+        # not necessarily in the same order, hence a weak ETag
+        etag = f"bookmarks-{version}-{vector_format}"
+        if request.if_none_match.contains_weak(etag):
+            response = current_app.response_class(status=304)
+        else:
+            key = f"{vector_format}:{version}:{points.revision}"
+            body = vector_bodies.get(key)
+            if body is None:
+                body = build_vectors_body(points, vector_format)
+                vector_bodies.set(key, body, SPATIAL_REBUILD_SECONDS)
+            content_type = "application/octet-stream" if vector_format == "binary" else "application/json"
+            response = current_app.response_class(body, content_type=content_type)
+            if vector_format != "json":
+                # float32 bits barely compress; don't gzip megabytes on every request
+                response.cache_control.no_transform = True
+        response.headers["X-Point-Count"] = str(len(points))
+        response.set_etag(etag, weak=True)
+        response.cache_control.no_cache = True
+        return response
 
     except Exception as e:
+        logger.exception("Error in get_study_spot_vectors")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
 
+# Helper function to serialize a PackedPoints snapshot: the binary body is the lat array
+# followed by the lng array; columnar JSON carries each array base64 encoded
+def build_vectors_body(points, vector_format):
+    if vector_format == "json":
+        _, lat, lng = points.columns()
+        vectors = [{"lat": a, "lng": b} for a, b in zip(lat.tolist(), lng.tolist())]
+        return json.dumps({"vectors": vectors}, separators=(",", ":")).encode("utf-8")
+    export = points.export()
+    if vector_format == "binary":
+        return export["lat"] + export["lng"]
+    return json.dumps({
+        "format": "columnar",
+        "dtype": "<f4",
+        "count": export["count"],
+        "lat": base64.b64encode(export["lat"]).decode("ascii"),
+        "lng": base64.b64encode(export["lng"]).decode("ascii")
+    }, separators=(",", ":")).encode("utf-8")
+
 # NEW ENDPOINT FOR REVIEWS
-@app.route("/api/add_review", methods=['POST'])
+@api.route("/api/add_review", methods=['POST'])
 def add_review():
     try:
         data = request.get_json()
@@ -323,19 +618,21 @@ def add_review():
         # Add timestamp for creation/update
         data["created_at"] = dt.utcnow()
         
-        # Initialize likes and dislikes arrays
+        # Initialize likes and dislikes arrays and their counters
         data["likes"] = []
         data["dislikes"] = []
+        data["likes_count"] = 0
+        data["dislikes_count"] = 0
         
         # Check if review already exists
         existing_review = mongo.db.reviews.find_one({
             "user_email": data["user_email"],
             "location_id": data["location_id"]
-        })
+        }, {"_id": 1})
         
         if existing_review:
-            # Update existing review
-            result = mongo.db.reviews.update_one(
+            # Update existing review, reading back its previous scores for the location stats
+            previous_review = mongo.db.reviews.find_one_and_update(
                 {
                     "user_email": data["user_email"],
                     "location_id": data["location_id"]
@@ -349,15 +646,19 @@ def add_review():
                     "comment": data.get("comment", ""),
                     "updated_at": dt.utcnow()
                     # Don't reset likes/dislikes when updating
-                }}
+                }},
+                projection={field: 1 for field in RATING_FIELDS},
+                return_document=ReturnDocument.BEFORE
             )
             
-            if result.modified_count == 1:
+            if previous_review:
+                apply_review_change(mongo.db, data["location_id"], new_review=data, old_review=previous_review)
+                
                 # Get the updated review
                 updated_review = mongo.db.reviews.find_one({
                     "user_email": data["user_email"],
                     "location_id": data["location_id"]
-                })
+                }, REVIEW_FIELDS)
                 
                 # Convert ObjectId to string
                 updated_review["_id"] = str(updated_review["_id"])
@@ -371,10 +672,13 @@ def add_review():
         else:
             # Insert new review
             result = mongo.db.reviews.insert_one(data)
+            review_count_cache.delete(data["location_id"])
             
             if result.inserted_id:
+                apply_review_change(mongo.db, data["location_id"], new_review=data)
+                
                 # Get the inserted review
-                new_review = mongo.db.reviews.find_one({"_id": result.inserted_id})
+                new_review = mongo.db.reviews.find_one({"_id": result.inserted_id}, REVIEW_FIELDS)
                 
                 # Convert ObjectId to string
                 new_review["_id"] = str(new_review["_id"])
@@ -387,10 +691,11 @@ def add_review():
                 return jsonify({"errors": {"general": "Failed to add review"}}), 500
                 
     except Exception as e:
+        logger.exception("Error in add_review")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
 
 # NEW ENDPOINT FOR FETCHING A REVIEW
-@app.route("/api/get_review", methods=['GET'])
+@api.route("/api/get_review", methods=['GET'])
 def get_review():
     try:
         user_email = request.args.get("user_email")
@@ -402,33 +707,35 @@ def get_review():
         if location_id.isdigit():
             location_id = int(location_id)
         
-        review = mongo.db.reviews.find_one({"user_email": user_email, "location_id": location_id})
+        review = mongo.db.reviews.find_one({"user_email": user_email, "location_id": location_id}, REVIEW_FIELDS)
         if review:
             review["_id"] = str(review["_id"])
             return jsonify({"review": review}), 200
         else:
             return jsonify({"review": None}), 200
     except Exception as e:
+        logger.exception("Error in get_review")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
 
 # New endpoint to get all reviews for a user
-@app.route("/api/get_user_reviews", methods=['GET'])
+@api.route("/api/get_user_reviews", methods=['GET'])
 def get_user_reviews():
     try:
         user_email = request.args.get("user_email")
         if not user_email:
             return jsonify({"errors": {"general": "Missing required query parameter: user_email"}}), 400
         
-        reviews = list(mongo.db.reviews.find({"user_email": user_email}))
+        reviews = list(mongo.db.reviews.find({"user_email": user_email}, REVIEW_FIELDS))
         for review in reviews:
             review["_id"] = str(review["_id"])
         
         return jsonify({"reviews": reviews}), 200
     except Exception as e:
+        logger.exception("Error in get_user_reviews")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
 
 # Endpoint to get all reviews for a location
-@app.route("/api/get_location_reviews", methods=['GET'])
+@api.route("/api/get_location_reviews", methods=['GET'])
 def get_location_reviews():
     try:
         location_id = request.args.get("location_id")
@@ -436,52 +743,43 @@ def get_location_reviews():
             return jsonify({"errors": {"general": "Missing required query parameter: location_id"}}), 400
         
         # Get pagination parameters
-        page = request.args.get("page", 0, type=int)
-        limit = request.args.get("limit", 10, type=int)
+        limit = max(1, min(request.args.get("limit", 10, type=int), MAX_REVIEW_PAGE_SIZE))
+        cursor = request.args.get("cursor")
+        page = request.args.get("page", type=int)
+        include_total = request.args.get("include_total", "").lower() in ("1", "true")
         
         # Get sorting parameters
         sort_by = request.args.get("sort_by", "created_at")  # Default sort by creation date
-        sort_order = request.args.get("sort_order", "-1")  # Default newest first
-        sort_order = int(sort_order)
+        sort_order = request.args.get("sort_order", -1, type=int)  # Default newest first
+        if sort_by not in REVIEW_SORT_KEYS or sort_order not in (1, -1):
+            return jsonify({"errors": {"general": f"sort_by must be one of {', '.join(REVIEW_SORT_KEYS)} and sort_order 1 or -1"}}), 400
         
         # Ensure location_id is in the correct format
         if location_id.isdigit():
             location_id = int(location_id)
         
-        # Apply pagination
-        skip = page * limit
-        
-        # Find reviews with pagination
-        reviews_cursor = mongo.db.reviews.find({"location_id": location_id})
-        
-        # Apply sorting
-        if sort_by == "likes":
-            # Sort by number of likes (most liked first if sort_order is -1)
-            pipeline = [
-                {"$match": {"location_id": location_id}},
-                {"$addFields": {"likes_count": {"$size": {"$ifNull": ["$likes", []]}}}},
-                {"$sort": {"likes_count": sort_order, "created_at": -1}},  # Secondary sort by date
-                {"$skip": skip},
-                {"$limit": limit}
-            ]
-            reviews = list(mongo.db.reviews.aggregate(pipeline))
-            
-            # Count total documents for pagination
-            total_count = mongo.db.reviews.count_documents({"location_id": location_id})
-        else:
-            # Sort by date or other fields directly
-            reviews_cursor = reviews_cursor.sort(sort_by, sort_order)
-            
-            # Get total count before applying pagination
-            total_count = mongo.db.reviews.count_documents({"location_id": location_id})
-            
-            # Apply pagination
-            reviews_cursor = reviews_cursor.skip(skip).limit(limit)
-            
-            # Convert cursor to list
-            reviews = list(reviews_cursor)
-        
-        # Convert ObjectIds to strings and add user info
+        # Page on (sort key, _id); _id breaks ties so every review has one position
+        sort_field = REVIEW_SORT_KEYS[sort_by]
+        query = {"location_id": location_id}
+        if cursor:
+            try:
+                key, review_id = decode_review_cursor(cursor, sort_by, sort_order)
+            except ValueError as e:
+                return jsonify({"errors": {"cursor": str(e)}}), 400
+            query.update(reviews_after(sort_field, sort_order, key, review_id))
+        
+        reviews_cursor = mongo.db.reviews.find(query, REVIEW_FIELDS).sort([(sort_field, sort_order), ("_id", sort_order)])
+        if page and not cursor:
+            # Older clients still page by number
+            reviews_cursor = reviews_cursor.skip(page * limit)
+        
+        # One extra review tells whether there is another page without counting
+        reviews = list(reviews_cursor.limit(limit + 1))
+        has_more = len(reviews) > limit
+        reviews = reviews[:limit]
+        next_cursor = encode_review_cursor(sort_by, sort_order, reviews[-1]) if has_more else None
+        
+        # Convert ObjectIds to strings and format counts and dates
         for review in reviews:
             # Convert ObjectId to string
             review["_id"] = str(review["_id"])
@@ -498,31 +796,83 @@ def get_location_reviews():
             if "updated_at" in review:
                 if isinstance(review["updated_at"], dt):
                     review["updated_at"] = review["updated_at"].isoformat()
-            
-            # Try to get the user's information from the users collection
-            if "user_email" in review:
-                user = mongo.db.users.find_one({"email": review["user_email"]})
-                if user:
-                    # Add username
-                    if "username" in user:
-                        review["user_name"] = user["username"]
-                    
-                    # Add profile picture if available
-                    if "profile_picture" in user:
-                        review["profile_picture"] = user["profile_picture"]
         
-        return jsonify({
+        # Add user info for all reviews on the page in a single round trip
+        attach_review_authors(reviews)
+        
+        result = {
             "reviews": reviews,
-            "total_count": total_count,
-            "page": page,
             "limit": limit,
-            "has_more": skip + len(reviews) < total_count
-        }), 200
+            "has_more": has_more,
+            "next_cursor": next_cursor
+        }
+        if page is not None:
+            result["page"] = page
+        if include_total:
+            result["total_count"] = location_review_count(location_id)
+        return jsonify(result), 200
     except Exception as e:
+        logger.exception("Error in get_location_reviews")
+        return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
+
+# Most locations one location_stats or locations/summary request may ask for
+MAX_STATS_LOCATIONS = 500
+
+# Helper function to validate a batch of location_ids and put them in the format reviews store
+def requested_location_ids(data):
+    """
+    Returns a dict of each requested id, as a string, to the id reviews are
+    stored under. Raises ValueError if location_ids is missing or too long.
+    """
+    location_ids = data.get("location_ids")
+    if not isinstance(location_ids, list) or not location_ids:
+        raise ValueError("location_ids must be a non-empty list")
+    if len(location_ids) > MAX_STATS_LOCATIONS:
+        raise ValueError(f"At most {MAX_STATS_LOCATIONS} locations per request")
+    
+    # Ensure location_ids are in the correct format, as in get_location_reviews
+    normalized = {}
+    for location_id in location_ids:
+        key = str(location_id)
+        normalized[key] = int(key) if key.isdigit() else location_id
+    return normalized
+
+# Endpoint to get review counts and average scores for many locations at once
+@api.route("/api/location_stats", methods=['POST'])
+def location_stats():
+    try:
+        try:
+            normalized = requested_location_ids(request.get_json(silent=True) or {})
+        except ValueError as e:
+            return jsonify({"errors": {"location_ids": str(e)}}), 400
+        
+        stats = get_location_stats(mongo.db, list(dict.fromkeys(normalized.values())))
+        return jsonify({"stats": {key: stats[location_id] for key, location_id in normalized.items()}}), 200
+    except Exception as e:
+        logger.exception("Error in location_stats")
+        return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
+
+# Endpoint to summarize every marker in the map viewport in one request: review
+# stats plus the requesting user's bookmark and review status
+@api.route("/api/locations/summary", methods=['POST'])
+def locations_summary():
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            normalized = requested_location_ids(data)
+        except ValueError as e:
+            return jsonify({"errors": {"location_ids": str(e)}}), 400
+        
+        summaries = summarize_locations(mongo.db, list(dict.fromkeys(normalized.values())), data.get("user_email"))
+        if summaries is None:
+            return jsonify({"errors": {"general": "User not found"}}), 404
+        return jsonify({"locations": {key: summaries[location_id] for key, location_id in normalized.items()}}), 200
+    except Exception as e:
+        logger.exception("Error in locations_summary")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
 
 # New endpoint to like or dislike a review
-@app.route("/api/rate_review", methods=['POST'])
+@api.route("/api/rate_review", methods=['POST'])
 def rate_review():
     try:
         data = request.get_json()
@@ -542,84 +892,53 @@ def rate_review():
         user_email = data["user_email"]
         action = data["action"]  # 'like' or 'dislike' or 'remove'
         
-        from bson.objectid import ObjectId
-        
-        # First get the review to check current state
-        review = mongo.db.reviews.find_one({"_id": ObjectId(review_id)})
-        if not review:
-            return jsonify({"errors": {"review_id": "Review not found"}}), 404
+        if action not in VOTE_ACTIONS:
+            return jsonify({"errors": {"action": "Action must be one of: like, dislike, remove"}}), 400
         
-        # Initialize likes and dislikes if they don't exist
-        likes = review.get("likes", [])
-        dislikes = review.get("dislikes", [])
-        
-        # Update based on action
-        if action == "like":
-            # Remove from dislikes if present
-            if user_email in dislikes:
-                dislikes.remove(user_email)
-            
-            # Add to likes if not already there
-            if user_email not in likes:
-                likes.append(user_email)
-        
-        elif action == "dislike":
-            # Remove from likes if present
-            if user_email in likes:
-                likes.remove(user_email)
-            
-            # Add to dislikes if not already there
-            if user_email not in dislikes:
-                dislikes.append(user_email)
-        
-        elif action == "remove":
-            # Remove from both lists
-            if user_email in likes:
-                likes.remove(user_email)
-            if user_email in dislikes:
-                dislikes.remove(user_email)
-        
-        # Update the review
-        result = mongo.db.reviews.update_one(
-            {"_id": ObjectId(review_id)},
-            {"$set": {
-                "likes": likes,
-                "dislikes": dislikes
-            }}
+        # Apply the vote atomically; the filter only matches when the vote changes something
+        vote_filter, vote_pipeline = VOTE_ACTIONS[action](user_email)
+        review = mongo.db.reviews.find_one_and_update(
+            {"_id": ObjectId(review_id), **vote_filter},
+            vote_pipeline,
+            projection={"likes_count": 1, "dislikes_count": 1},
+            return_document=ReturnDocument.AFTER
         )
         
-        if result.modified_count == 1:
+        if review:
             return jsonify({
                 "message": f"Review {action} successful",
-                "likes_count": len(likes),
-                "dislikes_count": len(dislikes)
+                "likes_count": review["likes_count"],
+                "dislikes_count": review["dislikes_count"]
             }), 200
-        else:
-            return jsonify({"message": "No changes were made"}), 200
+        
+        # Nothing matched: either the review is missing or the vote is already in place
+        if not mongo.db.reviews.count_documents({"_id": ObjectId(review_id)}, limit=1):
+            return jsonify({"errors": {"review_id": "Review not found"}}), 404
+        return jsonify({"message": "No changes were made"}), 200
             
     except Exception as e:
+        logger.exception("Error in rate_review")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
 
 # Endpoint to get user data
-@app.route("/api/get_user", methods=['GET'])
+@api.route("/api/get_user", methods=['GET'])
 def get_user():
     try:
         user_email = request.args.get("email")
         if not user_email:
             return jsonify({"errors": {"general": "Missing required query parameter: email"}}), 400
         
-        user = mongo.db.users.find_one({"email": user_email})
+        # Never read the password hash out of the database
+        user = mongo.db.users.find_one({"email": user_email}, {"password": 0})
         if user:
-            # Remove sensitive information
             if "_id" in user:
                 user["_id"] = str(user["_id"])
-            if "password" in user:
-                del user["password"]
             
             return jsonify({"user": user}), 200
         else:
             return jsonify({"user": None}), 404
     except Exception as e:
+        logger.exception("Error in get_user")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
 
 # Helper function to save file to GridFS
@@ -627,17 +946,20 @@ def save_file_to_gridfs(file):
     if file and file.filename and allowed_file(file.filename):
         # Generate a unique filename
         filename = secure_filename(file.filename)
+        data = file.stream.read()
         # Store file in GridFS
         file_id = fs.put(
-            file.stream.read(), 
+            data, 
             filename=filename,
             content_type=file.content_type
         )
+        # Store resized variants so avatars don't have to send the original
+        store_thumbnails(fs, file_id, data, filename)
         return str(file_id)
     return None
 
 # Endpoint to update user profile
-@app.route("/api/update_profile", methods=['POST'])
+@api.route("/api/update_profile", methods=['POST'])
 def update_profile():
     try:
         # Get email from form data
@@ -646,7 +968,7 @@ def update_profile():
             return jsonify({"errors": {"email": "Email is required"}}), 400
         
         # Find the user in the database
-        user = mongo.db.users.find_one({"email": email})
+        user = mongo.db.users.find_one({"email": email}, {"_id": 1})
         if not user:
             return jsonify({"errors": {"email": "User not found"}}), 404
         
@@ -677,12 +999,10 @@ def update_profile():
             )
             
             # Get the updated user data
-            updated_user = mongo.db.users.find_one({"_id": user["_id"]})
+            updated_user = mongo.db.users.find_one({"_id": user["_id"]}, {"password": 0})
             if updated_user:
                 if "_id" in updated_user:
                     updated_user["_id"] = str(updated_user["_id"])
-                if "password" in updated_user:
-                    del updated_user["password"]
                 
                 return jsonify({
                     "message": "Profile updated successfully",
@@ -692,61 +1012,351 @@ def update_profile():
         return jsonify({"message": "No changes to update"}), 200
         
     except Exception as e:
+        logger.exception("Error in update_profile")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
 
-# Serve uploaded files from GridFS
-@app.route('/uploads/<file_id>')
+# Uploaded files are never modified (a new upload gets a new id), so browsers may cache them for a year
+UPLOAD_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Recently served thumbnails, keyed on (file id, size); each is a few KB
+thumbnail_cache = LRUCache(max_entries=int(os.getenv('THUMBNAIL_CACHE_ENTRIES', 2048)))
+
+# Helper function to add the ETag and long-lived caching headers to an upload response
+def set_upload_cache_headers(response, etag):
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = UPLOAD_CACHE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+# Helper function to finish an upload response, answering If-None-Match with
+# 304 and Range requests with 206/416
+def cacheable_upload_response(response, etag, length):
+    set_upload_cache_headers(response, etag)
+    return response.make_conditional(request, accept_ranges=True, complete_length=length)
+
+# Serve uploaded files from GridFS, optionally as a ?size= thumbnail
+@api.route('/uploads/<file_id>')
 def uploaded_file(file_id):
+    size = request.args.get("size", type=int)
+    if size is not None and size not in THUMBNAIL_SIZES:
+        return jsonify({"errors": {"size": f"Size must be one of: {', '.join(map(str, THUMBNAIL_SIZES))}"}}), 400
+    
+    etag = file_id if size is None else f"{file_id}-{size}"
+    # Files never change, so a matching ETag needs no database work at all
+    if request.if_none_match.contains(etag):
+        return set_upload_cache_headers(current_app.response_class(status=304), etag)
+    
     try:
         # Try to convert string ID to ObjectId
         obj_id = ObjectId(file_id)
+        
+        if size is not None:
+            thumbnail = thumbnail_cache.get((file_id, size))
+            if thumbnail is None:
+                thumbnail = get_or_create_thumbnail(fs, obj_id, size)
+                if thumbnail[0] is not None:
+                    thumbnail_cache.set((file_id, size), thumbnail)
+            data, content_type = thumbnail
+            
+            if data is not None:
+                response = current_app.response_class(data, mimetype=content_type)
+                return cacheable_upload_response(response, etag, len(data))
+            # Not an image Pillow can read, fall back to the original file
+        
         # Retrieve file from GridFS
         file = fs.get(obj_id)
-        # Create a response with the file content
-        response = app.response_class(
-            response=file.read(),
-            status=200,
-            mimetype=file.content_type
-        )
-        return response
     except Exception as e:
-        print(f"Error retrieving file: {str(e)}")
+        logger.warning("Error retrieving file", extra={"fields": {"file_id": file_id, "error": str(e)}})
         return jsonify({"error": "File not found"}), 404
+    
+    # Stream the file chunk by chunk instead of reading it into memory
+    data = wrap_file(request.environ, file, buffer_size=file.chunk_size)
+    response = current_app.response_class(data, mimetype=file.content_type, direct_passthrough=True)
+    response.content_length = file.length
+    return cacheable_upload_response(response, file_id, file.length)
+
+# Serialized /api/get_cafes responses, rebuilt once a harvest bumps the cafes
+# version (checked every CAFE_VERSION_CHECK_SECONDS) or after CAFE_CACHE_TTL
+cafe_cache = PayloadCache(
+    make_backend(max_entries=int(os.getenv('CAFE_CACHE_ENTRIES', 256))),
+    version_source=lambda: get_cafes_version(places_db),
+    ttl=float(os.getenv('CAFE_CACHE_TTL', 300)),
+    version_check_interval=float(os.getenv('CAFE_VERSION_CHECK_SECONDS', 30)),
+    precompress=precompress
+)
 
 # Endpoint to get cafes from places_db
-@app.route("/api/get_cafes", methods=['GET'])
+@api.route("/api/get_cafes", methods=['GET'])
 def get_cafes():
     try:
-        # Get all cafes from the cafes collection
-        cafes_cursor = places_db.cafes.find({})
-        
-        # Convert cursor to list and process data
-        cafes = []
-        for cafe in cafes_cursor:
-            # Format the cafe data for frontend use
-            location = {
-                "id": str(cafe["_id"]),
-                "name": cafe.get("name", "Unknown Cafe"),
-                "position": {
-                    "lat": cafe["geometry"]["location"]["lat"],
-                    "lng": cafe["geometry"]["location"]["lng"]
-                },
-                "type": "cafe",
-                "icon": cafe.get("icon", ""),
-                "icon_background_color": cafe.get("icon_background_color", ""),
-                "place_id": cafe.get("place_id", ""),
-                "rating": cafe.get("rating", 0),
-                "vicinity": cafe.get("vicinity", ""),
-                "business_status": cafe.get("business_status", "")
-            }
-            cafes.append(location)
+        # Restrict to the visible viewport when bbox or lat/lng/radius is given
+        try:
+            viewport = parse_viewport(request.args)
+        except ValueError as e:
+            return jsonify({"errors": {"general": f"Invalid viewport: {str(e)}"}}), 400
+        
+        try:
+            map_format = requested_map_format(request.args)
+        except ValueError as e:
+            return jsonify({"errors": {"format": str(e)}}), 400
+        
+        # Identical viewports share one cache entry however the args were written
+        cache_key = f"cafes:{map_format}:" + hashlib.sha1(json.dumps(viewport).encode("utf-8")).hexdigest()
+        entry = cafe_cache.get_or_build(cache_key, lambda: build_cafes_payload(viewport, map_format))
+        
+        # The payload only changes when a harvest bumps the cafes version. Plain and
+        # compressed copies share it, so it is always sent, and compared, as a weak ETag
+        if request.if_none_match.contains_weak(entry["etag"]):
+            response = current_app.response_class(status=304)
+            if len(entry["bodies"]) > 1:
+                response.vary.add("Accept-Encoding")
+        else:
+            # Served as stored: compressed once when the entry was filled
+            response = encoded_response(current_app.response_class, entry["bodies"],
+                                        request.accept_encodings, entry["content_type"])
+        response.set_etag(entry["etag"], weak=True)
+        response.cache_control.no_cache = True
+        return response
+    except Exception as e:
+        logger.exception("Error fetching cafes")
+        return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
+
+# Helper function to serialize the cafes in a viewport (None for all of them) for the map
+def build_cafes_payload(viewport, map_format="json"):
+    # Places no longer returned by Google are kept but flagged stale
+    query = {"stale": {"$ne": True}}
+    if viewport is not None:
+        # The spatial index finds the cafes in view; one indexed $in reads their fields
+        query["place_id"] = {"$in": viewport_place_ids(viewport)}
+    
+    if map_format == "columnar":
+        cafes_cursor = places_db.cafes.find(query, CAFE_COLUMNAR_FIELDS)
+        items = [{
+            "id": str(cafe["_id"]),
+            "place_id": cafe.get("place_id", ""),
+            "name": cafe.get("name", "Unknown Cafe"),
+            "lat": cafe["geometry"]["location"]["lat"],
+            "lng": cafe["geometry"]["location"]["lng"],
+            "rating": cafe.get("rating", 0)
+        } for cafe in cafes_cursor]
+        return json.dumps(to_columnar(items), separators=(",", ":")).encode("utf-8")
+    
+    # Get the matching cafes from the cafes collection
+    cafes_cursor = places_db.cafes.find(query, CAFE_MAP_FIELDS)
+    
+    # Convert cursor to list and process data
+    cafes = []
+    for cafe in cafes_cursor:
+        # Format the cafe data for frontend use
+        location = {
+            "id": str(cafe["_id"]),
+            "name": cafe.get("name", "Unknown Cafe"),
+            "position": {
+                "lat": cafe["geometry"]["location"]["lat"],
+                "lng": cafe["geometry"]["location"]["lng"]
+            },
+            "type": "cafe",
+            "icon": cafe.get("icon", ""),
+            "icon_background_color": cafe.get("icon_background_color", ""),
+            "place_id": cafe.get("place_id", ""),
+            "rating": cafe.get("rating", 0),
+            "vicinity": cafe.get("vicinity", ""),
+            "business_status": cafe.get("business_status", "")
+        }
+        cafes.append(location)
+    
+    return json.dumps({"cafes": cafes}, separators=(",", ":")).encode("utf-8")
+
+# Bookmarks data version in places_db.meta, next to the cafes version. add_bookmark and
+# remove_bookmark bump it; other workers rebuild their bookmark snapshots when it moves on
+BOOKMARKS_VERSION_ID = "bookmarks"
+BOOKMARK_VERSION_CHECK_SECONDS = float(os.getenv('BOOKMARK_VERSION_CHECK_SECONDS', 30))
+
+# Helper functions to read and bump the bookmarks data version
+def get_bookmarks_version():
+    meta = places_db.meta.find_one({"_id": BOOKMARKS_VERSION_ID}, {"version": 1})
+    return meta["version"] if meta else 0
+
+def bump_bookmarks_version():
+    meta = places_db.meta.find_one_and_update(
+        {"_id": BOOKMARKS_VERSION_ID},
+        {"$inc": {"version": 1}, "$set": {"updated_at": dt.utcnow()}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return meta["version"]
+
+# Spatial indexes shared by /api/nearby and /api/recommend: cafes keyed by place_id and
+# bookmarks keyed by _id. Writes made by this process are applied to them in place;
+# a full rebuild picks up other processes' writes (a cafes or bookmarks version bump, or SPATIAL_REBUILD_SECONDS)
+SPATIAL_REBUILD_SECONDS = float(os.getenv('SPATIAL_REBUILD_SECONDS', 300))
+cafe_index = SnapshotCache(
+    lambda: load_cafe_index(places_db),
+    version_source=lambda: get_cafes_version(places_db),
+    max_age=SPATIAL_REBUILD_SECONDS,
+    version_check_interval=float(os.getenv('CAFE_VERSION_CHECK_SECONDS', 30))
+)
+bookmark_index = SnapshotCache(
+    lambda: load_bookmark_index(mongo.db),
+    version_source=get_bookmarks_version,
+    max_age=SPATIAL_REBUILD_SECONDS,
+    version_check_interval=BOOKMARK_VERSION_CHECK_SECONDS
+)
+# Coordinates of every bookmark for /api/get_study_spot_vectors, versioned like the index
+bookmark_vectors = SnapshotCache(
+    lambda: load_bookmark_points(mongo.db),
+    version_source=get_bookmarks_version,
+    max_age=SPATIAL_REBUILD_SECONDS,
+    version_check_interval=BOOKMARK_VERSION_CHECK_SECONDS
+)
+
+# Helper function to apply a harvest to the cafe index instead of rebuilding it
+def index_saved_cafes(saved_cafes, removed_place_ids, version):
+    index = cafe_index.peek()
+    if index is None:
+        return  # Not built yet; the first lookup loads the saved cafes anyway
+    for cafe in saved_cafes:
+        location = cafe.get("geometry", {}).get("location")
+        if location and cafe.get("place_id"):
+            index.upsert(cafe["place_id"], location["lat"], location["lng"])
+    for place_id in removed_place_ids:
+        index.remove(place_id)
+    cafe_index.mark_current(version)
+
+add_cafe_listener(index_saved_cafes)
+
+# Helper function to apply this process's bookmark write, which bumped the version to
+# version, to the built bookmark snapshots instead of rebuilding them
+def apply_bookmark_write(version, apply):
+    for snapshots in (bookmark_index, bookmark_vectors):
+        points = snapshots.peek()
+        if points is None:
+            continue  # Not built yet; the first lookup reads the write anyway
+        apply(points)
+        # If another worker also wrote since the snapshot's version, keep that version
+        # so the next check rebuilds and picks up their write too
+        if snapshots.version == version - 1:
+            snapshots.mark_current(version)
+
+# Helper functions to keep the bookmark snapshots in step with add_bookmark and remove_bookmark
+def index_bookmark(bookmark_id, lat, lng):
+    version = bump_bookmarks_version()
+    try:
+        point = float(lat), float(lng)
+    except (TypeError, ValueError):
+        point = None  # Not a plottable point; load_bookmark_index skips it too
+    
+    def apply(points):
+        if point is not None:
+            points.upsert(bookmark_id, *point)
+    apply_bookmark_write(version, apply)
+
+def unindex_bookmark(bookmark_id):
+    version = bump_bookmarks_version()
+    apply_bookmark_write(version, lambda points: points.remove(bookmark_id))
+
+MAX_NEARBY_RESULTS = 100
+NEARBY_KINDS = ("cafes", "bookmarks")
+
+# Endpoint to get the study spots closest to a point
+@api.route("/api/nearby", methods=['GET'])
+def nearby():
+    try:
+        try:
+            lat = float(request.args["lat"])
+            lng = float(request.args["lng"])
+            k = int(request.args.get("k", 10))
+        except KeyError:
+            return jsonify({"errors": {"general": "Missing required query parameters: lat and lng"}}), 400
+        except ValueError:
+            return jsonify({"errors": {"general": "lat, lng and k must be numbers"}}), 400
+        kind = request.args.get("kind", "cafes")
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180 and 1 <= k <= MAX_NEARBY_RESULTS) or kind not in NEARBY_KINDS:
+            return jsonify({"errors": {"general": f"lat or lng out of range, k must be 1-{MAX_NEARBY_RESULTS} and kind one of {', '.join(NEARBY_KINDS)}"}}), 400
+        
+        # The index gives the keys and distances; one $in fetches the documents to show
+        if kind == "cafes":
+            found = cafe_index.get().nearest(lat, lng, k)
+            docs = places_db.cafes.find({"place_id": {"$in": [key for key, _ in found]}}, CAFE_MAP_FIELDS)
+            by_key = {doc["place_id"]: doc for doc in docs}
+        else:
+            found = bookmark_index.get().nearest(lat, lng, k)
+            ids = [ObjectId(key) if ObjectId.is_valid(key) else key for key, _ in found]
+            docs = bookmarks_collection.find({"_id": {"$in": ids + [key for key, _ in found]}}, BOOKMARK_FIELDS)
+            by_key = {str(doc["_id"]): doc for doc in docs}
+        
+        results = []
+        for key, distance in found:
+            doc = by_key.get(key)
+            if doc is None:
+                continue  # Deleted by another process since the index was built
+            if kind == "cafes":
+                item = {"id": str(doc["_id"]), "place_id": key, "name": doc.get("name", "Unknown Cafe"),
+                        "lat": doc["geometry"]["location"]["lat"], "lng": doc["geometry"]["location"]["lng"],
+                        "rating": doc.get("rating", 0), "vicinity": doc.get("vicinity", "")}
+            else:
+                item = bookmark_map_item(doc)
+            item["distance_m"] = round(distance, 1)
+            results.append(item)
         
-        return jsonify({"cafes": cafes}), 200
+        return jsonify({"results": results}), 200
     except Exception as e:
-        print(f"Error fetching cafes: {str(e)}")
+        logger.exception("Error in nearby")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
 
-@app.route("/api/update_weekly_goal", methods=['POST'])
+# Feature arrays of every cafe for /api/recommend, rebuilt when a harvest bumps the
+# cafes version or after RECOMMEND_REFRESH_SECONDS, which bounds how stale review scores get
+place_features = SnapshotCache(
+    lambda: load_place_features(places_db, mongo.db),
+    version_source=lambda: get_cafes_version(places_db),
+    max_age=float(os.getenv('RECOMMEND_REFRESH_SECONDS', 60)),
+    version_check_interval=float(os.getenv('CAFE_VERSION_CHECK_SECONDS', 30))
+)
+
+DEFAULT_RECOMMEND_RADIUS = 2000
+MAX_RECOMMEND_RADIUS = 50000
+MAX_RECOMMEND_LIMIT = 100
+
+# Endpoint to rank the best study spots near a point
+@api.route("/api/recommend", methods=['GET'])
+def recommend():
+    try:
+        # Get the search area and weights; each weight defaults to 1 and may be negative
+        try:
+            lat = float(request.args["lat"])
+            lng = float(request.args["lng"])
+            radius = float(request.args.get("radius", DEFAULT_RECOMMEND_RADIUS))
+            limit = int(request.args.get("limit", 10))
+            weights = {name: float(request.args.get(name, DEFAULT_WEIGHTS[name])) for name in WEIGHT_NAMES}
+        except KeyError:
+            return jsonify({"errors": {"general": "Missing required query parameters: lat and lng"}}), 400
+        except ValueError:
+            return jsonify({"errors": {"general": f"lat, lng, radius, limit and weights ({', '.join(WEIGHT_NAMES)}) must be numbers"}}), 400
+        # float() accepts nan and inf, which would make the ranking arbitrary and the JSON invalid
+        if not all(math.isfinite(value) for value in [lat, lng, radius, *weights.values()]):
+            return jsonify({"errors": {"general": f"lat, lng, radius and weights ({', '.join(WEIGHT_NAMES)}) must be finite"}}), 400
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180 and 0 < radius <= MAX_RECOMMEND_RADIUS and 1 <= limit <= MAX_RECOMMEND_LIMIT):
+            return jsonify({"errors": {"general": f"lat, lng, radius (at most {MAX_RECOMMEND_RADIUS} m) or limit (at most {MAX_RECOMMEND_LIMIT}) is out of range"}}), 400
+        
+        # The shared cafe index narrows the candidates to the search circle; when the
+        # circle holds most places, scanning every row is cheaper than mapping keys to rows
+        features = place_features.get()
+        place_ids, _ = cafe_index.get().within_radius(lat, lng, radius)
+        candidates = features.rows(place_ids) if len(place_ids) < len(features) / 20 else None
+        results = []
+        for index, score, distance in rank(features, lat, lng, radius, weights, limit, candidates):
+            place = features.describe(index)
+            place["score"] = round(score, 4)
+            place["distance_m"] = round(distance, 1)
+            results.append(place)
+        
+        return jsonify({"results": results, "weights": weights}), 200
+    except Exception as e:
+        logger.exception("Error in recommend")
+        return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
+
+@api.route("/api/update_weekly_goal", methods=['POST'])
 def update_weekly_goal():
     try:
         data = request.get_json()
@@ -766,9 +1376,10 @@ def update_weekly_goal():
         return jsonify({"message": "No changes made"}), 200
 
     except Exception as e:
+        logger.exception("Error in update_weekly_goal")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
 
-@app.route("/api/update_current_hours", methods=['POST'])
+@api.route("/api/update_current_hours", methods=['POST'])
 def update_current_hours():
     try:
         data = request.get_json()
@@ -788,9 +1399,10 @@ def update_current_hours():
         return jsonify({"message": "No changes made"}), 200
 
     except Exception as e:
+        logger.exception("Error in update_current_hours")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
 
-@app.route("/api/reset_current_hours", methods=['POST'])
+@api.route("/api/reset_current_hours", methods=['POST'])
 def reset_current_hours():
     try:
         data = request.get_json()
@@ -809,16 +1421,17 @@ def reset_current_hours():
         return jsonify({"message": "No changes made"}), 200
 
     except Exception as e:
+        logger.exception("Error in reset_current_hours")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
     
-@app.route("/api/get_weekly_goal", methods=['GET'])
+@api.route("/api/get_weekly_goal", methods=['GET'])
 def get_weekly_goal():
     try:
         email = request.args.get("email")
         if not email:
             return jsonify({"errors": {"general": "Missing email"}}), 400
 
-        user = users_collection.find_one({"email": email})
+        user = users_collection.find_one({"email": email}, {"weekly_goal_hours": 1})
         if not user:
             return jsonify({"errors": {"general": "User not found"}}), 404
 
@@ -826,16 +1439,17 @@ def get_weekly_goal():
         return jsonify({"weekly_goal_hours": goal}), 200
 
     except Exception as e:
+        logger.exception("Error in get_weekly_goal")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
     
-@app.route("/api/get_current_hours", methods=['GET'])
+@api.route("/api/get_current_hours", methods=['GET'])
 def get_current_hours():
     try:
         email = request.args.get("email")
         if not email:
             return jsonify({"errors": {"general": "Missing email"}}), 400
 
-        user = users_collection.find_one({"email": email})
+        user = users_collection.find_one({"email": email}, {"current_weekly_hours": 1})
         if not user:
             return jsonify({"errors": {"general": "User not found"}}), 404
 
@@ -843,9 +1457,10 @@ def get_current_hours():
         return jsonify({"current_weekly_hours": current}), 200
 
     except Exception as e:
+        logger.exception("Error in get_current_hours")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
 
-@app.route("/api/add_user_bookmark", methods=['POST'])
+@api.route("/api/add_user_bookmark", methods=['POST'])
 def add_user_bookmark():
     try:
         data = request.get_json()
@@ -865,10 +1480,11 @@ def add_user_bookmark():
         return jsonify({"message": "No changes made (maybe already added)"}), 200
 
     except Exception as e:
+        logger.exception("Error in add_user_bookmark")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500   
     
 
-@app.route("/api/remove_user_bookmark", methods=['POST'])
+@api.route("/api/remove_user_bookmark", methods=['POST'])
 def remove_user_bookmark():
     try:
         data = request.get_json()
@@ -878,19 +1494,16 @@ def remove_user_bookmark():
         if not email or not bookmark_id:
             return jsonify({"errors": {"general": "Missing email or bookmark_id"}}), 400
             
-        print(f"Attempting to remove bookmark {bookmark_id} for user {email}")
-        
         # Import ObjectId directly from bson 
         from bson.objectid import ObjectId
         
         # Get the user document
-        user = users_collection.find_one({"email": email})
+        user = users_collection.find_one({"email": email}, {"bookmarks": 1})
         if not user:
             return jsonify({"errors": {"general": "User not found"}}), 404
             
         # Get the current bookmarks
         current_bookmarks = user.get("bookmarks", [])
-        print(f"Current bookmarks: {current_bookmarks}")
         
         # Track if we've removed any bookmarks
         removed = False
@@ -912,7 +1525,6 @@ def remove_user_bookmark():
                 new_bookmarks.append(bid)
             else:
                 removed = True
-                print(f"Matched bookmark to remove: {bid_str} vs {bookmark_id_str}")
                 
         # Only update if we actually removed something
         if removed:
@@ -920,75 +1532,57 @@ def remove_user_bookmark():
                 {"email": email},
                 {"$set": {"bookmarks": new_bookmarks}}
             )
-            print(f"Updated user bookmarks. Modified count: {result.modified_count}")
+            logger.debug("Removed user bookmark", extra={"fields": {"bookmark_id": bookmark_id, "modified": result.modified_count}})
             return jsonify({"message": "Bookmark removed from user"}), 200
         else:
-            print(f"No matching bookmark found to remove")
+            logger.debug("No matching user bookmark to remove", extra={"fields": {"bookmark_id": bookmark_id}})
             return jsonify({"message": "No changes made - bookmark not found"}), 200
 
     except Exception as e:
-        print(f"Error removing bookmark: {str(e)}")
+        logger.exception("Error removing user bookmark")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
     
-@app.route("/api/get_user_bookmarks", methods=['GET'])
+@api.route("/api/get_user_bookmarks", methods=['GET'])
 def get_user_bookmarks():
     try:
         email = request.args.get("email")
         if not email:
             return jsonify({"errors": {"general": "Missing email"}}), 400
+        try:
+            map_format = requested_map_format(request.args)
+        except ValueError as e:
+            return jsonify({"errors": {"format": str(e)}}), 400
 
-        user = users_collection.find_one({"email": email})
+        user = users_collection.find_one({"email": email}, {"bookmarks": 1})
         if not user:
             return jsonify({"errors": {"general": "User not found"}}), 404
 
         # Get bookmark IDs from user document
-        bookmark_ids = user.get("bookmarks", [])
-        print(f"Found {len(bookmark_ids)} bookmark IDs for user {email}: {bookmark_ids}")
+        bookmark_ids = [str(bid) for bid in user.get("bookmarks", []) if bid]
         
         if not bookmark_ids:
+            if map_format == "columnar":
+                return jsonify(to_columnar([])), 200
             return jsonify({"bookmarks": []}), 200
         
-        # Import ObjectId directly from bson to avoid pymongo attribute error
-        from bson.objectid import ObjectId
+        # An ID may be a bookmark ObjectId, a bookmark string _id or a place_id,
+        # so match all three in a single round trip
+        object_ids = [ObjectId(bid) for bid in bookmark_ids if ObjectId.is_valid(bid)]
+        found = bookmarks_collection.find({"$or": [
+            {"_id": {"$in": object_ids + bookmark_ids}},
+            {"place_id": {"$in": bookmark_ids}}
+        ]}, BOOKMARK_FIELDS).batch_size(len(bookmark_ids))  # Fetch every bookmark in the first batch
         
-        # Convert string IDs to ObjectId only for valid ObjectId strings
-        object_ids = []
-        non_object_ids = []
+        # Return bookmarks in the order the user saved them, each only once
+        position = {}
+        for i, bid in enumerate(bookmark_ids):
+            position.setdefault(bid, i)
         
-        for bid in bookmark_ids:
-            try:
-                # Check if it's a valid ObjectId format
-                if bid and len(str(bid)) == 24 and all(c in '0123456789abcdefABCDEF' for c in str(bid)):
-                    object_ids.append(ObjectId(bid))
-                else:
-                    non_object_ids.append(str(bid))
-            except Exception as e:
-                print(f"Error converting ID {bid} to ObjectId: {str(e)}")
-                # If conversion fails, keep as string
-                non_object_ids.append(str(bid))
-        
-        print(f"Object IDs: {object_ids}")
-        print(f"Non-Object IDs: {non_object_ids}")
-        
-        # First, find bookmarks with ObjectIds
-        mongo_bookmarks = list(bookmarks_collection.find({"_id": {"$in": object_ids}})) if object_ids else []
-        print(f"Found {len(mongo_bookmarks)} bookmarks by ObjectId")
-        
-        # Also find bookmarks with place_id that matches non-ObjectId strings
-        place_id_bookmarks = list(bookmarks_collection.find({"place_id": {"$in": non_object_ids}})) if non_object_ids else []
-        print(f"Found {len(place_id_bookmarks)} bookmarks by place_id")
-        
-        # As a fallback, try to find by _id as string too
-        id_string_bookmarks = []
-        for bid in non_object_ids:
-            bookmark = bookmarks_collection.find_one({"_id": bid})
-            if bookmark:
-                id_string_bookmarks.append(bookmark)
-        
-        print(f"Found {len(id_string_bookmarks)} bookmarks by string _id")
-        
-        # Combine all result sets
-        bookmarks = mongo_bookmarks + place_id_bookmarks + id_string_bookmarks
+        def saved_position(bookmark):
+            keys = [str(bookmark["_id"]), bookmark.get("place_id")]
+            return min(position.get(key, len(bookmark_ids)) for key in keys)
+        
+        bookmarks = sorted(found, key=saved_position)
         
         # Process all bookmarks for response
         for b in bookmarks:
@@ -999,42 +1593,50 @@ def get_user_bookmarks():
             if "created_at" in b and isinstance(b["created_at"], dt):
                 b["created_at"] = b["created_at"].isoformat()
 
-        print(f"Returning {len(bookmarks)} total bookmarks")
+        if map_format == "columnar":
+            return jsonify(to_columnar([bookmark_map_item(b) for b in bookmarks])), 200
         return jsonify({"bookmarks": bookmarks}), 200
 
     except Exception as e:
-        print(f"Error in get_user_bookmarks: {str(e)}")
+        logger.exception("Error in get_user_bookmarks")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
     
 
-@app.route("/api/get_bookmarks", methods=['GET'])
+@api.route("/api/get_bookmarks", methods=['GET'])
 def get_bookmarks():
     try:
         user_email = request.args.get("user_email")
+        try:
+            map_format = requested_map_format(request.args)
+        except ValueError as e:
+            return jsonify({"errors": {"format": str(e)}}), 400
         
         if user_email:
             # Find the user
-            user = users_collection.find_one({"email": user_email})
+            user = users_collection.find_one({"email": user_email}, {"_id": 1})
             if not user:
                 return jsonify({"errors": {"general": "User not found"}}), 404
                 
             # Query bookmarks collection for this user's bookmarks
-            bookmarks = list(bookmarks_collection.find({"user_email": user_email}))
+            bookmarks = list(bookmarks_collection.find({"user_email": user_email}, BOOKMARK_FIELDS))
         else:
             # Find all bookmarks if no user email is provided
-            bookmarks = list(bookmarks_collection.find({}))
+            bookmarks = list(bookmarks_collection.find({}, BOOKMARK_FIELDS))
         
         # Convert ObjectIds to strings in the response
         for bookmark in bookmarks:
             if "_id" in bookmark:
                 bookmark["_id"] = str(bookmark["_id"])
         
+        if map_format == "columnar":
+            return jsonify(to_columnar([bookmark_map_item(bookmark) for bookmark in bookmarks])), 200
         return jsonify({"bookmarks": bookmarks}), 200
         
     except Exception as e:
+        logger.exception("Error in get_bookmarks")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
 
-@app.route("/api/remove_bookmark", methods=['POST'])
+@api.route("/api/remove_bookmark", methods=['POST'])
 def remove_bookmark():
     try:
         data = request.get_json()
@@ -1043,8 +1645,6 @@ def remove_bookmark():
         if not bookmark_id:
             return jsonify({"errors": {"general": "Missing bookmark_id"}}), 400
             
-        print(f"Attempting to remove bookmark {bookmark_id} from bookmarks_collection")
-        
         # Import ObjectId directly from bson
         from bson.objectid import ObjectId
         
@@ -1055,29 +1655,115 @@ def remove_bookmark():
                 # Delete by ObjectId
                 result = bookmarks_collection.delete_one({"_id": object_id})
                 if result.deleted_count > 0:
-                    print(f"Successfully removed bookmark with ObjectId: {bookmark_id}")
+                    unindex_bookmark(str(object_id))
+                    logger.debug("Removed bookmark by ObjectId", extra={"fields": {"bookmark_id": bookmark_id}})
                     return jsonify({"message": "Bookmark removed successfully"}), 200
         except Exception as e:
-            print(f"Error converting ID to ObjectId or deleting: {str(e)}")
+            logger.warning("Error deleting bookmark by ObjectId", extra={"fields": {"bookmark_id": bookmark_id, "error": str(e)}})
             # Continue with other deletion attempts
         
         # If deletion by ObjectId failed or ID format is invalid, try by place_id
-        result = bookmarks_collection.delete_one({"place_id": bookmark_id})
-        if result.deleted_count > 0:
-            print(f"Successfully removed bookmark with place_id: {bookmark_id}")
+        removed = bookmarks_collection.find_one_and_delete({"place_id": bookmark_id}, projection={"_id": 1})
+        if removed:
+            unindex_bookmark(str(removed["_id"]))
+            logger.debug("Removed bookmark by place_id", extra={"fields": {"bookmark_id": bookmark_id}})
             return jsonify({"message": "Bookmark removed successfully"}), 200
             
         # No bookmark was found to remove
-        print(f"No bookmark found to remove with ID: {bookmark_id}")
+        logger.debug("No bookmark found to remove", extra={"fields": {"bookmark_id": bookmark_id}})
         return jsonify({"message": "No bookmark found with this ID"}), 404
 
     except Exception as e:
-        print(f"Error removing bookmark from collection: {str(e)}")
+        logger.exception("Error removing bookmark from collection")
         return jsonify({"errors": {"general": f"Server error: {str(e)}"}}), 500
 
-# Run migration on app startup
-with app.app_context():
-    migrate_existing_images()
-    
+# Index creation, backfills and the migration check, run once per deploy by
+# `flask --app studyfindr startup-tasks` (or `python studyfindr.py`) rather than by
+# every worker that imports the app
+def run_startup_tasks():
+    migration = None
+    # A no-op lookup once the migration is done; until then it runs in a thread
+    if MIGRATE_IMAGES_ON_STARTUP:
+        try:
+            migration = start_image_migration(mongo.db, fs, UPLOAD_FOLDER)
+        except Exception as e:
+            logger.exception("Error starting image migration")
+    # Make sure every review has the vote counters used for sorting
+    try:
+        backfill_review_vote_counts()
+    except Exception as e:
+        logger.exception("Error backfilling review vote counts")
+    # Build the per-location review stats from reviews written before they were maintained
+    try:
+        backfill_location_stats(mongo.db)
+    except Exception as e:
+        logger.exception("Error backfilling location stats")
+    # Create the indexes every endpoint relies on
+    try:
+        index_results = ensure_indexes(mongo.db, places_db)
+        for error in index_results["errors"]:
+            logger.error("Error creating index", extra={"fields": {"error": error}})
+    except Exception as e:
+        logger.exception("Error creating indexes")
+    return migration
+
+@click.command("startup-tasks")
+@with_appcontext
+def startup_tasks_command():
+    """Create indexes, run the backfills and finish the image migration."""
+    migration = run_startup_tasks()
+    if migration is not None:
+        migration.join()
+
+def create_app(config=None):
+    """
+    Builds the Flask app. No MongoDB connection is made and no thread is
+    started here: the shared client is created by the first request that needs
+    it, in the process that serves it, so the app is safe to create before
+    forking. Startup tasks run separately, with the startup-tasks command.
+
+    Args:
+        config (dict, optional): Settings overriding the environment defaults, e.g.
+            MONGO_URI, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE
+
+    Returns:
+        Flask: The configured app
+    """
+    app = Flask(__name__)
+    CORS(app)
+
+    app.config["MONGO_URI"] = os.getenv('MONGO_URI')
+    app.config["MONGO_MAX_POOL_SIZE"] = int(os.getenv('MONGO_MAX_POOL_SIZE', 100))
+    app.config["MONGO_MIN_POOL_SIZE"] = int(os.getenv('MONGO_MIN_POOL_SIZE', 0))
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
+    app.config.update(config or {})
+
+    clients.configure(
+        uri=app.config["MONGO_URI"],
+        max_pool_size=app.config["MONGO_MAX_POOL_SIZE"],
+        min_pool_size=app.config["MONGO_MIN_POOL_SIZE"]
+    )
+    # Create uploads directory if it doesn't exist
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    app.register_blueprint(api)
+    register_compression(app)
+    app.cli.add_command(startup_tasks_command)
+    logger.info("App created", extra={"fields": {
+        "cwd": os.getcwd(),
+        "mongo_uri_loaded": bool(app.config["MONGO_URI"]),
+        "max_pool_size": app.config["MONGO_MAX_POOL_SIZE"]
+    }})
+    return app
+
+# Module-level app for `flask run`, gunicorn studyfindr:app and the tests
+app = create_app()
+
 if __name__ == "__main__":
+    # The development server is a single process, so it runs the startup tasks
+    # itself; the reloader's child would only repeat them on every reload
+    if not os.environ.get("WERKZEUG_RUN_MAIN"):
+        with app.app_context():
+            run_startup_tasks()
     app.run(debug=True)
\ No newline at end of file
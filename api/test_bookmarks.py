@@ -0,0 +1,60 @@
+import pytest
+from datetime import datetime as dt
+from studyfindr import app, mongo
+
+EMAIL = "bookmarktest@example.com"
+
+@pytest.fixture
+def client():
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        yield client
+
+@pytest.fixture
+def saved_bookmarks():
+    mongo.db.users.delete_many({"email": EMAIL})
+    mongo.db.bookmarks.delete_many({"user_email": EMAIL})
+    first = mongo.db.bookmarks.insert_one({
+        "name": "By place_id", "place_id": "test-bookmark-place", "user_email": EMAIL,
+        "coordinates": {"lat": 29.64, "lng": -82.35}, "created_at": dt.utcnow()
+    }).inserted_id
+    second = mongo.db.bookmarks.insert_one({
+        "name": "By ObjectId", "user_email": EMAIL, "coordinates": {"lat": 29.65, "lng": -82.34}
+    }).inserted_id
+    third = mongo.db.bookmarks.insert_one({
+        "_id": "test-bookmark-string-id", "name": "By string _id", "user_email": EMAIL,
+        "coordinates": {"lat": 29.66, "lng": -82.33}
+    }).inserted_id
+    mongo.db.users.insert_one({
+        "username": "bookmarktest", "email": EMAIL,
+        # Saved in this order, with a duplicate and a dangling ID
+        "bookmarks": [str(second), "test-bookmark-place", third, str(second), "000000000000000000000000"]
+    })
+    yield [second, first, third]
+    mongo.db.users.delete_many({"email": EMAIL})
+    mongo.db.bookmarks.delete_many({"user_email": EMAIL})
+
+def test_get_user_bookmarks_in_saved_order(client, saved_bookmarks):
+    response = client.get(f"/api/get_user_bookmarks?email={EMAIL}")
+    assert response.status_code == 200
+
+    bookmarks = response.json["bookmarks"]
+    assert [b["_id"] for b in bookmarks] == [str(bid) for bid in saved_bookmarks]
+    assert bookmarks[0]["position"] == {"lat": 29.65, "lng": -82.34}
+
+def test_get_user_bookmarks_columnar(client, saved_bookmarks):
+    response = client.get(f"/api/get_user_bookmarks?email={EMAIL}&format=columnar")
+    assert response.status_code == 200
+
+    columns = response.json
+    assert columns["count"] == 3
+    assert columns["ids"] == [str(bid) for bid in saved_bookmarks]
+    assert columns["lat"] == [29.65, 29.64, 29.66]
+    assert columns["lng"] == [-82.34, -82.35, -82.33]
+
+def test_get_bookmarks_projects_fields(client, saved_bookmarks):
+    bookmarks = client.get(f"/api/get_bookmarks?user_email={EMAIL}").json["bookmarks"]
+    assert len(bookmarks) == 3
+    assert all("user_email" not in b for b in bookmarks)
+
+    assert client.get(f"/api/get_bookmarks?user_email={EMAIL}&format=csv").status_code == 400
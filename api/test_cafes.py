@@ -0,0 +1,182 @@
+import pytest
+import studyfindr
+from studyfindr import app, places_db, parse_viewport, cafe_cache, cafe_index
+from googlemaps import add_geo_point, save_cafes_to_mongodb, save_cafes_incremental, bump_cafes_version
+from cache import PayloadCache, SharedBackend, InMemoryStore
+
+@pytest.fixture
+def client():
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        yield client
+
+@pytest.fixture
+def viewport_cafes():
+    cafes = [
+        {"place_id": "test-viewport-inside", "name": "Inside Cafe",
+         "geometry": {"location": {"lat": 29.6456, "lng": -82.3519}}},
+        {"place_id": "test-viewport-outside", "name": "Outside Cafe",
+         "geometry": {"location": {"lat": 30.3322, "lng": -81.6557}}}
+    ]
+    place_ids = [cafe["place_id"] for cafe in cafes]
+    places_db.cafes.delete_many({"place_id": {"$in": place_ids}})
+    places_db.cafes.insert_many([add_geo_point(cafe) for cafe in cafes])
+    # Written directly rather than by a harvest, so invalidate cached payloads by hand
+    bump_cafes_version(places_db)
+    cafe_cache.invalidate()
+    cafe_index.invalidate()
+    yield place_ids
+    places_db.cafes.delete_many({"place_id": {"$in": place_ids}})
+    bump_cafes_version(places_db)
+
+def test_get_cafes_bbox(client, viewport_cafes):
+    response = client.get("/api/get_cafes?bbox=-82.40,29.60,-82.30,29.70")
+    assert response.status_code == 200
+    place_ids = {cafe["place_id"] for cafe in response.json["cafes"]}
+    assert "test-viewport-inside" in place_ids
+    assert "test-viewport-outside" not in place_ids
+
+def test_get_cafes_radius(client, viewport_cafes):
+    response = client.get("/api/get_cafes?lat=29.6456&lng=-82.3519&radius=2000")
+    assert response.status_code == 200
+    place_ids = {cafe["place_id"] for cafe in response.json["cafes"]}
+    assert "test-viewport-inside" in place_ids
+    assert "test-viewport-outside" not in place_ids
+
+def test_get_cafes_invalid_viewport(client):
+    assert client.get("/api/get_cafes?bbox=1,2,3").status_code == 400
+    assert client.get("/api/get_cafes?lat=29.6&lng=-82.3").status_code == 400
+    assert client.get("/api/get_cafes?bbox=-82.3,29.6,-82.4,29.7").status_code == 400
+
+def test_get_cafes_served_from_cache(client, viewport_cafes, monkeypatch):
+    builds = []
+    build_cafes_payload = studyfindr.build_cafes_payload
+    monkeypatch.setattr(studyfindr, "build_cafes_payload", lambda query, map_format: builds.append(query) or build_cafes_payload(query, map_format))
+    monkeypatch.setattr(cafe_cache, "version_check_interval", 0)
+
+    first = client.get("/api/get_cafes")
+    second = client.get("/api/get_cafes")
+    assert first.status_code == second.status_code == 200
+    assert first.data == second.data
+    assert len(builds) == 1
+
+    # A client holding the current payload gets a 304 without a body
+    revalidated = client.get("/api/get_cafes", headers={"If-None-Match": first.headers["ETag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b""
+
+    # A harvest bumps the version, which invalidates the entry and the ETag
+    save_cafes_to_mongodb([{"place_id": "test-viewport-inside", "name": "Renamed Cafe",
+                            "geometry": {"location": {"lat": 29.6456, "lng": -82.3519}}}], places_db=places_db)
+    third = client.get("/api/get_cafes", headers={"If-None-Match": first.headers["ETag"]})
+    assert third.status_code == 200
+    assert len(builds) == 2
+    assert "Renamed Cafe" in {cafe["name"] for cafe in third.json["cafes"]}
+
+def test_get_cafes_columnar(client, viewport_cafes):
+    response = client.get("/api/get_cafes?format=columnar")
+    assert response.status_code == 200
+    columns = response.json
+    assert columns["format"] == "columnar"
+    # Parallel arrays, one entry per cafe
+    assert {len(columns[key]) for key in ("ids", "place_ids", "names", "lat", "lng", "rating")} == {columns["count"]}
+    i = columns["place_ids"].index("test-viewport-inside")
+    assert (columns["names"][i], columns["lat"][i], columns["lng"][i]) == ("Inside Cafe", 29.6456, -82.3519)
+
+    assert client.get("/api/get_cafes?format=xml").status_code == 400
+
+def test_get_cafes_projects_map_fields(client, viewport_cafes):
+    places_db.cafes.update_one({"place_id": "test-viewport-inside"},
+                               {"$set": {"photos": [{"photo_reference": "x" * 200}], "reviews": ["long text"]}})
+    bump_cafes_version(places_db)
+    cafe_cache.invalidate()
+
+    cafe = next(cafe for cafe in client.get("/api/get_cafes").json["cafes"]
+                if cafe["place_id"] == "test-viewport-inside")
+    assert "photos" not in cafe and "reviews" not in cafe
+
+def test_payload_cache_shared_backend():
+    store = InMemoryStore()
+    version = [1]
+    builds = []
+    def build():
+        builds.append(1)
+        return b'{"cafes":[]}'
+    # Two workers sharing one store
+    workers = [PayloadCache(SharedBackend(store), lambda: version[0], version_check_interval=0) for _ in range(2)]
+
+    first = workers[0].get_or_build("cafes:all", build)
+    second = workers[1].get_or_build("cafes:all", build)
+    assert second == first
+    assert len(builds) == 1
+
+    version[0] = 2
+    assert workers[1].get_or_build("cafes:all", build)["etag"] != first["etag"]
+    assert len(builds) == 2
+
+def test_parse_viewport_defaults_to_all():
+    assert parse_viewport({}) is None
+    assert parse_viewport({"lat": "29.6", "lng": "-82.3", "radius": "500"}) == ("radius", (29.6, -82.3, 500.0))
+
+def test_save_cafes_bulk_upsert():
+    place_ids = [f"test-bulk-{i}" for i in range(5)]
+    places_db.cafes.delete_many({"place_id": {"$in": place_ids}})
+    cafes = [
+        {"place_id": place_id, "name": f"Bulk Cafe {i}", "rating": 4.0,
+         "geometry": {"location": {"lat": 29.6 + i / 100, "lng": -82.3}}}
+        for i, place_id in enumerate(place_ids)
+    ]
+
+    try:
+        success, message = save_cafes_to_mongodb(cafes, places_db=places_db, batch_size=2)
+        assert success, message
+        assert "Inserted: 5, Updated: 0" in message
+
+        cafes[0]["rating"] = 4.5
+        success, message = save_cafes_to_mongodb(cafes, places_db=places_db, batch_size=2)
+        assert success, message
+        assert "Inserted: 0, Updated: 5" in message
+
+        assert places_db.cafes.count_documents({"place_id": {"$in": place_ids}}) == 5
+        stored = places_db.cafes.find_one({"place_id": place_ids[0]})
+        assert stored["rating"] == 4.5
+        assert stored["geo_point"]["coordinates"] == [-82.3, 29.6]
+    finally:
+        places_db.cafes.delete_many({"place_id": {"$in": place_ids}})
+
+def test_save_cafes_incremental():
+    place_ids = [f"test-incremental-{i}" for i in range(4)]
+    scope = {"place_id": {"$in": place_ids}}
+    places_db.cafes.delete_many(scope)
+
+    def harvest():
+        return [
+            {"place_id": place_id, "name": f"Incremental Cafe {i}", "rating": 4.0,
+             "geometry": {"location": {"lat": 29.6, "lng": -82.3 + i / 100}}}
+            for i, place_id in enumerate(place_ids)
+        ]
+
+    try:
+        success, message, counts = save_cafes_incremental(harvest()[:3], scope=scope, places_db=places_db)
+        assert success, message
+        assert counts == {"new": 3, "updated": 0, "unchanged": 0, "stale": 0}
+
+        # Second run: one changed, one unchanged, one new, one gone
+        cafes = harvest()[1:]
+        cafes[0]["rating"] = 4.8
+        success, message, counts = save_cafes_incremental(cafes, scope=scope, places_db=places_db)
+        assert success, message
+        assert counts == {"new": 1, "updated": 1, "unchanged": 1, "stale": 1}
+
+        assert places_db.cafes.find_one({"place_id": place_ids[0]})["stale"] is True
+        assert places_db.cafes.find_one({"place_id": place_ids[1]})["rating"] == 4.8
+        assert places_db.cafes.count_documents({**scope, "stale": False}) == 3
+
+        # A full save brings the stale place back
+        success, message = save_cafes_to_mongodb(harvest()[:1], places_db=places_db)
+        assert success, message
+        restored = places_db.cafes.find_one({"place_id": place_ids[0]})
+        assert restored["stale"] is False
+        assert "stale_since" not in restored
+    finally:
+        places_db.cafes.delete_many(scope)
@@ -0,0 +1,41 @@
+import os
+import threading
+import clients
+from studyfindr import create_app, mongo, places_db
+
+def test_create_app_does_not_connect(monkeypatch):
+    monkeypatch.setattr(clients, "_client", None)
+    monkeypatch.setattr(clients, "_client_pid", None)
+    monkeypatch.setattr(clients, "_fs", None)
+    monkeypatch.setattr(clients, "_settings", dict(clients._settings))
+
+    threads = threading.active_count()
+    app = create_app({"MONGO_MAX_POOL_SIZE": 7})
+    assert clients._client is None
+    assert threading.active_count() == threads
+    assert app.config["MONGO_MAX_POOL_SIZE"] == 7
+    assert "/api/get_cafes" in {rule.rule for rule in app.url_map.iter_rules()}
+
+def test_startup_tasks_command(monkeypatch):
+    import studyfindr
+    ran = []
+    monkeypatch.setattr(studyfindr, "run_startup_tasks", lambda: ran.append(True))
+    result = studyfindr.app.test_cli_runner().invoke(args=["startup-tasks"])
+    assert result.exit_code == 0
+    assert ran == [True]
+
+def test_one_client_serves_both_databases():
+    assert mongo.db.client is places_db.client
+    assert mongo.cx is clients.get_client()
+
+def test_forked_process_gets_its_own_client(monkeypatch):
+    parent_client = clients.get_client()
+    monkeypatch.setattr(clients, "_client", parent_client)
+    monkeypatch.setattr(clients, "_client_pid", clients._client_pid)
+    monkeypatch.setattr(clients, "_fs", clients._fs)
+
+    # Same process: the client is reused
+    assert clients.get_client() is parent_client
+    # After a fork the pid changes and a fresh client is created
+    monkeypatch.setattr(os, "getpid", lambda: -1)
+    assert clients.get_client() is not parent_client
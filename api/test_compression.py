@@ -0,0 +1,74 @@
+import gzip
+import json
+import pytest
+from studyfindr import app, places_db, cafe_cache
+from googlemaps import add_geo_point, bump_cafes_version
+from compression import compress_response, COMPRESSION_MIN_SIZE
+
+PLACE_IDS = [f"test-compression-{i}" for i in range(100)]
+
+@pytest.fixture
+def client():
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        yield client
+
+@pytest.fixture
+def many_cafes():
+    places_db.cafes.delete_many({"place_id": {"$in": PLACE_IDS}})
+    places_db.cafes.insert_many([
+        add_geo_point({"place_id": place_id, "name": f"Compression Cafe {i}", "vicinity": "Compression Street",
+                       "geometry": {"location": {"lat": 29.6 + i * 1e-4, "lng": -82.3}}})
+        for i, place_id in enumerate(PLACE_IDS)
+    ])
+    bump_cafes_version(places_db)
+    cafe_cache.invalidate()
+    yield
+    places_db.cafes.delete_many({"place_id": {"$in": PLACE_IDS}})
+    bump_cafes_version(places_db)
+
+def test_cached_cafes_served_precompressed(client, many_cafes):
+    plain = client.get("/api/get_cafes")
+    compressed = client.get("/api/get_cafes", headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in plain.headers
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+    assert gzip.decompress(compressed.data) == plain.data
+    assert len(compressed.data) < len(plain.data) / 4
+
+    # Every response carries the same weak ETag, 304s included
+    assert compressed.headers["ETag"].startswith('W/')
+    assert plain.headers["ETag"] == compressed.headers["ETag"]
+    revalidated = client.get("/api/get_cafes", headers={"Accept-Encoding": "gzip",
+                                                        "If-None-Match": compressed.headers["ETag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["ETag"] == compressed.headers["ETag"]
+
+def test_large_json_compressed_on_the_fly():
+    body = {"items": [{"name": f"Item {i}", "description": "repetitive " * 5} for i in range(50)]}
+    with app.test_request_context(headers={"Accept-Encoding": "gzip"}) as context:
+        response = app.response_class(json.dumps(body), mimetype="application/json")
+        response.set_etag("items-1")
+        response = compress_response(response, context.request.accept_encodings)
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response.get_data())) == body
+    assert response.headers["Content-Length"] == str(len(response.get_data()))
+    assert response.get_etag() == ("items-1", True)
+
+def test_small_or_unaccepted_responses_left_alone():
+    small = json.dumps({"message": "ok"})
+    assert len(small) < COMPRESSION_MIN_SIZE
+    large = json.dumps({"items": ["x" * 10] * 500})
+
+    with app.test_request_context(headers={"Accept-Encoding": "gzip"}) as context:
+        response = compress_response(app.response_class(small, mimetype="application/json"),
+                                     context.request.accept_encodings)
+        assert "Content-Encoding" not in response.headers
+
+    with app.test_request_context(headers={"Accept-Encoding": "identity"}) as context:
+        response = compress_response(app.response_class(large, mimetype="application/json"),
+                                     context.request.accept_encodings)
+        assert "Content-Encoding" not in response.headers
+        assert response.get_data(as_text=True) == large
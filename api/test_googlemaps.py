@@ -0,0 +1,144 @@
+import time
+import requests
+from googlemaps import (harvest_cafes, harvest_cafes_tiled, get_all_cafes, RateLimiter, PlacesSession,
+                        split_bbox, tile_search_circle, haversine_meters, harvest_area_filter,
+                        cafe_content_hash)
+from places_stub import PlacesStubServer
+
+LOCATIONS = ["29.6456,-82.3519", "29.6785,-82.3572", "29.6158,-82.3747", "29.6677,-82.3365"]
+
+def test_get_all_cafes_follows_pages():
+    with PlacesStubServer(pages=3, results_per_page=20) as stub:
+        cafes = get_all_cafes("test-key", LOCATIONS[0], page_token_delay=0, base_url=stub.url)
+    assert len(cafes) == 60
+    assert stub.request_count == 3
+
+def test_harvest_concurrent_matches_sequential():
+    options = {"page_token_delay": 0.2, "location_delay": 0, "max_requests_per_second": 0}
+    with PlacesStubServer(pages=3) as stub:
+        start = time.perf_counter()
+        sequential = harvest_cafes("test-key", LOCATIONS, 1500, max_workers=1, base_url=stub.url, **options)
+        sequential_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        concurrent = harvest_cafes("test-key", LOCATIONS, 1500, max_workers=4, base_url=stub.url, **options)
+        concurrent_time = time.perf_counter() - start
+
+    assert concurrent == sequential
+    assert [loc for loc, _, _ in concurrent] == LOCATIONS
+    # The page-token waits of different locations overlap
+    assert concurrent_time < sequential_time / 2
+
+def test_harvest_uses_injected_http_get():
+    calls = []
+    with PlacesStubServer(pages=1) as stub:
+        def http_get(url, params=None):
+            calls.append(params)
+            return requests.get(stub.url, params=params)
+
+        results = harvest_cafes("test-key", LOCATIONS[:2], 1500, max_workers=2, http_get=http_get)
+
+    assert len(calls) == 2
+    assert all(len(cafes) == 20 and status == "OK" for _, cafes, status in results)
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(20)
+    start = time.perf_counter()
+    for _ in range(5):
+        limiter.wait()
+    # The first call is free, the next four wait 1/20s each
+    assert time.perf_counter() - start >= 0.19
+
+def test_tiled_harvest_covers_dense_areas():
+    # 150 cafes packed downtown and 30 spread over the rest of the box
+    bbox = (-82.43, 29.59, -82.26, 29.72)
+    places = [
+        {"place_id": f"dense-{i}", "geometry": {"location": {"lat": 29.650 + (i % 15) * 2e-4, "lng": -82.340 + (i // 15) * 2e-4}}}
+        for i in range(150)
+    ] + [
+        {"place_id": f"sparse-{i}", "geometry": {"location": {"lat": 29.60 + (i % 6) * 0.02, "lng": -82.42 + (i // 6) * 0.03}}}
+        for i in range(30)
+    ]
+
+    with PlacesStubServer(places=places) as stub:
+        results = harvest_cafes_tiled("test-key", bbox, page_token_delay=0, location_delay=0,
+                                      max_requests_per_second=0, max_workers=4, base_url=stub.url)
+
+    found = {cafe["place_id"] for _, _, cafes, _ in results for cafe in cafes}
+    assert found == {place["place_id"] for place in places}
+    # The dense tile was subdivided beyond the initial 2x2 grid
+    assert len(results) > 4
+
+def test_split_bbox_and_search_circle():
+    tiles = split_bbox((0.0, 0.0, 2.0, 1.0), 1, 2)
+    assert tiles == [(0.0, 0.0, 1.0, 1.0), (1.0, 0.0, 2.0, 1.0)]
+
+    location, radius = tile_search_circle((0.0, 0.0, 0.1, 0.1))
+    assert location == "0.050000,0.050000"
+    assert radius >= haversine_meters(0.05, 0.05, 0.1, 0.1)
+
+def test_places_session_retries_transient_failures():
+    session = PlacesSession(backoff_base=0.01)
+    with PlacesStubServer(pages=2, errors=[503, "OVER_QUERY_LIMIT"]) as stub:
+        cafes = get_all_cafes("test-key", LOCATIONS[0], page_token_delay=0, http_get=session.get, base_url=stub.url)
+
+    assert len(cafes) == 40
+    stats = session.stats()
+    assert stats["requests"] == 4
+    assert stats["retries"] == 2
+    assert stats["failures"] == 0
+    # Every request reused one pooled keep-alive connection
+    assert stub.connection_count == 1
+
+def test_places_session_gives_up_after_max_retries():
+    session = PlacesSession(max_retries=2, backoff_base=0.01)
+    with PlacesStubServer(errors=["OVER_QUERY_LIMIT"] * 5) as stub:
+        response = session.get(stub.url, params={"location": LOCATIONS[0], "radius": 1500})
+
+    assert response.json()["status"] == "OVER_QUERY_LIMIT"
+    assert session.stats()["failures"] == 1
+    assert stub.request_count == 3
+
+def test_places_session_throttles_retries():
+    class CountingLimiter(RateLimiter):
+        waits = 0
+        def wait(self):
+            CountingLimiter.waits += 1
+            super().wait()
+
+    session = PlacesSession(max_retries=3, backoff_base=0.01, rate_limiter=CountingLimiter(0))
+    with PlacesStubServer(errors=[503, 503, "OVER_QUERY_LIMIT"]) as stub:
+        response = session.get(stub.url, params={"location": LOCATIONS[0], "radius": 1500})
+
+    assert response.json()["status"] == "OK"
+    # Every attempt, not just the first, went through the limiter
+    assert stub.request_count == CountingLimiter.waits == 4
+
+def test_harvest_area_filter_skips_capped_searches():
+    capped = [{"place_id": f"capped-{i}"} for i in range(60)]
+    searches = [("29.6,-82.3", 1000, capped, "OK"), ("29.7,-82.4", 500, [{"place_id": "a"}], "OK")]
+    scope = harvest_area_filter(searches)
+    assert len(scope["$or"]) == 1
+    assert scope["$or"][0]["geo_point"]["$geoWithin"]["$centerSphere"][0] == [-82.4, 29.7]
+    assert harvest_area_filter(searches[:1]) is None
+
+def test_harvest_area_filter_skips_failed_searches():
+    searches = [("29.6,-82.3", 1000, [], "REQUEST_DENIED"), ("29.7,-82.4", 500, [], "ZERO_RESULTS")]
+    scope = harvest_area_filter(searches)
+    assert len(scope["$or"]) == 1
+    assert scope["$or"][0]["geo_point"]["$geoWithin"]["$centerSphere"][0] == [-82.4, 29.7]
+
+def test_get_all_cafes_reports_failed_status():
+    with PlacesStubServer(errors=["REQUEST_DENIED"]) as stub:
+        cafes, status = get_all_cafes("test-key", LOCATIONS[0], page_token_delay=0, base_url=stub.url,
+                                      http_get=requests.get, return_status=True)
+    assert cafes == []
+    assert status == "REQUEST_DENIED"
+
+def test_content_hash_ignores_volatile_fields():
+    cafe = {"place_id": "a", "name": "Cafe", "opening_hours": {"open_now": True},
+            "photos": [{"photo_reference": "ref-1", "width": 400}]}
+    later = {"place_id": "a", "name": "Cafe", "opening_hours": {"open_now": False},
+             "photos": [{"photo_reference": "ref-2", "width": 400}]}
+    assert cafe_content_hash(cafe) == cafe_content_hash(later)
+    assert cafe_content_hash(cafe) != cafe_content_hash(dict(later, name="Renamed Cafe"))
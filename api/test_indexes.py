@@ -0,0 +1,12 @@
+from studyfindr import mongo, places_db
+from indexes import ensure_indexes, check_query_plans
+
+def test_ensure_indexes_is_idempotent():
+    first = ensure_indexes(mongo.db, places_db)
+    second = ensure_indexes(mongo.db, places_db)
+    assert first["errors"] == [] and second["errors"] == []
+    assert first == second
+
+def test_endpoint_queries_use_indexes():
+    ensure_indexes(mongo.db, places_db)
+    assert check_query_plans(mongo.db, places_db) == []
@@ -0,0 +1,78 @@
+import io
+import os
+import json
+import pytest
+from studyfindr import app
+from app_logging import configure_logging, stop_logging, get_logger
+
+@pytest.fixture
+def client():
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        yield client
+
+@pytest.fixture
+def log_output():
+    output = io.StringIO()
+    configure_logging(level="DEBUG", log_format="json", stream=output)
+    yield output
+    configure_logging()
+
+def read_records(output):
+    # Stopping the listener flushes everything still queued
+    stop_logging()
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+def test_request_log_has_request_id(client, log_output):
+    response = client.get("/api/get_cafes?bbox=bad", headers={"X-Request-ID": "test-request-1"})
+    assert response.headers["X-Request-ID"] == "test-request-1"
+
+    records = [r for r in read_records(log_output) if r["message"] == "Request handled"]
+    assert records[-1]["request_id"] == "test-request-1"
+    assert records[-1]["path"] == "/api/get_cafes"
+    assert records[-1]["status"] == 400
+    assert "duration_ms" in records[-1]
+
+def test_request_id_generated(client, log_output):
+    response = client.get("/api/get_cafes?bbox=bad")
+    assert len(response.headers["X-Request-ID"]) == 32
+
+def test_login_does_not_log_password(client, log_output):
+    client.post("/api/login", json={"email": "nobody@example.com", "password": "hunter2-secret"})
+
+    output = json.dumps(read_records(log_output))
+    assert "nobody@example.com" in output
+    assert "hunter2-secret" not in output
+
+def test_sampled_records_dropped(log_output):
+    logger = get_logger("test")
+    logger.debug("Always dropped", extra={"sample_rate": 0})
+    logger.debug("Always kept", extra={"sample_rate": 1})
+
+    messages = [r["message"] for r in read_records(log_output)]
+    assert "Always kept" in messages
+    assert "Always dropped" not in messages
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_child_logs(tmp_path):
+    path = tmp_path / "log.jsonl"
+    with open(path, "w") as stream:
+        configure_logging(log_format="json", stream=stream)
+        try:
+            logger = get_logger("test")
+            # The parent's writer thread is running when the child forks, as under --preload
+            logger.info("From the parent")
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    logger.warning("From the child")
+                    stop_logging()
+                finally:
+                    os._exit(0)
+            os.waitpid(pid, 0)
+            stop_logging()
+        finally:
+            configure_logging()
+
+    messages = [json.loads(line)["message"] for line in path.read_text().splitlines()]
+    assert sorted(messages) == ["From the child", "From the parent"]
@@ -0,0 +1,51 @@
+import pytest
+from types import SimpleNamespace
+from studyfindr import app, metrics
+from metrics import MetricsRegistry, RequestCommandListener
+
+@pytest.fixture
+def client():
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        yield client
+
+def test_metrics_endpoint_records_routes(client):
+    metrics.reset()
+    client.get("/api/get_cafes?bbox=bad")
+    client.get("/api/get_cafes?bbox=bad")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+
+    body = response.get_data(as_text=True)
+    assert 'studyfindr_requests_total{method="GET",route="/api/get_cafes",status="400"} 2' in body
+    assert 'studyfindr_request_duration_seconds_count{method="GET",route="/api/get_cafes"} 2' in body
+    assert 'studyfindr_request_duration_seconds_bucket{method="GET",route="/api/get_cafes",le="+Inf"} 2' in body
+
+def test_routes_labelled_by_rule(client):
+    metrics.reset()
+    client.get("/uploads/missing-file-a")
+    client.get("/uploads/missing-file-b")
+    client.get("/no/such/route")
+
+    body = client.get("/metrics").get_data(as_text=True)
+    assert 'studyfindr_request_duration_seconds_count{method="GET",route="/uploads/<file_id>"} 2' in body
+    assert 'route="unmatched",status="404"} 1' in body
+    assert "missing-file-a" not in body
+
+def test_command_listener_attributes_commands_to_request():
+    registry = MetricsRegistry()
+    listener = RequestCommandListener(registry)
+
+    listener.succeeded(SimpleNamespace(command_name="find", duration_micros=1500))
+    listener.start_request()
+    listener.succeeded(SimpleNamespace(command_name="find", duration_micros=2000))
+    listener.succeeded(SimpleNamespace(command_name="find", duration_micros=1000))
+    listener.failed(SimpleNamespace(command_name="update", duration_micros=500))
+    commands = listener.finish_request()
+
+    assert commands == {"find": {"count": 2, "ms": 3.0}, "update": {"count": 1, "ms": 0.5}}
+    body = registry.render()
+    assert 'studyfindr_mongo_commands_total{command="find"} 3' in body
+    assert 'studyfindr_mongo_command_failures_total{command="update"} 1' in body
@@ -0,0 +1,58 @@
+import pytest
+from datetime import datetime as dt, timedelta
+from bson.objectid import ObjectId
+from studyfindr import mongo, fs
+from migrations import (
+    IMAGE_MIGRATION, migrate_existing_images, start_image_migration, is_migration_complete
+)
+
+EMAILS = [f"migrationuser{i}@example.com" for i in range(3)]
+
+@pytest.fixture
+def legacy_pictures(tmp_path):
+    mongo.db.migrations.delete_one({"_id": IMAGE_MIGRATION})
+    mongo.db.users.delete_many({"email": {"$in": EMAILS}})
+    for i, email in enumerate(EMAILS):
+        (tmp_path / f"legacy-{i}.png").write_bytes(b"legacy picture %d" % i)
+        mongo.db.users.insert_one({"username": f"migration{i}", "email": email,
+                                   "profile_picture": f"/uploads/legacy-{i}.png"})
+    yield tmp_path
+    for user in mongo.db.users.find({"email": {"$in": EMAILS}}):
+        file_id = user["profile_picture"].replace("/uploads/", "")
+        if not file_id.startswith("legacy-"):
+            fs.delete(ObjectId(file_id))
+    mongo.db.users.delete_many({"email": {"$in": EMAILS}})
+    mongo.db.migrations.delete_one({"_id": IMAGE_MIGRATION})
+
+def pictures():
+    return [user["profile_picture"] for user in mongo.db.users.find({"email": {"$in": EMAILS}}).sort("email")]
+
+def test_migration_moves_pictures_and_marks_complete(legacy_pictures):
+    assert migrate_existing_images(mongo.db, fs, str(legacy_pictures), batch_size=2) == 3
+
+    assert all(not picture.startswith("/uploads/legacy-") for picture in pictures())
+    assert is_migration_complete(mongo.db, IMAGE_MIGRATION)
+    assert mongo.db.migrations.find_one({"_id": IMAGE_MIGRATION})["migrated"] == 3
+
+    # Once complete, starting up does nothing
+    assert start_image_migration(mongo.db, fs, str(legacy_pictures)) is None
+    assert migrate_existing_images(mongo.db, fs, str(legacy_pictures)) == 0
+
+def test_migration_resumes_after_checkpoint(legacy_pictures):
+    users = list(mongo.db.users.find({"email": {"$in": EMAILS}}).sort("_id"))
+    # An earlier run stopped after the first user
+    mongo.db.migrations.insert_one({"_id": IMAGE_MIGRATION, "completed_at": None, "lease_expires_at": None,
+                                    "last_id": users[0]["_id"], "processed": 1, "migrated": 0})
+
+    assert migrate_existing_images(mongo.db, fs, str(legacy_pictures), batch_size=1) == 2
+    first = mongo.db.users.find_one({"_id": users[0]["_id"]})
+    assert first["profile_picture"] == users[0]["profile_picture"]
+
+def test_migration_skipped_while_leased(legacy_pictures):
+    # Another worker claimed the migration and is still within its lease
+    mongo.db.migrations.insert_one({"_id": IMAGE_MIGRATION, "completed_at": None, "owner": "worker-1",
+                                    "lease_expires_at": dt.utcnow() + timedelta(minutes=5),
+                                    "last_id": None, "processed": 0, "migrated": 0})
+
+    assert migrate_existing_images(mongo.db, fs, str(legacy_pictures), owner="worker-2") == 0
+    assert all(picture.startswith("/uploads/legacy-") for picture in pictures())
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+from studyfindr import app, mongo, places_db, place_features, cafe_index
+from googlemaps import add_geo_point, bump_cafes_version, haversine_meters
+from location_stats import RATING_FIELDS, apply_review_change
+from recommend import PlaceFeatures, DEFAULT_WEIGHTS, rank
+from cache import SnapshotCache
+
+@pytest.fixture
+def client():
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        yield client
+
+@pytest.fixture
+def reviewed_cafes():
+    cafes = [
+        {"place_id": "test-recommend-quiet", "name": "Quiet Cafe", "rating": 4.0,
+         "geometry": {"location": {"lat": 29.6460, "lng": -82.3520}}},
+        {"place_id": "test-recommend-loud", "name": "Loud Cafe", "rating": 4.0,
+         "geometry": {"location": {"lat": 29.6461, "lng": -82.3521}}},
+        {"place_id": "test-recommend-far", "name": "Far Cafe", "rating": 5.0,
+         "geometry": {"location": {"lat": 30.3322, "lng": -81.6557}}}
+    ]
+    place_ids = [cafe["place_id"] for cafe in cafes]
+    places_db.cafes.delete_many({"place_id": {"$in": place_ids}})
+    places_db.cafes.insert_many([add_geo_point(cafe) for cafe in cafes])
+    # Reviews are stored under the front end's "place-" ids
+    location_ids = [f"place-{place_id}" for place_id in place_ids]
+    mongo.db.location_stats.delete_many({"_id": {"$in": location_ids}})
+    # Identical but for quietness
+    apply_review_change(mongo.db, location_ids[0], new_review=dict({field: 3 for field in RATING_FIELDS}, quietness=5))
+    apply_review_change(mongo.db, location_ids[1], new_review=dict({field: 3 for field in RATING_FIELDS}, quietness=1))
+    bump_cafes_version(places_db)
+    place_features.invalidate()
+    cafe_index.invalidate()
+    yield place_ids
+    places_db.cafes.delete_many({"place_id": {"$in": place_ids}})
+    mongo.db.location_stats.delete_many({"_id": {"$in": location_ids}})
+    bump_cafes_version(places_db)
+
+def test_recommend_ranks_by_weighted_scores(client, reviewed_cafes):
+    response = client.get("/api/recommend?lat=29.6456&lng=-82.3519&radius=2000&quietness=3")
+    assert response.status_code == 200
+
+    results = [place for place in response.json["results"] if place["place_id"] in reviewed_cafes]
+    assert [place["name"] for place in results] == ["Quiet Cafe", "Loud Cafe"]
+    assert results[0]["averages"]["quietness"] == 5
+    assert results[0]["review_count"] == 1
+    assert 0 < results[0]["distance_m"] < 100
+
+    # A negative weight prefers the lower score
+    response = client.get("/api/recommend?lat=29.6456&lng=-82.3519&radius=2000&quietness=-3")
+    results = [place for place in response.json["results"] if place["place_id"] in reviewed_cafes]
+    assert results[0]["name"] == "Loud Cafe"
+
+def test_recommend_validates_args(client):
+    assert client.get("/api/recommend?lng=-82.35").status_code == 400
+    assert client.get("/api/recommend?lat=29.6&lng=-82.3&quietness=loud").status_code == 400
+    assert client.get("/api/recommend?lat=29.6&lng=-82.3&radius=0").status_code == 400
+    assert client.get("/api/recommend?lat=29.6&lng=-82.3&limit=1000").status_code == 400
+
+@pytest.mark.parametrize("arg", ["quietness=nan", "internet=inf", "vibes=-Infinity", "radius=nan", "radius=inf"])
+def test_recommend_rejects_non_finite_numbers(client, arg):
+    response = client.get(f"/api/recommend?lat=29.6&lng=-82.3&{arg}")
+    assert response.status_code == 400
+    assert "finite" in response.json["errors"]["general"]
+
+def test_rank_matches_full_sort():
+    rng = np.random.default_rng(7)
+    n = 5000
+    features = PlaceFeatures(
+        ids=[str(i) for i in range(n)], place_ids=[""] * n, names=[""] * n,
+        lat=29.65 + rng.uniform(-0.05, 0.05, n), lng=-82.35 + rng.uniform(-0.05, 0.05, n),
+        rating=rng.uniform(1, 5, n), averages=rng.uniform(1, 5, (n, len(RATING_FIELDS))),
+        review_counts=np.ones(n)
+    )
+    weights = dict(DEFAULT_WEIGHTS, internet=2.5, distance=0.5)
+    top = rank(features, 29.65, -82.35, 3000, weights, 20)
+
+    # Same as scoring and sorting every place in range one by one
+    expected = []
+    for i in range(n):
+        distance = haversine_meters(29.65, -82.35, features.lat[i], features.lng[i])
+        if distance <= 3000:
+            score = sum(weights[name] * features.scores[i][j] for j, name in enumerate(["rating"] + RATING_FIELDS))
+            expected.append((score + weights["distance"] * (1 - distance / 3000), i))
+    expected.sort(reverse=True)
+    assert [index for index, _, _ in top] == [i for _, i in expected[:20]]
+
+def test_snapshot_cache_rebuilds_on_new_version():
+    version, builds = [1], []
+    snapshots = SnapshotCache(lambda: builds.append(version[0]) or len(builds),
+                              version_source=lambda: version[0], max_age=60, version_check_interval=0)
+
+    assert snapshots.get() == snapshots.get() == 1
+    version[0] = 2
+    assert snapshots.get() == 2
+    snapshots.invalidate()
+    assert snapshots.get() == 3
+    assert builds == [1, 2, 2]
@@ -0,0 +1,230 @@
+import base64
+import pytest
+from datetime import datetime as dt
+from bson import json_util
+from bson.objectid import ObjectId
+from studyfindr import app, mongo
+from location_stats import rebuild_location_stats
+
+LOCATION_ID = "test-review-location"
+AUTHORS = ["reviewauthor1@example.com", "reviewauthor2@example.com"]
+
+@pytest.fixture
+def client():
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        yield client
+
+@pytest.fixture
+def location_reviews():
+    mongo.db.reviews.delete_many({"location_id": LOCATION_ID})
+    mongo.db.users.delete_many({"email": {"$in": AUTHORS}})
+    mongo.db.users.insert_many([
+        {"username": f"author{i}", "email": email, "profile_picture": f"/uploads/author{i}"}
+        for i, email in enumerate(AUTHORS)
+    ])
+    mongo.db.reviews.insert_many([
+        {
+            "user_email": email, "location_id": LOCATION_ID,
+            "quietness": 4, "seating": 3, "vibes": 5, "crowdedness": 2, "internet": 4,
+            "likes": [], "dislikes": [], "created_at": dt.utcnow()
+        }
+        for email in AUTHORS
+    ])
+    yield
+    mongo.db.reviews.delete_many({"location_id": LOCATION_ID})
+    mongo.db.users.delete_many({"email": {"$in": AUTHORS}})
+
+@pytest.mark.parametrize("sort_by", ["created_at", "likes"])
+def test_location_reviews_include_authors(client, location_reviews, sort_by):
+    response = client.get(f"/api/get_location_reviews?location_id={LOCATION_ID}&sort_by={sort_by}")
+    assert response.status_code == 200
+
+    reviews = response.json["reviews"]
+    assert len(reviews) == len(AUTHORS)
+    for review in reviews:
+        i = AUTHORS.index(review["user_email"])
+        assert review["user_name"] == f"author{i}"
+        assert review["profile_picture"] == f"/uploads/author{i}?size=64"
+
+def test_rate_review_votes(client, location_reviews):
+    review = mongo.db.reviews.find_one({"location_id": LOCATION_ID, "user_email": AUTHORS[0]})
+    review_id = str(review["_id"])
+    voter = AUTHORS[1]
+
+    def rate(action):
+        return client.post("/api/rate_review", json={"review_id": review_id, "user_email": voter, "action": action})
+
+    response = rate("like")
+    assert response.status_code == 200
+    assert (response.json["likes_count"], response.json["dislikes_count"]) == (1, 0)
+
+    # Liking again changes nothing
+    assert rate("like").json["message"] == "No changes were made"
+
+    response = rate("dislike")
+    assert (response.json["likes_count"], response.json["dislikes_count"]) == (0, 1)
+
+    response = rate("remove")
+    assert (response.json["likes_count"], response.json["dislikes_count"]) == (0, 0)
+
+    stored = mongo.db.reviews.find_one({"_id": review["_id"]})
+    assert stored["likes"] == [] and stored["dislikes"] == []
+    assert stored["likes_count"] == 0 and stored["dislikes_count"] == 0
+
+def test_rate_review_invalid_action(client, location_reviews):
+    review = mongo.db.reviews.find_one({"location_id": LOCATION_ID})
+    response = client.post("/api/rate_review", json={
+        "review_id": str(review["_id"]), "user_email": AUTHORS[1], "action": "love"
+    })
+    assert response.status_code == 400
+
+@pytest.fixture
+def many_reviews():
+    location_id = "test-review-pages"
+    mongo.db.reviews.delete_many({"location_id": location_id})
+    created_at = dt(2024, 1, 1)
+    # Ties on both sort keys, so only _id orders some of them
+    mongo.db.reviews.insert_many([
+        {"user_email": f"pageauthor{i}@example.com", "location_id": location_id,
+         "likes": [], "dislikes": [], "likes_count": i % 3, "created_at": created_at.replace(day=1 + i // 2)}
+        for i in range(11)
+    ])
+    yield location_id
+    mongo.db.reviews.delete_many({"location_id": location_id})
+
+@pytest.mark.parametrize("sort_by,sort_order", [("created_at", -1), ("created_at", 1), ("likes", -1)])
+def test_location_reviews_cursor_pages(client, many_reviews, sort_by, sort_order):
+    url = f"/api/get_location_reviews?location_id={many_reviews}&limit=4&sort_by={sort_by}&sort_order={sort_order}"
+    seen, cursor, pages = [], None, 0
+    while True:
+        response = client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        assert response.status_code == 200
+        seen.extend(review["_id"] for review in response.json["reviews"])
+        pages += 1
+        if not response.json["has_more"]:
+            assert response.json["next_cursor"] is None
+            break
+        cursor = response.json["next_cursor"]
+
+    # Every review exactly once, in the same order as one big page
+    everything = client.get(f"/api/get_location_reviews?location_id={many_reviews}&limit=50"
+                            f"&sort_by={sort_by}&sort_order={sort_order}").json["reviews"]
+    assert seen == [review["_id"] for review in everything]
+    assert len(seen) == 11 and pages == 3
+    assert "total_count" not in response.json
+
+@pytest.mark.parametrize("sort_by,sort_order", [("created_at", -1), ("created_at", 1), ("likes", 1)])
+def test_location_reviews_cursor_pages_without_sort_key(client, many_reviews, sort_by, sort_order):
+    # Older reviews predate created_at and likes_count
+    mongo.db.reviews.insert_many([
+        {"user_email": f"oldauthor{i}@example.com", "location_id": many_reviews, "likes": [], "dislikes": []}
+        for i in range(5)
+    ])
+    ids = {str(review["_id"]) for review in mongo.db.reviews.find({"location_id": many_reviews})}
+    url = f"/api/get_location_reviews?location_id={many_reviews}&limit=3&sort_by={sort_by}&sort_order={sort_order}"
+    seen, cursor = [], None
+    while True:
+        response = client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        assert response.status_code == 200
+        seen.extend(review["_id"] for review in response.json["reviews"])
+        cursor = response.json["next_cursor"]
+        if not cursor:
+            break
+
+    # Nothing skipped or repeated across the null-key boundary
+    assert len(seen) == len(ids) == 16
+    assert set(seen) == ids
+
+def test_location_reviews_total_on_request(client, many_reviews):
+    response = client.get(f"/api/get_location_reviews?location_id={many_reviews}&limit=4&include_total=1")
+    assert response.json["total_count"] == 11
+
+def test_location_reviews_bad_cursor(client, many_reviews):
+    url = f"/api/get_location_reviews?location_id={many_reviews}&limit=4"
+    cursor = client.get(url).json["next_cursor"]
+
+    assert client.get(url + "&cursor=not-a-cursor").status_code == 400
+    # A cursor only continues the sort it came from
+    assert client.get(url + f"&sort_by=likes&cursor={cursor}").status_code == 400
+    assert client.get(url + "&sort_by=vibes").status_code == 400
+
+def encode_position(position):
+    return base64.urlsafe_b64encode(json_util.dumps(position).encode("utf-8")).decode("ascii").rstrip("=")
+
+@pytest.mark.parametrize("key,review_id", [
+    ({"$ne": None}, ObjectId()),
+    (dt(2024, 1, 1), {"$gt": ""}),
+    ("2024-01-01", ObjectId()),
+    (True, ObjectId()),
+])
+def test_location_reviews_tampered_cursor(client, many_reviews, key, review_id):
+    url = f"/api/get_location_reviews?location_id={many_reviews}&limit=4"
+    cursor = encode_position({"sort_by": "created_at", "sort_order": -1, "key": key, "_id": review_id})
+    response = client.get(url + f"&cursor={cursor}")
+    assert response.status_code == 400
+    assert response.json["errors"]["cursor"] == "Invalid cursor"
+
+@pytest.fixture
+def stats_location():
+    location_id = "test-stats-location"
+    emails = ["statsauthor1@example.com", "statsauthor2@example.com"]
+    mongo.db.reviews.delete_many({"location_id": location_id})
+    mongo.db.location_stats.delete_one({"_id": location_id})
+    yield location_id, emails
+    mongo.db.reviews.delete_many({"location_id": location_id})
+    mongo.db.location_stats.delete_one({"_id": location_id})
+
+def post_review(client, location_id, email, score):
+    return client.post("/api/add_review", json={
+        "user_email": email, "location_id": location_id,
+        "quietness": score, "seating": score, "vibes": score, "crowdedness": score, "internet": score
+    })
+
+def test_location_stats_follow_reviews(client, stats_location):
+    location_id, emails = stats_location
+    assert post_review(client, location_id, emails[0], 2).status_code == 201
+    assert post_review(client, location_id, emails[1], 5).status_code == 201
+    # Editing a review replaces its scores rather than adding to them
+    assert post_review(client, location_id, emails[0], 4).status_code == 200
+
+    response = client.post("/api/location_stats", json={"location_ids": [location_id, "test-stats-unreviewed"]})
+    assert response.status_code == 200
+    stats = response.json["stats"]
+    assert stats[location_id]["review_count"] == 2
+    assert stats[location_id]["averages"]["quietness"] == 4.5
+    assert stats["test-stats-unreviewed"] == {"review_count": 0, "averages": {
+        "quietness": None, "seating": None, "vibes": None, "crowdedness": None, "internet": None}}
+
+    # Recomputing from the reviews gives the same numbers
+    incremental = mongo.db.location_stats.find_one({"_id": location_id}, {"updated_at": 0})
+    rebuild_location_stats(mongo.db)
+    assert mongo.db.location_stats.find_one({"_id": location_id}, {"updated_at": 0}) == incremental
+
+def test_location_stats_requires_ids(client):
+    assert client.post("/api/location_stats", json={}).status_code == 400
+    assert client.post("/api/location_stats", json={"location_ids": "not-a-list"}).status_code == 400
+
+def test_locations_summary(client, stats_location):
+    location_id, emails = stats_location
+    post_review(client, location_id, emails[0], 3)
+    mongo.db.users.delete_many({"email": emails[0]})
+    mongo.db.bookmarks.delete_many({"place_id": location_id})
+    bookmark_id = mongo.db.bookmarks.insert_one({"name": "Stats Cafe", "place_id": location_id}).inserted_id
+    mongo.db.users.insert_one({"username": "statsauthor1", "email": emails[0], "bookmarks": [str(bookmark_id)]})
+
+    try:
+        ids = [location_id, "test-stats-unreviewed"]
+        anonymous = client.post("/api/locations/summary", json={"location_ids": ids}).json["locations"]
+        assert anonymous[location_id]["review_count"] == 1
+        assert anonymous[location_id]["bookmarked"] is False
+
+        response = client.post("/api/locations/summary", json={"location_ids": ids, "user_email": emails[0]})
+        assert response.status_code == 200
+        summary = response.json["locations"]
+        assert summary[location_id]["averages"]["vibes"] == 3
+        assert summary[location_id]["bookmarked"] and summary[location_id]["reviewed"]
+        assert not summary["test-stats-unreviewed"]["bookmarked"] and not summary["test-stats-unreviewed"]["reviewed"]
+    finally:
+        mongo.db.users.delete_many({"email": emails[0]})
+        mongo.db.bookmarks.delete_one({"_id": bookmark_id})
@@ -0,0 +1,177 @@
+import numpy as np
+import pytest
+import spatial
+import base64
+from studyfindr import (app, mongo, places_db, cafe_index, bookmark_index, bookmark_vectors,
+                        get_bookmarks_version, bump_bookmarks_version)
+from googlemaps import add_geo_point, bump_cafes_version, save_cafes_to_mongodb
+from spatial import PackedPoints, SpatialIndex, haversine_array
+
+@pytest.fixture
+def client():
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        yield client
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(3)
+    n = 3000
+    lat = 29.65 + rng.uniform(-0.2, 0.2, n)
+    lng = -82.35 + rng.uniform(-0.2, 0.2, n)
+    return [f"point-{i}" for i in range(n)], lat, lng
+
+def test_nearest_and_within_match_brute_force(points):
+    keys, lat, lng = points
+    index = SpatialIndex(keys, lat, lng)
+
+    distances = haversine_array(29.66, -82.34, lat, lng)
+    expected = [keys[i] for i in np.argsort(distances)[:15]]
+    assert [key for key, _ in index.nearest(29.66, -82.34, k=15)] == expected
+
+    bbox = (-82.40, 29.60, -82.30, 29.70)
+    inside = (lng >= bbox[0]) & (lng <= bbox[2]) & (lat >= bbox[1]) & (lat <= bbox[3])
+    assert sorted(index.within(bbox)) == sorted(np.array(keys)[inside])
+
+    found, found_distances = index.within_radius(29.66, -82.34, 2500)
+    assert sorted(found) == sorted(np.array(keys)[distances <= 2500])
+    assert np.all(found_distances <= 2500)
+
+def test_incremental_writes_and_merge(points, monkeypatch):
+    keys, lat, lng = points
+    index = SpatialIndex(keys, lat, lng)
+
+    index.upsert("point-0", 10.0, 10.0)      # Moved far away
+    index.upsert("new-point", 29.66, -82.34)  # Exactly on the query point
+    index.remove("point-1")
+    assert index.nearest(29.66, -82.34, k=1)[0] == ("new-point", 0.0)
+    assert "point-1" not in index.within((-83, 29, -82, 30))
+    assert index.nearest(10.0, 10.0, k=1)[0][0] == "point-0"
+    assert len(index) == len(keys)
+
+    # Enough writes to merge the pending buffer into the sorted arrays
+    monkeypatch.setattr(spatial, "SPATIAL_MIN_MERGE", 10)
+    for i in range(200):
+        index.upsert(f"merged-{i}", 29.9, -82.0 + i * 1e-4)
+    assert len(index._pending) < 200
+    assert len(index.within((-82.01, 29.89, -81.97, 29.91))) == 200
+    assert index.nearest(29.66, -82.34, k=1)[0][0] == "new-point"
+
+@pytest.fixture
+def nearby_cafes():
+    cafes = [
+        {"place_id": f"test-nearby-{i}", "name": f"Nearby Cafe {i}",
+         "geometry": {"location": {"lat": 80.0 + i * 0.001, "lng": 100.0}}}
+        for i in range(3)
+    ]
+    place_ids = [cafe["place_id"] for cafe in cafes]
+    places_db.cafes.delete_many({"place_id": {"$in": place_ids + ["test-nearby-new"]}})
+    places_db.cafes.insert_many([add_geo_point(cafe) for cafe in cafes])
+    bump_cafes_version(places_db)
+    cafe_index.invalidate()
+    yield place_ids
+    places_db.cafes.delete_many({"place_id": {"$in": place_ids + ["test-nearby-new"]}})
+    bump_cafes_version(places_db)
+
+def test_nearby_cafes_follow_harvests(client, nearby_cafes):
+    response = client.get("/api/nearby?lat=80.0&lng=100.0&k=2")
+    assert response.status_code == 200
+    assert [cafe["place_id"] for cafe in response.json["results"]] == ["test-nearby-0", "test-nearby-1"]
+    assert response.json["results"][0]["distance_m"] == 0
+
+    # A harvest in this process updates the built index in place rather than rebuilding it
+    index = cafe_index.peek()
+    save_cafes_to_mongodb([{"place_id": "test-nearby-new", "name": "New Cafe",
+                            "geometry": {"location": {"lat": 80.0, "lng": 100.0001}}}], places_db=places_db)
+    response = client.get("/api/nearby?lat=80.0&lng=100.0&k=2")
+    assert [cafe["place_id"] for cafe in response.json["results"]] == ["test-nearby-0", "test-nearby-new"]
+    assert cafe_index.peek() is index
+
+def test_nearby_bookmarks_follow_writes(client):
+    bookmark_index.get()
+    response = client.post("/api/add_bookmark", json={"name": "Nearby Bookmark", "latitude": -80.0, "longitude": -100.0,
+                                                      "place_id": "test-nearby-bookmark"})
+    assert response.status_code == 201
+    try:
+        found = client.get("/api/nearby?lat=-80.0&lng=-100.0&k=1&kind=bookmarks").json["results"]
+        assert [bookmark["id"] for bookmark in found] == [response.json["id"]]
+
+        client.post("/api/remove_bookmark", json={"bookmark_id": "test-nearby-bookmark"})
+        found = client.get("/api/nearby?lat=-80.0&lng=-100.0&k=1&kind=bookmarks").json["results"]
+        assert response.json["id"] not in [bookmark["id"] for bookmark in found]
+    finally:
+        mongo.db.bookmarks.delete_many({"place_id": "test-nearby-bookmark"})
+
+def test_nearby_validates_args(client):
+    assert client.get("/api/nearby?lat=29.6").status_code == 400
+    assert client.get("/api/nearby?lat=29.6&lng=-82.3&k=0").status_code == 400
+    assert client.get("/api/nearby?lat=29.6&lng=-82.3&kind=users").status_code == 400
+
+def test_packed_points_writes_in_place(points):
+    keys, lat, lng = points
+    packed = PackedPoints(keys, lat, lng)
+    first = packed.export()
+    assert packed.export() is first
+    assert np.array_equal(np.frombuffer(first["lat"], "<f4"), np.float32(lat))
+
+    packed.remove("point-0")               # The last point moves into its slot
+    packed.upsert("point-5", 10.0, 20.0)
+    for i in range(2000):                  # Past the initial capacity
+        packed.upsert(f"new-{i}", -10.0, float(i))
+    export = packed.export()
+    assert export["revision"] != first["revision"]
+    assert export["count"] == len(packed) == len(keys) - 1 + 2000
+
+    exported = dict(zip(packed._keys, zip(np.frombuffer(export["lat"], "<f4"), np.frombuffer(export["lng"], "<f4"))))
+    assert "point-0" not in exported
+    assert exported["point-5"] == (10.0, 20.0)
+    assert exported[keys[-1]] == (np.float32(lat[-1]), np.float32(lng[-1]))
+    assert exported["new-1999"] == (-10.0, 1999.0)
+
+def test_study_spot_vectors_follow_writes(client):
+    bookmark_vectors.get()
+    response = client.get("/api/get_study_spot_vectors?format=binary")
+    assert response.status_code == 200
+    assert response.mimetype == "application/octet-stream"
+    count = int(response.headers["X-Point-Count"])
+    assert len(response.data) == 8 * count
+
+    # Unchanged points revalidate without a body; the ETag is the bookmarks version
+    etag = response.headers["ETag"]
+    assert etag == f'W/"bookmarks-{get_bookmarks_version()}-binary"'
+    assert client.get("/api/get_study_spot_vectors?format=binary", headers={"If-None-Match": etag}).status_code == 304
+
+    added = client.post("/api/add_bookmark", json={"name": "Vector Bookmark", "latitude": -81.5, "longitude": -101.25,
+                                                   "place_id": "test-vector-bookmark"})
+    assert added.status_code == 201
+    try:
+        # Applied in place: the snapshot follows the new version without a rebuild
+        response = client.get("/api/get_study_spot_vectors?format=columnar")
+        assert response.headers["ETag"] == f'W/"bookmarks-{get_bookmarks_version()}-columnar"'
+        assert response.json["count"] == count + 1
+        lat = np.frombuffer(base64.b64decode(response.json["lat"]), "<f4")
+        lng = np.frombuffer(base64.b64decode(response.json["lng"]), "<f4")
+        assert (-81.5, -101.25) in zip(lat, lng)
+
+        # The default keeps the original list of coordinate objects
+        vectors = client.get("/api/get_study_spot_vectors").json["vectors"]
+        assert {"lat": -81.5, "lng": -101.25} in vectors
+
+        client.post("/api/remove_bookmark", json={"bookmark_id": "test-vector-bookmark"})
+        response = client.get("/api/get_study_spot_vectors", headers={"Accept": "application/octet-stream"})
+        assert response.mimetype == "application/octet-stream"
+        assert int(response.headers["X-Point-Count"]) == count
+    finally:
+        mongo.db.bookmarks.delete_many({"place_id": "test-vector-bookmark"})
+
+def test_bookmark_snapshots_rebuild_on_other_writes(client, monkeypatch):
+    monkeypatch.setattr(bookmark_vectors, "version_check_interval", 0)
+    points = bookmark_vectors.get()
+    assert bookmark_vectors.get() is points
+    # Another worker's write: the version moves on without this process applying it
+    version = bump_bookmarks_version()
+    assert bookmark_vectors.get() is not points
+    assert bookmark_vectors.version == version
+
+def test_study_spot_vectors_validates_format(client):
+    assert client.get("/api/get_study_spot_vectors?format=csv").status_code == 400
@@ -17,6 +17,8 @@ def test_mongo_storage(client):
         "password": "TestPass123!"
     }
 
+    # users.email is unique, so clear out a user left by a previous run
+    mongo.db.users.delete_many({"email": test_user["email"]})
     mongo.db.users.insert_one(test_user)
 
     stored_user = mongo.db.users.find_one({"email": test_user["email"]})
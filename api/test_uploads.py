@@ -0,0 +1,130 @@
+import io
+import pytest
+from PIL import Image
+from studyfindr import app, fs, mongo, thumbnail_cache
+from bson.objectid import ObjectId
+import thumbnails
+from thumbnails import variant_query, make_thumbnail, THUMBNAIL_SIZES
+
+@pytest.fixture
+def client():
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        yield client
+
+@pytest.fixture
+def upload():
+    data = bytes(range(256)) * 1024  # 256KB, several GridFS chunks
+    file_id = fs.put(data, filename="test-upload.png", content_type="image/png")
+    yield str(file_id), data
+    fs.delete(file_id)
+
+def test_uploaded_file_streams_with_cache_headers(client, upload):
+    file_id, data = upload
+    response = client.get(f"/uploads/{file_id}")
+    assert response.status_code == 200
+    assert response.data == data
+    assert response.mimetype == "image/png"
+    assert response.headers["ETag"] == f'"{file_id}"'
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert "immutable" in response.headers["Cache-Control"]
+
+def test_uploaded_file_not_modified(client, upload):
+    file_id, _ = upload
+    response = client.get(f"/uploads/{file_id}", headers={"If-None-Match": f'"{file_id}"'})
+    assert response.status_code == 304
+    assert response.data == b""
+
+def test_uploaded_file_range(client, upload):
+    file_id, data = upload
+    response = client.get(f"/uploads/{file_id}", headers={"Range": "bytes=1000-200000"})
+    assert response.status_code == 206
+    assert response.data == data[1000:200001]
+    assert response.headers["Content-Range"] == f"bytes 1000-200000/{len(data)}"
+
+    response = client.get(f"/uploads/{file_id}", headers={"Range": f"bytes={len(data)}-"})
+    assert response.status_code == 416
+
+def test_uploaded_file_missing(client):
+    assert client.get("/uploads/000000000000000000000000").status_code == 404
+    assert client.get("/uploads/not-an-id").status_code == 404
+
+@pytest.fixture
+def image_upload():
+    output = io.BytesIO()
+    Image.new("RGB", (800, 600), (200, 100, 50)).save(output, format="JPEG")
+    data = output.getvalue()
+    file_id = fs.put(data, filename="test-avatar.jpg", content_type="image/jpeg")
+    yield file_id, data
+    for variant in fs.find({"metadata.variant_of": file_id}):
+        fs.delete(variant._id)
+    fs.delete(file_id)
+
+def test_uploaded_file_thumbnail(client, image_upload):
+    file_id, data = image_upload
+    thumbnail_cache.clear()
+
+    response = client.get(f"/uploads/{file_id}?size=64")
+    assert response.status_code == 200
+    assert response.mimetype == "image/jpeg"
+    assert response.headers["ETag"] == f'"{file_id}-64"'
+    assert len(response.data) < len(data)
+    assert Image.open(io.BytesIO(response.data)).size == (64, 64)
+
+    # Generated lazily once, then stored as a variant and kept in the LRU cache
+    assert fs.find_one(variant_query(file_id, 64)) is not None
+    assert thumbnail_cache.get((str(file_id), 64)) is not None
+
+    assert client.get(f"/uploads/{file_id}?size=65").status_code == 400
+
+def test_profile_upload_stores_thumbnails(client):
+    email = "thumbnailtest@example.com"
+    mongo.db.users.delete_many({"email": email})
+    mongo.db.users.insert_one({"username": "thumbnailtest", "email": email})
+
+    output = io.BytesIO()
+    Image.new("RGBA", (300, 300), (0, 0, 255, 128)).save(output, format="PNG")
+    output.seek(0)
+    response = client.post("/api/update_profile", data={
+        "email": email,
+        "profile_picture": (output, "avatar.png")
+    }, content_type="multipart/form-data")
+    assert response.status_code == 200
+
+    file_id = ObjectId(response.json["user"]["profile_picture"].replace("/uploads/", ""))
+    try:
+        variants = list(fs.find({"metadata.variant_of": file_id}))
+        assert sorted(variant.metadata["size"] for variant in variants) == sorted(THUMBNAIL_SIZES)
+    finally:
+        for variant in fs.find({"metadata.variant_of": file_id}):
+            fs.delete(variant._id)
+        fs.delete(file_id)
+        mongo.db.users.delete_many({"email": email})
+
+def test_oversized_image_keeps_original(client, monkeypatch):
+    # A few KB on disk, but 196M pixels once decoded
+    output = io.BytesIO()
+    Image.new("1", (14000, 14000)).save(output, format="PNG")
+    bomb = output.getvalue()
+    assert make_thumbnail(bomb, 64) == (None, None)
+    # Pillow's own limit is caught too
+    monkeypatch.setattr(thumbnails, "MAX_THUMBNAIL_SOURCE_PIXELS", float("inf"))
+    assert make_thumbnail(bomb, 64) == (None, None)
+
+    email = "bombtest@example.com"
+    mongo.db.users.delete_many({"email": email})
+    mongo.db.users.insert_one({"username": "bombtest", "email": email})
+    response = client.post("/api/update_profile", data={
+        "email": email,
+        "profile_picture": (io.BytesIO(bomb), "avatar.png")
+    }, content_type="multipart/form-data")
+    assert response.status_code == 200
+
+    file_id = ObjectId(response.json["user"]["profile_picture"].replace("/uploads/", ""))
+    try:
+        assert fs.find_one({"metadata.variant_of": file_id}) is None
+        # Thumbnail requests fall back to the original
+        assert client.get(f"/uploads/{file_id}?size=64").data == bomb
+    finally:
+        fs.delete(file_id)
+        mongo.db.users.delete_many({"email": email})
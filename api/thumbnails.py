@@ -0,0 +1,113 @@
+import io
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Square thumbnail edge lengths (pixels) that may be requested with ?size=
+THUMBNAIL_SIZES = (64, 128, 256)
+
+# Pillow formats kept as-is; anything else (e.g. GIF) is converted to PNG
+KEPT_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png"}
+
+# Larger images aren't decoded (a small file can expand to gigabytes); their original is served instead
+MAX_THUMBNAIL_SOURCE_PIXELS = 50_000_000
+
+
+def make_thumbnail(data, size):
+    """
+    Center-crops an image to a square and resizes it to size x size pixels.
+
+    Args:
+        data (bytes): Original image file contents
+        size (int): Edge length of the thumbnail in pixels
+
+    Returns:
+        tuple: (thumbnail bytes, content type), or (None, None) if data isn't a
+        readable image or is too large to decode safely
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        # Only the header has been read so far, so this check is cheap
+        if image.width * image.height > MAX_THUMBNAIL_SOURCE_PIXELS:
+            return None, None
+        # exif_transpose returns a copy without the source format, so read it first
+        image_format = image.format if image.format in KEPT_FORMATS else "PNG"
+        image = ImageOps.exif_transpose(image)
+
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        elif image_format == "PNG" and image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA")
+
+        thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        # Truncated or corrupt data can also fail while decoding, not just on open
+        return None, None
+
+    output = io.BytesIO()
+    thumbnail.save(output, format=image_format, optimize=True)
+    return output.getvalue(), KEPT_FORMATS[image_format]
+
+
+def variant_query(file_id, size):
+    """GridFS files query matching the stored thumbnail of file_id at size."""
+    return {"metadata.variant_of": file_id, "metadata.size": size}
+
+
+def store_thumbnails(fs, file_id, data, filename, sizes=THUMBNAIL_SIZES):
+    """
+    Generates and stores every thumbnail size of an upload as GridFS variants.
+
+    Args:
+        fs (GridFS): GridFS holding the original upload
+        file_id (ObjectId): Id of the original upload
+        data (bytes): Original image file contents
+        filename (str): Original file name, reused for the variants
+        sizes (iterable, optional): Thumbnail sizes to generate
+
+    Returns:
+        int: Number of variants stored
+    """
+    stored = 0
+    for size in sizes:
+        thumbnail, content_type = make_thumbnail(data, size)
+        if thumbnail is None:
+            break
+        fs.put(
+            thumbnail,
+            filename=filename,
+            content_type=content_type,
+            metadata={"variant_of": file_id, "size": size}
+        )
+        stored += 1
+    return stored
+
+
+def get_or_create_thumbnail(fs, file_id, size):
+    """
+    Returns the stored thumbnail of an upload, generating it on first request.
+
+    Args:
+        fs (GridFS): GridFS holding the original upload
+        file_id (ObjectId): Id of the original upload
+        size (int): Thumbnail size
+
+    Returns:
+        tuple: (thumbnail bytes, content type), or (None, None) if the original isn't an image
+
+    Raises:
+        gridfs.errors.NoFile: If the original upload doesn't exist
+    """
+    variant = fs.find_one(variant_query(file_id, size))
+    if variant is not None:
+        return variant.read(), variant.content_type
+
+    # Uploads from before thumbnailing get their variant lazily
+    original = fs.get(file_id)
+    thumbnail, content_type = make_thumbnail(original.read(), size)
+    if thumbnail is not None:
+        fs.put(
+            thumbnail,
+            filename=original.filename,
+            content_type=content_type,
+            metadata={"variant_of": file_id, "size": size}
+        )
+    return thumbnail, content_type
@@ -5,7 +5,7 @@ function ReviewsModal({ show, onClose, locationId, locationName }) {
   const [reviews, setReviews] = useState([]);
   const [loading, setLoading] = useState(false);
   const [hasMore, setHasMore] = useState(true);
-  const [page, setPage] = useState(0);
+  const [cursor, setCursor] = useState(null); // Position after the last loaded review
   const [error, setError] = useState(null);
   const [sortBy, setSortBy] = useState("created_at"); // Default sort by date
   const [sortOrder, setSortOrder] = useState("-1"); // Default newest first
@@ -57,7 +57,7 @@ function ReviewsModal({ show, onClose, locationId, locationName }) {
   useEffect(() => {
     if (show && locationId) {
       setReviews([]);
-      setPage(0);
+      setCursor(null);
       setHasMore(true);
       setEndMessage(false);
       loadMoreReviews(true); // true = reset
@@ -67,13 +67,13 @@ function ReviewsModal({ show, onClose, locationId, locationName }) {
   const loadMoreReviews = async (reset = false) => {
     if (loading) return;
     
-    const pageToLoad = reset ? 0 : page;
+    const cursorToLoad = reset ? null : cursor;
     
     setLoading(true);
     setError(null);
     
     try {
-      const url = `http://localhost:5000/api/get_location_reviews?location_id=${locationId}&page=${pageToLoad}&limit=${ITEMS_PER_PAGE}&sort_by=${sortBy}&sort_order=${sortOrder}`;
+      const url = `http://localhost:5000/api/get_location_reviews?location_id=${locationId}&limit=${ITEMS_PER_PAGE}&sort_by=${sortBy}&sort_order=${sortOrder}${cursorToLoad ? `&cursor=${cursorToLoad}` : ""}`;
       const res = await fetch(url);
       
       if (!res.ok) {
@@ -89,7 +89,7 @@ function ReviewsModal({ show, onClose, locationId, locationName }) {
           setReviews(prevReviews => [...prevReviews, ...data.reviews]);
         }
         
-        setPage(pageToLoad + 1);
+        setCursor(data.next_cursor);
         
         // Check if we've reached the end
         if (!data.has_more) {
@@ -51,7 +51,7 @@ const CommentsModal = ({
 }) => {
   const modalRef = useRef(null);
   const [reviews, setReviews] = useState([]);
-  const [page, setPage] = useState(0);
+  const [cursor, setCursor] = useState(null); // Position after the last loaded review
   const [loading, setLoading] = useState(false);
   const [hasMore, setHasMore] = useState(true);
   const [error, setError] = useState(null);
@@ -96,7 +96,7 @@ const CommentsModal = ({
   useEffect(() => {
     if (isOpen && locationId) {
       setReviews([]);
-      setPage(0);
+      setCursor(null);
       setHasMore(true);
       setEndMessage(false);
       loadMoreReviews(true); // true = reset
@@ -106,13 +106,13 @@ const CommentsModal = ({
   const loadMoreReviews = async (reset = false) => {
     if (loading) return;
 
-    const pageToLoad = reset ? 0 : page;
+    const cursorToLoad = reset ? null : cursor;
 
     setLoading(true);
     setError(null);
 
     try {
-      const url = `http://localhost:5000/api/get_location_reviews?location_id=${locationId}&page=${pageToLoad}&limit=${ITEMS_PER_PAGE}&sort_by=${sortBy}&sort_order=${sortOrder}`;
+      const url = `http://localhost:5000/api/get_location_reviews?location_id=${locationId}&limit=${ITEMS_PER_PAGE}&sort_by=${sortBy}&sort_order=${sortOrder}${cursorToLoad ? `&cursor=${cursorToLoad}` : ""}`;
       const res = await fetch(url);
 
       if (!res.ok) {
@@ -128,7 +128,7 @@ const CommentsModal = ({
           setReviews((prevReviews) => [...prevReviews, ...data.reviews]);
         }
 
-        setPage(pageToLoad + 1);
+        setCursor(data.next_cursor);
 
         // Check if we've reached the end
         if (!data.has_more) {